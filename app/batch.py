@@ -0,0 +1,166 @@
+# Batch plan generation for whole cohorts (nightly precompute).
+#
+#   python -m app.batch                      # every user, plans written to the `plans` collection
+#   python -m app.batch --output plans.ndjson --no-write
+#   python -m app.batch --user-id <id> --user-id <id> --workers 4
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo.collection import Collection
+
+from app.cache import plan_fingerprint
+from app.db import close_client, get_db
+from app.plan_store import save_plans_bulk
+from app.planner import DEFAULT_STRATEGY, build_plan
+from app.repository import load_plan_inputs_bulk
+
+DEFAULT_CHUNK_SIZE = 500
+# Plans per pickled task; amortizes IPC overhead across small plans
+PLAN_JOBS_PER_TASK = 16
+
+
+def _plan_job(job):
+    # Runs in a worker process; must stay a top-level function so it can be pickled
+    user_obj_id, learning_times, subjects, today = job
+    try:
+        return build_plan(user_obj_id, learning_times, subjects, today)
+    except Exception as e:
+        # One user's bad data (e.g. a malformed dailyRoutine) must not end the whole run
+        return {"error": str(e)}
+
+
+def make_executor(workers: int = None) -> ProcessPoolExecutor:
+    # spawn keeps the children clear of the parent's MongoDB monitor threads
+    return ProcessPoolExecutor(
+        max_workers=workers or os.cpu_count(),
+        mp_context=multiprocessing.get_context("spawn"),
+    )
+
+
+def parse_user_ids(user_ids):
+    """Splits raw ids into (valid ObjectIds, invalid strings)."""
+    valid, invalid = [], []
+    for user_id in user_ids:
+        try:
+            valid.append(ObjectId(user_id))
+        except (InvalidId, TypeError):
+            invalid.append(user_id)
+    return valid, invalid
+
+
+def generate_plans(
+    users_collection: Collection,
+    subjects_collection: Collection,
+    user_obj_ids,
+    executor: ProcessPoolExecutor = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    today=None,
+):
+    """Yields (user_id, fingerprint, plan) for every existing user, in input order.
+
+    Inputs are bulk-loaded chunk by chunk, and each chunk is planned across the
+    executor's processes. Without an executor the plans are built inline. A user
+    who cannot be planned gets {"error": message} as their plan.
+    """
+    today = today or datetime.today().date()
+    inputs = load_plan_inputs_bulk(users_collection, subjects_collection, user_obj_ids, today, chunk_size)
+
+    while True:
+        jobs = []
+        for user_obj_id, (learning_times, subjects) in inputs:
+            jobs.append((user_obj_id, learning_times, subjects, today))
+            if len(jobs) == chunk_size:
+                break
+        if not jobs:
+            return
+
+        if executor is None:
+            plans = map(_plan_job, jobs)
+        else:
+            plans = executor.map(_plan_job, jobs, chunksize=PLAN_JOBS_PER_TASK)
+
+        for (user_obj_id, learning_times, subjects, _), plan in zip(jobs, plans):
+            yield str(user_obj_id), plan_fingerprint(learning_times, subjects), plan
+
+
+def write_plans(plans_collection: Collection, results, today=None, batch_size: int = DEFAULT_CHUNK_SIZE):
+    """Upserts one document per user into plans_collection with bulk writes. Yields results through.
+
+    Stored plans are what /generate-user-plan serves while the user's inputs stay unchanged.
+    Error results are passed through without being stored.
+    """
+    today = today or datetime.today().date()
+    yield from save_plans_bulk(plans_collection, results, today, DEFAULT_STRATEGY, batch_size)
+
+
+def peak_memory_mb() -> float:
+    # ru_maxrss is reported in KiB on Linux
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return round(max(own, children) / 1024, 1)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate study plans for many users at once.")
+    parser.add_argument("--user-id", action="append", dest="user_ids", help="Only plan for this user (repeatable). Defaults to every user.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Planner processes (0 plans inline).")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Users loaded per $in query.")
+    parser.add_argument("--output", help="Write plans as NDJSON to this path ('-' for stdout).")
+    parser.add_argument("--no-write", action="store_true", help="Do not upsert plans into the plans collection.")
+    args = parser.parse_args(argv)
+
+    db = get_db()
+    if args.user_ids:
+        user_obj_ids, invalid = parse_user_ids(args.user_ids)
+        for user_id in invalid:
+            print(f"Skipping invalid userId {user_id!r}", file=sys.stderr)
+    else:
+        user_obj_ids = [user["_id"] for user in db["users"].find({}, {"_id": 1})]
+
+    executor = make_executor(args.workers) if args.workers > 0 else None
+    out = None
+    if args.output == "-":
+        out = sys.stdout
+    elif args.output:
+        out = open(args.output, "w", encoding="utf-8")
+
+    started = time.perf_counter()
+    count = errors = 0
+    try:
+        results = generate_plans(db["users"], db["subjects"], user_obj_ids, executor, args.chunk_size)
+        if not args.no_write:
+            results = write_plans(db["plans"], results, batch_size=args.chunk_size)
+        for user_id, _, plan in results:
+            count += 1
+            if "error" in plan:
+                errors += 1
+                print(f"Could not plan userId {user_id}: {plan['error']}", file=sys.stderr)
+            if out is not None:
+                out.write(json.dumps({"user_id": user_id, "plan": plan}) + "\n")
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        if out is not None and out is not sys.stdout:
+            out.close()
+        close_client()
+
+    elapsed = time.perf_counter() - started
+    rate = count / elapsed if elapsed > 0 else 0.0
+    print(
+        f"Generated {count - errors} plans ({errors} failed) in {elapsed:.2f}s ({rate:.1f} plans/sec), "
+        f"peak memory {peak_memory_mb()} MB",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+# Plan result cache.
+# Keys combine the userId, today's date and a hash of the planner inputs, so a
+# changed dailyRoutine or subject always produces a new key. Invalidation hooks
+# exist to drop a user's old entries early instead of waiting for them to age out.
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+CHANGE_STREAM_HISTORY_LOST = 286
+MAX_RETRY_SECONDS = 30.0
+
+
+def plan_fingerprint(learning_times: list, subjects: list) -> str:
+    """Stable hash of the slot and subject inputs the planner reads."""
+    payload = json.dumps([learning_times, subjects], sort_keys=True, default=str, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def plan_cache_key(user_id: str, today: date, fingerprint: str, strategy: str = "edf") -> str:
+    return f"plan:{user_id}:{strategy}:{today.isoformat()}:{fingerprint}"
+
+
+def latest_plan_key(user_id: str, strategy: str = "edf") -> str:
+    return f"latest:{user_id}:{strategy}"
+
+
+class CacheBackend:
+    """Storage interface for the plan cache. Implement it to share plans across processes."""
+
+    def get(self, key: str):
+        raise NotImplementedError
+
+    def set(self, key: str, user_id: str, value, ttl: float):
+        raise NotImplementedError
+
+    def delete_user(self, user_id: str) -> int:
+        """Drops every entry stored for user_id and returns how many were removed."""
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def __len__(self):
+        raise NotImplementedError
+
+
+class LRUTTLBackend(CacheBackend):
+    """In-process LRU cache with a per-entry time to live."""
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (expires_at, user_id, value)
+        self._keys_by_user = {}
+        self._lock = threading.Lock()
+
+    def _forget(self, key):
+        _, user_id, _ = self._entries.pop(key)
+        keys = self._keys_by_user.get(user_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_user[user_id]
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                self._forget(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[2]
+
+    def set(self, key, user_id, value, ttl):
+        with self._lock:
+            if key in self._entries:
+                self._forget(key)
+            self._entries[key] = (time.monotonic() + ttl, user_id, value)
+            self._keys_by_user.setdefault(user_id, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._forget(next(iter(self._entries)))
+
+    def delete_user(self, user_id):
+        with self._lock:
+            keys = list(self._keys_by_user.get(user_id, ()))
+            for key in keys:
+                self._forget(key)
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_user.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class PlanCache:
+    def __init__(self, backend: CacheBackend = None, ttl: float = 3600, stale_ttl: float = 86400):
+        self.backend = backend if backend is not None else LRUTTLBackend()
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._lock = threading.Lock()
+
+    def lookup(self, user_id: str, today: date, fingerprint: str, strategy: str = "edf"):
+        """The cached plan or None, counted as a hit or miss."""
+        plan = self.backend.get(plan_cache_key(user_id, today, fingerprint, strategy))
+        with self._lock:
+            if plan is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return plan
+
+    def store(self, user_id: str, today: date, fingerprint: str, plan, strategy: str = "edf"):
+        self.backend.set(plan_cache_key(user_id, today, fingerprint, strategy), user_id, plan, self.ttl)
+        if self.stale_ttl > 0:
+            # The user's newest plan whatever the inputs, for serving under overload
+            self.backend.set(latest_plan_key(user_id, strategy), user_id, plan, self.stale_ttl)
+
+    def stale(self, user_id: str, strategy: str = "edf"):
+        """The last plan stored for the user, possibly for older inputs or an earlier day, or None.
+
+        Not counted as a hit or miss. Dropped by invalidate_user like the rest.
+        """
+        return self.backend.get(latest_plan_key(user_id, strategy))
+
+    def get_or_compute(
+        self, user_id: str, today: date, learning_times: list, subjects: list, compute,
+        strategy: str = "edf", fingerprint: str = None,
+    ):
+        """Returns the cached plan for these inputs, calling compute() on a miss.
+
+        Pass fingerprint when the caller already hashed the inputs.
+        """
+        if fingerprint is None:
+            fingerprint = plan_fingerprint(learning_times, subjects)
+        plan = self.lookup(user_id, today, fingerprint, strategy)
+        if plan is None:
+            plan = compute()
+            self.store(user_id, today, fingerprint, plan, strategy)
+        return plan
+
+    def invalidate_user(self, user_id: str) -> int:
+        """Hook for callers that just updated a user or one of their subjects."""
+        removed = self.backend.delete_user(str(user_id))
+        with self._lock:
+            self.invalidations += removed
+        return removed
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "invalidations": self.invalidations,
+                "entries": len(self.backend),
+            }
+
+
+def user_id_for_change(change: dict):
+    """Maps a users/subjects change stream event to the affected userId, if known."""
+    coll = change.get("ns", {}).get("coll")
+    if coll == "users":
+        return str(change["documentKey"]["_id"])
+    if coll == "subjects":
+        for field in ("fullDocument", "fullDocumentBeforeChange"):
+            doc = change.get(field) or {}
+            if doc.get("userId") is not None:
+                return str(doc["userId"])
+    return None
+
+
+CHANGE_STREAM_PIPELINE = [
+    {"$match": {"ns.coll": {"$in": ["users", "subjects"]}}},
+]
+
+
+def mongo_change_source(db):
+    """Change events on users and subjects, resumed after a token when one is given."""
+    async def events(resume_after=None):
+        async with db.watch(
+            CHANGE_STREAM_PIPELINE,
+            full_document="updateLookup",
+            full_document_before_change="whenAvailable",
+            resume_after=resume_after,
+        ) as stream:
+            async for change in stream:
+                yield change
+    return events
+
+
+async def consume_changes(db, cache: PlanCache, source=None):
+    """Invalidates cached plans from the change stream until cancelled, reconnecting with backoff."""
+    source = source or mongo_change_source(db)
+    resume_after, delay = None, 0.5
+    while True:
+        try:
+            async for change in source(resume_after):
+                user_id = user_id_for_change(change)
+                if user_id is not None:
+                    cache.invalidate_user(user_id)
+                resume_after, delay = change["_id"], 0.5
+        except PyMongoError as e:
+            if isinstance(e, OperationFailure) and e.code == CHANGE_STREAM_HISTORY_LOST and resume_after is not None:
+                # Invalidations in the gap are gone, so no cached plan can be trusted
+                logger.error("Resume token is too old, clearing the plan cache and continuing from now")
+                cache.clear()
+                resume_after = None
+                continue
+            logger.warning("Plan cache change stream failed, retrying in %.1fs: %s", delay, e)
+        except Exception:
+            logger.exception("Plan cache change stream failed, retrying in %.1fs", delay)
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, MAX_RETRY_SECONDS)
+
+
+plan_cache = PlanCache(
+    LRUTTLBackend(max_entries=int(os.getenv("PLAN_CACHE_MAX_ENTRIES", "10000"))),
+    ttl=float(os.getenv("PLAN_CACHE_TTL_SECONDS", "3600")),
+    stale_ttl=float(os.getenv("PLAN_CACHE_STALE_SECONDS", "86400")),
+)
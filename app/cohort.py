@@ -0,0 +1,347 @@
+# Cohort scheduling with shared study rooms.
+# Plans for many students are built in one pass so that no room ever holds more
+# students than it has seats. A student studying in a learning slot on a date
+# takes one seat in one room for the whole slot. Room occupancy per (room, date)
+# is a segment tree over the cohort's distinct slot boundaries (range add, range
+# max), so checking a slot against a room costs O(log boundaries) however many
+# students overlap it.
+#
+# Topics are placed day by day, earliest exam first across the whole cohort (the
+# edf rule), so the students closest to an exam get the seats first.
+from datetime import datetime
+from heapq import heapify, heappop, heappush
+
+from app.engine import Placement, Subject, check_deadlines
+from app.metrics import record_plan
+from app.planner import normalize, render
+from app.repository import load_plan_inputs_bulk
+from app.slots import MINUTES_PER_DAY, format_clock
+
+COHORT_STRATEGY = "cohort"
+
+
+class IntervalMaxTree:
+    """Counts over positions 0..size-1 with range add and range max, both O(log size).
+
+    Bottom-up segment tree: _add[i] holds an increment pending for the whole
+    subtree of internal node i, and _max[i] already includes it.
+    """
+
+    __slots__ = ("_size", "_height", "_max", "_add")
+
+    def __init__(self, size: int):
+        self._size = max(1, size)
+        self._height = self._size.bit_length()
+        self._max = [0] * (2 * self._size)
+        self._add = [0] * self._size
+
+    def _apply(self, i: int, value: int):
+        self._max[i] += value
+        if i < self._size:
+            self._add[i] += value
+
+    def _pull(self, i: int):
+        while i > 1:
+            i >>= 1
+            self._max[i] = max(self._max[2 * i], self._max[2 * i + 1]) + self._add[i]
+
+    def _push(self, i: int):
+        for shift in range(self._height, 0, -1):
+            node = i >> shift
+            if node and self._add[node]:
+                self._apply(2 * node, self._add[node])
+                self._apply(2 * node + 1, self._add[node])
+                self._add[node] = 0
+
+    def add(self, lo: int, hi: int, value: int):
+        """Adds value at every position in [lo, hi)."""
+        lo += self._size
+        hi += self._size
+        first, last = lo, hi - 1
+        while lo < hi:
+            if lo & 1:
+                self._apply(lo, value)
+                lo += 1
+            if hi & 1:
+                hi -= 1
+                self._apply(hi, value)
+            lo >>= 1
+            hi >>= 1
+        self._pull(first)
+        self._pull(last)
+
+    def max(self, lo: int, hi: int) -> int:
+        """Largest value in [lo, hi)."""
+        lo += self._size
+        hi += self._size
+        self._push(lo)
+        self._push(hi - 1)
+        result = 0
+        while lo < hi:
+            if lo & 1:
+                result = max(result, self._max[lo])
+                lo += 1
+            if hi & 1:
+                hi -= 1
+                result = max(result, self._max[hi])
+            lo >>= 1
+            hi >>= 1
+        return result
+
+
+def parse_rooms(rooms: list) -> list:
+    """Validates [{"name", "capacity"}, ...] and returns [(name, capacity)]."""
+    if not rooms:
+        raise ValueError("At least one room is required.")
+    parsed, names = [], set()
+    for room in rooms:
+        name, capacity = room.get("name"), room.get("capacity")
+        if not isinstance(name, str) or not name:
+            raise ValueError("Every room needs a name.")
+        if name in names:
+            raise ValueError(f"Duplicate room name {name!r}.")
+        if not isinstance(capacity, int) or isinstance(capacity, bool) or capacity < 1:
+            raise ValueError(f"Room {name!r} needs a positive integer capacity.")
+        names.add(name)
+        parsed.append((name, capacity))
+    return parsed
+
+
+class RoomOccupancy:
+    """Seats taken in each room over the minutes of each day.
+
+    Minutes are compressed to the slot boundaries seen in the cohort, and a tree
+    is only created for a (room, day) once somebody sits there.
+    """
+
+    def __init__(self, rooms: list, boundaries):
+        self.rooms = rooms  # [(name, capacity)]
+        self.coords = sorted(set(boundaries) | {0, MINUTES_PER_DAY})
+        self._position = {minute: i for i, minute in enumerate(self.coords)}
+        self._trees = {}  # (room, day) -> IntervalMaxTree
+        # Seats are only ever taken, so a room found full for an interval stays full
+        self._full = set()  # (room, day, start, end)
+        self.seats = [0] * len(rooms)
+
+    def _pieces(self, day: int, start: int, end: int):
+        # Slots such as 22:00 - 01:00 continue into the next day
+        position = self._position
+        if end > start:
+            return ((day, position[start], position[end]),)
+        pieces = [(day, position[start], position[MINUTES_PER_DAY])]
+        if end:
+            pieces.append((day + 1, 0, position[end]))
+        return pieces
+
+    def _tree(self, room: int, day: int) -> IntervalMaxTree:
+        tree = self._trees.get((room, day))
+        if tree is None:
+            tree = self._trees[(room, day)] = IntervalMaxTree(len(self.coords) - 1)
+        return tree
+
+    def peak(self, room: int, day: int, start: int, end: int) -> int:
+        """Most students in the room at any minute of the interval."""
+        peak = 0
+        for piece_day, lo, hi in self._pieces(day, start, end):
+            tree = self._trees.get((room, piece_day))
+            if tree is not None:
+                peak = max(peak, tree.max(lo, hi))
+        return peak
+
+    def reserve(self, day: int, start: int, end: int):
+        """Takes a seat in the first room with one free for the whole interval; its index, or None."""
+        for room, (_, capacity) in enumerate(self.rooms):
+            if (room, day, start, end) in self._full:
+                continue
+            if self.peak(room, day, start, end) < capacity:
+                for piece_day, lo, hi in self._pieces(day, start, end):
+                    self._tree(room, piece_day).add(lo, hi, 1)
+                self.seats[room] += 1
+                return room
+            self._full.add((room, day, start, end))
+        return None
+
+
+class _Student:
+    __slots__ = ("user_id", "inputs", "calendar", "warnings", "placements", "pending", "smallest", "seats", "blocked")
+
+    def __init__(self, user_id: str, inputs, calendar, warnings: list):
+        self.user_id = user_id
+        self.inputs = inputs
+        self.calendar = calendar
+        self.warnings = warnings
+        self.placements = []
+        self.pending = []
+        self.smallest = 0
+        self.seats = {}  # day -> {slot: room}
+        self.blocked = 0
+
+    def unscheduled(self, subject: Subject, topic: str, minutes: int):
+        self.placements.append(Placement(None, None, subject.name, topic, minutes, subject_id=subject.id))
+
+    def head(self, index: int) -> tuple:
+        # Earliest exam first; equal exams alternate between students topic by topic
+        deadline, rank = self.pending[0][:2]
+        return deadline, rank, index
+
+
+# The cohort only ever looks at the day it is filling, so it reads that day's
+# slots directly: the calendar's max-tree is never built, and booking (or
+# blocking a slot whose rooms are full) costs no tree refresh.
+def _largest_free(calendar, day: int) -> int:
+    offset = day * calendar.slots
+    return max(calendar.remaining[offset:offset + calendar.slots], default=0)
+
+
+def _queue_topics(student: _Student):
+    calendar, subjects = student.calendar, student.inputs.subjects
+    largest = max(calendar.slot_minutes, default=0) if calendar.horizon else 0
+    for order, subject in enumerate(subjects):
+        minutes = subject.topic_minutes
+        for rank, topic in enumerate(subject.topics):
+            if minutes > largest:
+                student.unscheduled(subject, topic, minutes)
+            else:
+                student.pending.append((subject.days_left, rank, order, topic, minutes))
+    heapify(student.pending)
+    student.smallest = min((item[4] for item in student.pending), default=0)
+
+
+def _fit(student: _Student, occupancy: RoomOccupancy, day: int, minutes: int):
+    """A slot of the day with room for the topic and a seat for the student, or None."""
+    calendar, slots = student.calendar, student.inputs.learning_slots
+    # Slots where the student already has a seat today cost no extra seat
+    seats = student.seats.get(day)
+    if seats:
+        for slot in seats:
+            if calendar.free(day, slot) >= minutes:
+                return slot
+    # One pass over the day's slots: a slot whose rooms are all full stays full
+    # (seats are only ever taken), so it is blocked for the rest of the day
+    offset = day * calendar.slots
+    for slot in range(calendar.slots):
+        free = calendar.remaining[offset + slot]
+        if free < minutes:
+            continue
+        room = occupancy.reserve(day, slots[slot].start, slots[slot].end)
+        if room is not None:
+            student.seats.setdefault(day, {})[slot] = room
+            return slot
+        student.blocked += 1
+        calendar.book(day, slot, free)
+    return None
+
+
+def _allocate(students: list, occupancy: RoomOccupancy):
+    waiting = list(enumerate(students))
+    for day in range(max((student.calendar.horizon for student in students), default=0)):
+        # Students drop out once every topic is placed or past its exam
+        waiting = [(index, student) for index, student in waiting if student.pending and day < student.calendar.horizon]
+        if not waiting:
+            break
+        active = [
+            student.head(index)
+            for index, student in waiting
+            if _largest_free(student.calendar, day) >= student.smallest
+        ]
+        heapify(active)
+        deferred = []
+        while active:
+            index = heappop(active)[2]
+            student = students[index]
+            item = heappop(student.pending)
+            deadline, _, order, topic, minutes = item
+            subject = student.inputs.subjects[order]
+            if deadline <= day:
+                student.unscheduled(subject, topic, minutes)
+            else:
+                slot = _fit(student, occupancy, day, minutes)
+                if slot is None:
+                    deferred.append((student, item))  # too big for what is left today
+                else:
+                    student.calendar.book(day, slot, minutes)
+                    student.placements.append(Placement(day, slot, subject.name, topic, minutes, subject_id=subject.id))
+            if student.pending and _largest_free(student.calendar, day) >= student.smallest:
+                heappush(active, student.head(index))
+        for student, item in deferred:
+            heappush(student.pending, item)
+
+    for student in students:
+        for _, _, order, topic, minutes in sorted(student.pending):
+            student.unscheduled(student.inputs.subjects[order], topic, minutes)
+        student.pending = []
+
+
+def _render(student: _Student, occupancy: RoomOccupancy) -> dict:
+    calendar, slots = student.calendar, student.inputs.learning_slots
+    plan = render(student.user_id, student.inputs, calendar, student.placements, student.warnings)
+    starts = [format_clock(slot.start) for slot in slots]
+    rooms = {
+        (calendar.date(day).isoformat(), starts[slot]): occupancy.rooms[room][0]
+        for day, seats in student.seats.items()
+        for slot, room in seats.items()
+    }
+    for entry in plan["entries"]:
+        if not entry["unscheduled"]:
+            entry["room"] = rooms[(entry["date"], entry["start"])]
+    if student.blocked:
+        plan["warnings"].append({"type": "rooms_full", "slots": student.blocked})
+    return plan
+
+
+def schedule_cohort(students, rooms: list, today=None) -> dict:
+    """Plans every student against shared rooms in one pass.
+
+    students yields (user_id, learning_times, subjects) as loaded for build_plan;
+    rooms is [{"name", "capacity"}, ...]. Returns {"plans": {user_id: plan},
+    "rooms": [{"name", "capacity", "seats_booked"}]}. Scheduled plan entries
+    carry the room they were given. A student whose slots or subjects are
+    malformed gets {"error": ...} instead of a plan and takes no seats.
+    """
+    rooms = parse_rooms(rooms)
+    today = today or datetime.today().date()
+
+    plans, members = {}, []
+    for user_id, learning_times, subjects in students:
+        user_id = str(user_id)
+        if user_id in plans:
+            continue
+        if not learning_times:
+            plans[user_id] = {"message": "No learning slots found for the user."}
+            continue
+        try:
+            inputs = normalize(learning_times, subjects, today)
+        except ValueError as e:
+            plans[user_id] = {"error": str(e)}
+            continue
+        calendar = inputs.calendar()
+        student = _Student(user_id, inputs, calendar, check_deadlines(calendar, inputs.subjects))
+        _queue_topics(student)
+        members.append(student)
+        plans[user_id] = None  # keeps input order
+
+    occupancy = RoomOccupancy(
+        rooms, (minute for student in members for slot in student.inputs.learning_slots for minute in (slot.start, slot.end))
+    )
+    _allocate(members, occupancy)
+
+    for student in members:
+        plan = plans[student.user_id] = _render(student, occupancy)
+        record_plan(plan, COHORT_STRATEGY)
+    return {
+        "plans": plans,
+        "rooms": [
+            {"name": name, "capacity": capacity, "seats_booked": seats}
+            for (name, capacity), seats in zip(rooms, occupancy.seats)
+        ],
+    }
+
+
+def plan_cohort(users_collection, subjects_collection, user_obj_ids, rooms: list, today=None) -> dict:
+    """schedule_cohort for users loaded from MongoDB; users that do not exist are left out."""
+    parse_rooms(rooms)  # fail before loading anything
+    today = today or datetime.today().date()
+    inputs = load_plan_inputs_bulk(users_collection, subjects_collection, user_obj_ids, today)
+    return schedule_cohort(
+        ((user_obj_id, learning_times, subjects) for user_obj_id, (learning_times, subjects) in inputs), rooms, today
+    )
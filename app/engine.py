@@ -0,0 +1,427 @@
+# Scheduling engine: places topics onto dated learning slots.
+# Day 0 is tomorrow; a subject can use every day before its exam.
+import sys
+from array import array
+from datetime import datetime, timedelta
+from enum import IntEnum
+from heapq import heapify, heappop
+from itertools import accumulate
+
+from app.slots import format_clock
+
+# Subjects with this many study days left are urgent
+URGENT_DAYS_LEFT = 1
+
+
+class Difficulty(IntEnum):
+    """Exam difficulty. The value is the study hours the whole subject needs."""
+
+    EASY = 1
+    MEDIUM = 2
+    HARD = 3
+
+    @classmethod
+    def parse(cls, value) -> "Difficulty":
+        """Case-insensitive; a missing or unknown difficulty counts as MEDIUM."""
+        return cls.__members__.get(str(value or "MEDIUM").upper(), cls.MEDIUM)
+
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+class Subject:
+    """A normalized subject, the only form of it the allocators read.
+
+    Every topic needs topic_minutes, and days_left counts the study days
+    before the exam. Names are interned, so users who share subjects and topics
+    share the strings too.
+    """
+
+    __slots__ = ("id", "name", "topics", "difficulty", "days_left", "topic_minutes")
+
+    def __init__(self, id: str, name: str, topics, difficulty: Difficulty, days_left: int, topic_minutes: int):
+        self.id = id
+        self.name = _intern(name)
+        try:
+            self.topics = tuple(map(sys.intern, topics))
+        except TypeError:  # a topic name that is not a string
+            self.topics = tuple(_intern(topic) for topic in topics)
+        self.difficulty = difficulty
+        self.days_left = days_left
+        self.topic_minutes = topic_minutes
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "name": self.name,
+            "topics": list(self.topics),
+            "difficulty": self.difficulty.name,
+            "days_left": self.days_left,
+            "topic_minutes": self.topic_minutes,
+        }
+
+    @classmethod
+    def from_dict(cls, doc: dict) -> "Subject":
+        return cls(
+            doc["id"], doc["name"], doc["topics"], Difficulty.parse(doc.get("difficulty")),
+            doc["days_left"], doc["topic_minutes"],
+        )
+
+    def __repr__(self):
+        return f"Subject({self.name!r}, {len(self.topics)} topics, days_left={self.days_left})"
+
+
+class Placement:
+    """One topic booked into a slot. day and slot are None when it could not be placed.
+
+    partial marks a topic that got less time than it needed.
+    """
+
+    __slots__ = ("day", "slot", "subject", "topic", "minutes", "partial", "subject_id")
+
+    def __init__(self, day, slot, subject: str, topic: str, minutes: int, partial: bool = False, subject_id: str = None):
+        self.day = day
+        self.slot = slot
+        self.subject = subject
+        self.topic = topic
+        self.minutes = minutes
+        self.partial = partial
+        self.subject_id = subject_id
+
+    @property
+    def scheduled(self) -> bool:
+        return self.day is not None
+
+
+class CapacityCalendar:
+    """Remaining minutes for every (date, slot) from tomorrow up to the latest exam.
+
+    Capacity is a flat dates x slots integer array. A max-tree over dates holds
+    each date's largest free slot, so the earliest date that can take a topic
+    is found in O(log dates) instead of scanning every date. The tree is built
+    on first use, so a calendar that is only read or moved never pays for it.
+    """
+
+    def __init__(self, slot_minutes: list, horizon: int, start=None):
+        self.start = start if start is not None else datetime.today().date() + timedelta(days=1)
+        self.slot_minutes = list(slot_minutes)
+        self.slots = len(slot_minutes)
+        self.horizon = horizon
+        self.remaining = array("l", slot_minutes) * horizon
+        self._rebuild()
+
+    @classmethod
+    def from_remaining(cls, slot_minutes: list, remaining: list, start):
+        """Restores a partly booked calendar, e.g. from a stored plan state."""
+        calendar = cls(slot_minutes, 0, start)
+        calendar.remaining = array("l", remaining)
+        calendar.horizon = len(remaining) // max(1, calendar.slots)
+        calendar._rebuild()
+        return calendar
+
+    def _rebuild(self):
+        self._tree = None
+
+    def _build_tree(self) -> list:
+        size = 1
+        while size < self.horizon:
+            size *= 2
+        self._size = size
+        horizon = self.horizon
+        if self.slots > 1:
+            leaves = list(map(max, *self._slot_columns()))
+        elif self.slots:
+            leaves = list(self.remaining)
+        else:
+            leaves = [0] * horizon
+        # Built a level at a time from the leaves up; node i's children end up at 2i and 2i + 1
+        level = leaves + [0] * (size - horizon)
+        levels = [level]
+        while len(level) > 1:
+            level = list(map(max, level[::2], level[1::2]))
+            levels.append(level)
+        tree = [0]
+        for level in reversed(levels):
+            tree.extend(level)
+        self._tree = tree
+        return tree
+
+    def extend(self, horizon: int):
+        """Adds empty days so the calendar reaches at least `horizon` days."""
+        if horizon <= self.horizon:
+            return
+        self.remaining.extend(array("l", self.slot_minutes) * (horizon - self.horizon))
+        self.horizon = horizon
+        self._rebuild()
+
+    def advance(self, days: int):
+        """Drops the first `days` days, so day indices count from `days` later."""
+        if days <= 0:
+            return
+        del self.remaining[:days * self.slots]
+        self.start += timedelta(days=days)
+        self.horizon = max(0, self.horizon - days)
+        self._rebuild()
+
+    def date(self, day: int):
+        return self.start + timedelta(days=day)
+
+    def free(self, day: int, slot: int) -> int:
+        return self.remaining[day * self.slots + slot]
+
+    def largest_free(self, day: int) -> int:
+        tree = self._tree if self._tree is not None else self._build_tree()
+        return tree[self._size + day]
+
+    def day_total(self, day: int) -> int:
+        offset = day * self.slots
+        return sum(self.remaining[offset:offset + self.slots])
+
+    def _slot_columns(self) -> list:
+        # One strided copy per slot, holding that slot's minutes for every day
+        return [self.remaining[slot::self.slots] for slot in range(self.slots)]
+
+    def day_totals(self) -> list:
+        if not self.slots:
+            return [0] * self.horizon
+        return list(map(sum, zip(*self._slot_columns())))
+
+    def capacity_before(self, deadlines: list) -> list:
+        """Free minutes on the days before each deadline (a day index), from one prefix sum."""
+        prefix = list(accumulate(self.day_totals(), initial=0))
+        return [prefix[max(0, min(deadline, self.horizon))] for deadline in deadlines]
+
+    def _refresh(self, day: int):
+        tree = self._tree
+        if tree is None:
+            return
+        offset = day * self.slots
+        i = self._size + day
+        tree[i] = max(self.remaining[offset:offset + self.slots])
+        i //= 2
+        while i:
+            tree[i] = max(tree[2 * i], tree[2 * i + 1])
+            i //= 2
+
+    def find_day(self, minutes: int, before: int):
+        """Earliest day < before with a slot that still has `minutes` free, or None."""
+        tree = self._tree if self._tree is not None else self._build_tree()
+        if before <= 0 or tree[1] < minutes:
+            return None
+        i = 1
+        while i < self._size:
+            i = 2 * i if tree[2 * i] >= minutes else 2 * i + 1
+        day = i - self._size
+        return day if day < min(before, self.horizon) else None
+
+    def first_fit(self, day: int, minutes: int):
+        """Index of the first slot of the day with `minutes` free, or None."""
+        if self.largest_free(day) < minutes:
+            return None
+        offset = day * self.slots
+        for slot in range(self.slots):
+            if self.remaining[offset + slot] >= minutes:
+                return slot
+        return None
+
+    def book(self, day: int, slot: int, minutes: int):
+        self.remaining[day * self.slots + slot] -= minutes
+        self._refresh(day)
+
+    def release(self, day: int, slot: int, minutes: int):
+        self.book(day, slot, -minutes)
+
+    def take(self, day: int, minutes: int) -> int:
+        """Books minutes in the first slot of the day with room and returns its index."""
+        slot = self.first_fit(day, minutes)
+        if slot is None:
+            raise ValueError(f"Day {day} has no slot with {minutes} free minutes.")
+        self.book(day, slot, minutes)
+        return slot
+
+
+def normalize_subjects(user_subjects: list, today):
+    """Splits raw subject documents into (urgent, normal) Subject records.
+
+    Urgent subjects have URGENT_DAYS_LEFT study days left before the exam.
+    """
+    urgent, normal = [], []
+    for subject in sorted(user_subjects, key=lambda x: (x.get("examDate") or datetime.max)):
+        exam_date = subject.get("examDate")
+        topics = subject.get("topics") or []
+        if not topics or not exam_date:
+            continue
+
+        exam_date = exam_date.date() if isinstance(exam_date, datetime) else exam_date
+        days_left = (exam_date - today).days - 1
+        if days_left <= 0:
+            continue
+
+        difficulty = Difficulty.parse(subject.get("examDifficulty"))
+        name = subject.get("subjectName", "Unknown Subject")
+        entry = Subject(
+            str(subject.get("_id", name)),
+            name,
+            [topic.get("name", "Unnamed Topic") for topic in topics],
+            difficulty,
+            days_left,
+            max(1, round(difficulty * 60 / len(topics))),
+        )
+        (urgent if days_left <= URGENT_DAYS_LEFT else normal).append(entry)
+    return urgent, normal
+
+
+def horizon_for(subjects: list) -> int:
+    return max([1] + [subject.days_left for subject in subjects])
+
+
+def check_deadlines(calendar: CapacityCalendar, subjects: list) -> list:
+    """Subjects whose cumulative demand (earliest exam first) exceeds the time left before their exam."""
+    subjects = sorted(subjects, key=lambda subject: subject.days_left)
+    required = list(accumulate(len(s.topics) * s.topic_minutes for s in subjects))
+    available = calendar.capacity_before([s.days_left for s in subjects])
+    return [
+        {
+            "type": "deadline",
+            "subject": subject.name,
+            "exam_date": calendar.date(subject.days_left).isoformat(),
+            "required_minutes": need,
+            "available_minutes": have,
+        }
+        for subject, need, have in zip(subjects, required, available)
+        if need > have
+    ]
+
+
+def allocate(calendar: CapacityCalendar, urgent: list, normal: list) -> list:
+    """Returns a Placement per topic: urgent subjects share tomorrow, the rest go first-fit by day."""
+    placements = []
+
+    # Urgent subjects split tomorrow's time evenly, cycling through the slots
+    total_topics = sum(len(subject.topics) for subject in urgent)
+    if total_topics:
+        time_per_topic = calendar.day_total(0) // total_topics
+        slot = 0
+        for subject in urgent:
+            for topic in subject.topics:
+                if slot >= calendar.slots:
+                    slot = 0
+                allocated = min(time_per_topic, calendar.free(0, slot))
+                if allocated > 0:
+                    calendar.book(0, slot, allocated)
+                    placements.append(Placement(0, slot, subject.name, topic, allocated, allocated < time_per_topic, subject.id))
+                else:
+                    placements.append(Placement(None, None, subject.name, topic, time_per_topic, subject_id=subject.id))
+                if calendar.free(0, slot) <= 0:
+                    slot += 1
+
+    # Every other topic goes into the earliest day before its exam with a slot that fits
+    for subject in normal:
+        minutes = subject.topic_minutes
+        for topic in subject.topics:
+            day = calendar.find_day(minutes, subject.days_left)
+            if day is None:
+                placements.append(Placement(None, None, subject.name, topic, minutes, subject_id=subject.id))
+            else:
+                slot = calendar.take(day, minutes)
+                placements.append(Placement(day, slot, subject.name, topic, minutes, subject_id=subject.id))
+
+    return placements
+
+
+def iter_edf(calendar: CapacityCalendar, subjects: list):
+    """Fills the calendar day by day, always taking the pending topic with the earliest exam.
+
+    Yields (day, placements) as soon as each day is complete, skipping empty
+    days, and finally (None, placements) for the topics that could not fit.
+    Pending topics are kept in one heap per topic size, so a day only ever
+    looks at the sizes that still fit its largest free slot.
+    """
+    unscheduled = []
+    heaps = {}  # topic minutes -> heap of (deadline, subject order, sequence, topic)
+    largest = max((calendar.largest_free(day) for day in range(calendar.horizon)), default=0)
+    sequence = 0
+    for order, subject in enumerate(subjects):
+        minutes = subject.topic_minutes
+        for topic in subject.topics:
+            if minutes > largest:
+                unscheduled.append(Placement(None, None, subject.name, topic, minutes, subject_id=subject.id))
+            else:
+                heaps.setdefault(minutes, []).append((subject.days_left, order, sequence, topic))
+                sequence += 1
+    for heap in heaps.values():
+        heapify(heap)
+    sizes = sorted(heaps)
+
+    for day in range(calendar.horizon):
+        if not sizes:
+            break
+        placed = []
+        while True:
+            free = calendar.largest_free(day)
+            best = None
+            for minutes in sizes:
+                if minutes > free:
+                    break
+                if best is None or heaps[minutes][0] < heaps[best][0]:
+                    best = minutes
+            if best is None:
+                break  # nothing pending fits what is left today
+            heap = heaps[best]
+            deadline, order, _, topic = heappop(heap)
+            if not heap:
+                del heaps[best]
+                sizes.remove(best)
+            subject = subjects[order]
+            if deadline <= day:
+                unscheduled.append(Placement(None, None, subject.name, topic, best, subject_id=subject.id))
+                continue
+            slot = calendar.take(day, best)
+            placed.append(Placement(day, slot, subject.name, topic, best, subject_id=subject.id))
+        if placed:
+            yield day, placed
+
+    leftover = sorted((item, minutes) for minutes, heap in heaps.items() for item in heap)
+    for (_, order, _, topic), minutes in leftover:
+        subject = subjects[order]
+        unscheduled.append(Placement(None, None, subject.name, topic, minutes, subject_id=subject.id))
+    yield None, unscheduled
+
+
+def allocate_edf(calendar: CapacityCalendar, subjects: list) -> list:
+    placements = []
+    for _, block in iter_edf(calendar, subjects):
+        placements.extend(block)
+    return placements
+
+
+def plan_entry(placement: Placement, calendar: CapacityCalendar, learning_slots) -> dict:
+    if not placement.scheduled:
+        return {
+            "date": None, "start": None, "end": None,
+            "subject": placement.subject, "topic": placement.topic, "minutes": placement.minutes,
+            "partial": False, "unscheduled": True,
+        }
+    slot = learning_slots[placement.slot]
+    return {
+        "date": calendar.date(placement.day).isoformat(),
+        "start": format_clock(slot.start),
+        "end": format_clock(slot.end),
+        "subject": placement.subject,
+        "topic": placement.topic,
+        "minutes": placement.minutes,
+        "partial": placement.partial,
+        "unscheduled": False,
+    }
+
+
+def plan_entries(placements: list, calendar: CapacityCalendar, learning_slots) -> list:
+    """Structured plan rows: scheduled topics in date and slot order, then the ones that did not fit."""
+    scheduled = sorted(
+        (p for p in placements if p.scheduled),
+        key=lambda p: (p.day, learning_slots[p.slot].start),
+    )
+    entries = [plan_entry(p, calendar, learning_slots) for p in scheduled]
+    entries.extend(plan_entry(p, calendar, learning_slots) for p in placements if not p.scheduled)
+    return entries
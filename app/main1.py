@@ -1,36 +1,463 @@
 # Import necessary modules from FastAPI
-from fastapi import FastAPI, HTTPException, Query
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import asynccontextmanager
+
+from fastapi import Body, Depends, FastAPI, Header, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+from motor.motor_asyncio import AsyncIOMotorCollection
+from pymongo.collection import Collection
+from pymongo.errors import PyMongoError
 # Import database functions and the function to generate the study plan
-from app.db import get_db
-# from app.generate_plan_logic import generate_user_plan
-from app.gemini import generate_user_plan_with_gemini
+from app.db import (
+    close_async_client,
+    close_client,
+    get_async_db,
+    get_async_plans_collection,
+    get_async_subjects_collection,
+    get_async_users_collection,
+    get_subjects_collection,
+    get_users_collection,
+    init_async_client,
+    pool_stats,
+)
+from app.cache import consume_changes, plan_cache
+from app.cohort import plan_cohort
+from app.gemini import (
+    find_plan_async,
+    load_user_inputs_async,
+    plan_from_store_async,
+    replan_user_async,
+    stream_user_plan_async,
+)
+from app.metrics import CONTENT_TYPE, REQUEST_SECONDS, REQUESTS, GaugeFunction, render_metrics, span
+from app.plan_store import etag_matches, plan_etag
+from app.planner import DEFAULT_STRATEGY, STRATEGIES, InvalidUserId, UserNotFound, to_object_id
+from app.ratelimit import ADMISSION_REJECTIONS, Overloaded, RateLimited, ip_limiter, plan_gate, rate_limit_backend, user_limiter
+from app.render import msgpack_media_type, plan_response, render_text, stream_response
+from app.repository import ensure_indexes_async
+from app.singleflight import SingleFlight
+from app.summary import service_from_env
+from app.warmup import Readiness
+
+logger = logging.getLogger(__name__)
+
+STRATEGY_PATTERN = "^(" + "|".join(STRATEGIES) + ")$"
+GaugeFunction("mongo_pool_connections_open", "Open MongoDB connections.", lambda: pool_stats()["connections_open"])
+GaugeFunction("mongo_pool_checked_out", "MongoDB connections currently checked out.", lambda: pool_stats()["checked_out"])
+GaugeFunction("mongo_pool_max_size", "Configured maxPoolSize.", lambda: pool_stats()["max_pool_size"])
+GaugeFunction("mongo_pool_checkout_failures_total", "Failed connection checkouts.", lambda: pool_stats()["checkout_failures"], kind="counter")
+GaugeFunction("plan_cache_hits_total", "Plan cache hits.", lambda: plan_cache.stats()["hits"], kind="counter")
+GaugeFunction("plan_cache_misses_total", "Plan cache misses.", lambda: plan_cache.stats()["misses"], kind="counter")
+GaugeFunction("plan_cache_hit_ratio", "Plan cache hits / lookups.", lambda: plan_cache.stats()["hit_rate"])
+GaugeFunction("plan_cache_entries", "Plans held in the cache.", lambda: plan_cache.stats()["entries"])
+GaugeFunction(
+    "singleflight_in_flight", "Computations currently shared by waiting requests.",
+    lambda: {"fetch": fetch_flight.in_flight(), "plan": plan_flight.in_flight()}, labelname="flight",
+)
+
+# Clients may keep plans but must revalidate them; the body depends on Accept
+PLAN_CACHE_HEADERS = {"Cache-Control": "private, no-cache", "Vary": "Accept"}
+MAX_BATCH_USERS = int(os.getenv("MAX_BATCH_USERS", "5000"))
+_batch_executor = None
+_batch_executor_lock = threading.Lock()
+summary_service = service_from_env()
+fetch_flight = SingleFlight("fetch")
+plan_flight = SingleFlight("plan")
+readiness = Readiness()
+GaugeFunction("app_ready", "1 once startup warmup has finished.", lambda: int(readiness.ready))
+GaugeFunction("plan_gate_active", "Plan requests currently running.", lambda: plan_gate.active)
+GaugeFunction("plan_gate_waiting", "Plan requests queued for a slot.", lambda: plan_gate.waiting)
+GaugeFunction("rate_limit_buckets", "Token buckets held in memory.", lambda: len(rate_limit_backend))
+
+
+def batch_workers() -> int:
+    """BATCH_WORKERS, or this worker's share of the CPUs so WEB_CONCURRENCY pools don't oversubscribe them."""
+    configured = int(os.getenv("BATCH_WORKERS") or 0)
+    if configured > 0:
+        return configured
+    web_workers = int(os.getenv("WEB_CONCURRENCY") or 0) or os.cpu_count() or 1
+    return max(1, (os.cpu_count() or 1) // web_workers)
+
+
+def get_batch_executor():
+    # Worker processes are started on the first batch request, not at import.
+    # Batches run in threadpool threads, so the first two could race to create it
+    global _batch_executor
+    if _batch_executor is None:
+        with _batch_executor_lock:
+            if _batch_executor is None:
+                from app.batch import make_executor
+
+                _batch_executor = make_executor(batch_workers())
+    return _batch_executor
+
+
+def _resolve(dependency):
+    # Honours dependency overrides (tests, the load-test stand-in) outside of a request
+    return app.dependency_overrides.get(dependency, dependency)()
+
+
+def _retry_after(seconds: float) -> dict:
+    return {"Retry-After": str(max(1, round(seconds + 0.5)))}
+
+
+def check_rate(request: Request, user_id: str = None):
+    """Raises 429 when the client IP or the userId is over its rate, and 400 for a malformed userId."""
+    try:
+        ip_limiter.check(request.client.host if request.client else None)
+        # Only well-formed ids get a bucket, keyed on the canonical form
+        user_limiter.check(str(to_object_id(user_id)) if user_id is not None else None)
+    except RateLimited as e:
+        raise HTTPException(status_code=429, detail=str(e), headers=_retry_after(e.retry_after))
+    except InvalidUserId as e:
+        raise http_error(e)
+
+
+async def stream_in_gate(lines) -> StreamingResponse:
+    """NDJSON response for lines, a sync iterator, holding a plan_gate slot for the whole stream.
+
+    Batches plan while they stream, so the slot is only released once the
+    stream ends or the client goes away, whichever is noticed first. Raises
+    503 when no slot is free.
+    """
+    try:
+        await plan_gate.__aenter__()
+    except Overloaded as e:
+        raise http_error(e)
+    released = False
+
+    async def release():
+        nonlocal released
+        if not released:
+            released = True
+            await plan_gate.__aexit__(None, None, None)
+
+    async def body():
+        try:
+            async for line in iterate_in_threadpool(lines):
+                yield line
+        finally:
+            await release()
+
+    # The background task also runs when the stream was cancelled before its first line
+    return StreamingResponse(body(), media_type="application/x-ndjson", background=BackgroundTask(release))
+
+
+def http_error(e: Exception) -> HTTPException:
+    """Maps a planning error to its status: bad input 4xx, database trouble 503, anything else 500."""
+    if isinstance(e, HTTPException):
+        return e
+    if isinstance(e, Overloaded):
+        return HTTPException(status_code=503, detail=str(e), headers=_retry_after(e.retry_after))
+    if isinstance(e, UserNotFound):
+        return HTTPException(status_code=404, detail=str(e))
+    if isinstance(e, ValueError):
+        return HTTPException(status_code=400, detail=str(e))
+    if isinstance(e, PyMongoError):
+        logger.warning("Database error while planning: %s", e)
+        return HTTPException(status_code=503, detail="Database unavailable. Try again shortly.", headers=_retry_after(1))
+    logger.exception("Planning failed", exc_info=e)
+    return HTTPException(status_code=500, detail=str(e))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Open the shared MongoDB client once for the whole process
+    init_async_client()
+    # Make sure the plan queries are index-backed (skip where the role may not create indexes)
+    if os.getenv("MONGODB_CREATE_INDEXES", "1") == "1":
+        try:
+            await ensure_indexes_async(get_async_db())
+        except PyMongoError as e:
+            logger.warning("Could not create MongoDB indexes at startup: %s", e)
+
+    # Optionally drop cached plans as soon as users/subjects change (needs a replica set)
+    watcher = None
+    if os.getenv("PLAN_CACHE_WATCH_CHANGES") == "1":
+        watcher = asyncio.create_task(consume_changes(get_async_db(), plan_cache))
+
+    # Workers that produce LLM summaries after plans have been returned
+    summary_service.start()
+
+    # Connect and warm caches in the background; /ready reports when it is done
+    warmup = asyncio.create_task(readiness.run(_resolve(get_async_plans_collection), plan_cache))
+
+    yield
+
+    warmup.cancel()
+    await summary_service.stop()
+    if watcher is not None:
+        watcher.cancel()
+    if _batch_executor is not None:
+        _batch_executor.shutdown(cancel_futures=True)
+    # Close pooled connections and monitor threads on shutdown
+    close_async_client()
+    close_client()
+
+
 # Create a FastAPI instance to define the API
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
+
+
+@app.middleware("http")
+async def record_request(request: Request, call_next):
+    # Route templates (not raw paths) as labels keep the series count bounded
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        route = route.path if route is not None else "<unmatched>"
+        REQUESTS.inc(route=route, status=status)
+        REQUEST_SECONDS.observe(time.perf_counter() - started, route=route)
+
+
+def plan_content(user_id: str, result: dict, format: str) -> dict:
+    # Return the generated study plan along with learning times
+    content = {
+        "user_id": user_id,  # The user ID for the plan
+        "learning_times": result["learning_times"],  # Times when the user will study
+    }
+    if format == "text":
+        content["study_plan"] = render_text(result)
+    else:
+        content["start_date"] = result["start_date"]
+        content["entries"] = result["entries"]  # One row per topic: date, slot, minutes, flags
+        content["warnings"] = result["warnings"]
+    return content
+
 
 # Define an endpoint that generates a study plan for a user
 @app.get("/generate-user-plan")
-def generate_plan(userId: str = Query(...)):  # Takes userId as a query parameter
-    # Connect to the database
-    db = get_db()
-    # Get the collections for users and subjects from the database
-    users_collection = db["users"]
-    subjects_collection = db["subjects"]
+async def generate_plan(
+    request: Request,
+    userId: str = Query(...),  # Takes userId as a query parameter
+    format: str = Query("json", pattern="^(json|text)$"),  # "text" adds the old study_plan lines
+    strategy: str = Query(DEFAULT_STRATEGY, pattern=STRATEGY_PATTERN),  # allocator from app.planner
+    summary: bool = Query(False),  # queue an LLM summary and return its poll URL
+    accept: str = Header(None),  # application/msgpack selects the compact encoding
+    if_none_match: str = Header(None),  # ETag from an earlier response
+    users_collection: AsyncIOMotorCollection = Depends(get_async_users_collection),
+    subjects_collection: AsyncIOMotorCollection = Depends(get_async_subjects_collection),
+    plans_collection: AsyncIOMotorCollection = Depends(get_async_plans_collection),
+):
+    check_rate(request, userId)
+    try:
+        async with plan_gate:
+            # Inputs are fetched first: their fingerprint decides the ETag before any planning
+            # Duplicate requests that arrive together share one fetch and one planning run
+            user_obj_id, today, inputs, fingerprint = await fetch_flight.do(
+                userId, lambda: load_user_inputs_async(users_collection, subjects_collection, userId)
+            )
+            # Served from memory or the plans collection when the inputs are unchanged. A plan
+            # patched by /replan carries a revision, so the ETag is known before any planning
+            variant = f"{format}:{msgpack_media_type(accept) or 'json'}"
+            result = await find_plan_async(plans_collection, user_obj_id, today, fingerprint, plan_cache, strategy)
+            # Summaries change between polls, so only plain plan responses are revalidated
+            if not summary:
+                etag = plan_etag(fingerprint, today, strategy, variant, (result or {}).get("revision", ""))
+                if etag_matches(if_none_match, etag):
+                    return Response(status_code=304, headers={"ETag": etag, **PLAN_CACHE_HEADERS})
+            if result is None:
+                result = await plan_flight.do(
+                    (userId, strategy, today, fingerprint),
+                    lambda: plan_from_store_async(
+                        plans_collection, user_obj_id, inputs, today, fingerprint,
+                        cache=plan_cache, strategy=strategy, look_up=False,
+                    ),
+                )
+    except Overloaded as e:
+        # Shed load: the user's last cached plan beats a 503
+        result = plan_cache.stale(userId, strategy)
+        if result is None or not result.get("entries"):
+            raise http_error(e)
+        ADMISSION_REJECTIONS.inc(reason="stale_served")
+        content = plan_content(userId, result, format)
+        content["stale"] = True
+        with span("serialize"):
+            response = plan_response(content, accept)
+        response.headers["X-Plan-Stale"] = "1"
+        return response
+    except Exception as e:
+        raise http_error(e)
 
+    # No learning slots, or no study plan generated: return a message
+    if "message" in result:
+        return result
+    if not result["entries"]:
+        return {"message": "No upcoming exams found or no topics available."}
+
+    content = plan_content(userId, result, format)
+    if summary:
+        job = summary_service.submit(result)
+        content["summary"] = dict(job, url=f"/plan-summaries/{job['id']}")
+    with span("serialize"):
+        response = plan_response(content, accept)
+    if not summary:
+        response.headers["ETag"] = plan_etag(fingerprint, today, strategy, variant, result.get("revision", ""))
+        response.headers.update(PLAN_CACHE_HEADERS)
+    return response
+
+
+
+# Same plan, streamed one day at a time so the first week renders immediately
+@app.get("/generate-user-plan/stream")
+async def stream_plan(
+    request: Request,
+    userId: str = Query(...),
+    accept: str = Header(None),  # text/event-stream selects SSE, NDJSON otherwise
+    users_collection: AsyncIOMotorCollection = Depends(get_async_users_collection),
+    subjects_collection: AsyncIOMotorCollection = Depends(get_async_subjects_collection),
+):
+    check_rate(request, userId)
     try:
-        # Call the function to generate the study plan
-        result = generate_user_plan_with_gemini(users_collection, subjects_collection, userId)
-        
-        # If no study plan is generated, return a message
-        if not result["study_plan"]:
-            return {"message": "No upcoming exams found or no topics available."}
-        
-        # Return the generated study plan along with learning times
-        return {
-            "user_id": userId,  # The user ID for the plan
-            "learning_times": result["learning_times"],  # Times when the user will study
-            "study_plan": result["study_plan"]  # The actual study plan
-        }
-    
+        async with plan_gate:
+            blocks = await stream_user_plan_async(users_collection, subjects_collection, userId)
     except Exception as e:
-        # If there’s any error, raise an HTTP exception with the error message
-        raise HTTPException(status_code=500, detail=str(e))
+        raise http_error(e)
+    return stream_response(blocks, accept)
+
+
+# Patch the stored plan after a subject or topic edit instead of recomputing it
+@app.post("/replan")
+async def replan_plan(
+    request: Request,
+    userId: str = Query(...),
+    accept: str = Header(None),
+    users_collection: AsyncIOMotorCollection = Depends(get_async_users_collection),
+    subjects_collection: AsyncIOMotorCollection = Depends(get_async_subjects_collection),
+    plans_collection: AsyncIOMotorCollection = Depends(get_async_plans_collection),
+):
+    check_rate(request, userId)
+    try:
+        async with plan_gate:
+            result = await replan_user_async(
+                users_collection, subjects_collection, plans_collection, userId, cache=plan_cache
+            )
+    except Exception as e:
+        raise http_error(e)
+    if "message" in result:
+        return result
+    return plan_response(result, accept)
+
+
+# Poll a summary queued by /generate-user-plan?summary=true
+@app.get("/plan-summaries/{summary_id}")
+def get_plan_summary(summary_id: str):
+    status = summary_service.status(summary_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired summary.")
+    return status
+
+
+# Generate plans for many users in one call, streamed back as NDJSON
+@app.post("/generate-user-plans")
+async def generate_plans_batch(
+    request: Request,
+    userIds: list[str] = Body(..., embed=True),
+    users_collection: Collection = Depends(get_users_collection),
+    subjects_collection: Collection = Depends(get_subjects_collection),
+):
+    if len(userIds) > MAX_BATCH_USERS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_USERS} userIds per request.")
+    check_rate(request)
+    # Imported here: the process pool machinery is only needed by this endpoint
+    from app.batch import generate_plans, parse_user_ids
+
+    user_obj_ids, invalid = parse_user_ids(userIds)
+
+    def lines():
+        for user_id in invalid:
+            yield json.dumps({"user_id": user_id, "error": "Invalid userId format. Expected a valid MongoDB ObjectId."}) + "\n"
+        found = set()
+        for user_id, _, plan in generate_plans(users_collection, subjects_collection, user_obj_ids, get_batch_executor()):
+            found.add(user_id)
+            if "error" in plan:
+                yield json.dumps({"user_id": user_id, "error": plan["error"]}) + "\n"
+            else:
+                yield json.dumps({"user_id": user_id, "plan": plan}) + "\n"
+        for user_obj_id in user_obj_ids:
+            if str(user_obj_id) not in found:
+                yield json.dumps({"user_id": str(user_obj_id), "error": "User not found."}) + "\n"
+
+    return await stream_in_gate(lines())
+
+
+# Plan a whole cohort against shared study rooms, so no room is overbooked
+@app.post("/cohort-plans")
+async def generate_cohort_plans(
+    request: Request,
+    userIds: list[str] = Body(...),
+    rooms: list[dict] = Body(...),  # [{"name": "Room 1", "capacity": 30}, ...]
+    users_collection: Collection = Depends(get_users_collection),
+    subjects_collection: Collection = Depends(get_subjects_collection),
+):
+    if len(userIds) > MAX_BATCH_USERS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_USERS} userIds per request.")
+    check_rate(request)
+    from app.batch import parse_user_ids
+
+    user_obj_ids, invalid = parse_user_ids(userIds)
+    try:
+        async with plan_gate:
+            result = await run_in_threadpool(plan_cohort, users_collection, subjects_collection, user_obj_ids, rooms)
+    except Exception as e:
+        raise http_error(e)
+
+    def lines():
+        for user_id in invalid:
+            yield json.dumps({"user_id": user_id, "error": "Invalid userId format. Expected a valid MongoDB ObjectId."}) + "\n"
+        for user_id, plan in result["plans"].items():
+            if "error" in plan:
+                yield json.dumps({"user_id": user_id, "error": plan["error"]}) + "\n"
+            else:
+                yield json.dumps({"user_id": user_id, "plan": plan}) + "\n"
+        for user_obj_id in user_obj_ids:
+            if str(user_obj_id) not in result["plans"]:
+                yield json.dumps({"user_id": str(user_obj_id), "error": "User not found."}) + "\n"
+        yield json.dumps({"rooms": result["rooms"]}) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+# Readiness probe: 503 until the startup warmup has finished
+@app.get("/ready")
+def get_ready():
+    status = readiness.status()
+    if not readiness.ready:
+        return JSONResponse(status, status_code=503)
+    return status
+
+
+# Prometheus scrape endpoint: request, phase and plan-size metrics plus pool and cache state
+@app.get("/metrics")
+def get_metrics():
+    return Response(render_metrics(), media_type=CONTENT_TYPE)
+
+
+# Expose connection pool counters for monitoring
+@app.get("/pool-stats")
+def get_pool_stats():
+    return pool_stats()
+
+
+# Expose plan cache hit/miss counters
+@app.get("/cache-stats")
+def get_cache_stats():
+    return plan_cache.stats()
+
+
+# Hook for services that just updated a user's dailyRoutine or subjects
+@app.post("/invalidate-plan")
+def invalidate_plan(userId: str = Query(...)):
+    return {"user_id": userId, "invalidated": plan_cache.invalidate_user(userId)}
@@ -0,0 +1,181 @@
+# Lightweight in-process metrics in the Prometheus text format.
+# Counters and histograms are plain dicts behind a lock, so recording costs a
+# dict lookup and a few additions; nothing is exported until /metrics is scraped.
+# Set PLAN_TRACING=1 with opentelemetry-api installed to also emit a trace span
+# for every timed phase; the SDK is only imported then.
+import os
+import threading
+import time
+from bisect import bisect_left
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+SIZE_BUCKETS = (0, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+INF_LABEL = 'le="+Inf"'
+
+
+def _make_tracer():
+    if os.getenv("PLAN_TRACING") != "1":
+        return None
+    try:
+        from opentelemetry import trace
+    except ImportError:  # optional, spans are only recorded as histograms without it
+        return None
+    return trace.get_tracer("plan-scheduler")
+
+
+_tracer = _make_tracer()
+
+REGISTRY = []
+
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _number(value) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple([labels[name] for name in self.labelnames])
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(tuple(labels[name] for name in self.labelnames), 0)
+
+    def expose(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labelnames, key)} {_number(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, value: float, **labels):
+        key = tuple([labels[name] for name in self.labelnames])
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def expose(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, series):
+                    cumulative += count
+                    le = f'le="{_number(bound)}"'
+                    lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, INF_LABEL)} {series[-1]}")
+                lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(series[-2])}")
+                lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {series[-1]}")
+        return lines
+
+
+class GaugeFunction:
+    """Value read at scrape time from fn(), which returns a number or {label value: number}.
+
+    kind="counter" exposes a running total kept elsewhere (e.g. cache hits).
+    """
+
+    def __init__(self, name: str, help: str, fn, labelname: str = None, kind: str = "gauge"):
+        self.name = name
+        self.help = help
+        self.fn = fn
+        self.labelname = labelname
+        self.kind = kind
+        REGISTRY.append(self)
+
+    def expose(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        value = self.fn()
+        if self.labelname is None:
+            lines.append(f"{self.name} {_number(value)}")
+        else:
+            for label, number in sorted(value.items()):
+                lines.append(f"{self.name}{_labels((self.labelname,), (label,))} {_number(number)}")
+        return lines
+
+
+def render_metrics() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.expose())
+    return "\n".join(lines) + "\n"
+
+
+REQUESTS = Counter("http_requests_total", "HTTP requests by route and status code.", ("route", "status"))
+REQUEST_SECONDS = Histogram("http_request_duration_seconds", "Time to produce the response headers.", ("route",))
+PHASE_SECONDS = Histogram("plan_phase_seconds", "Time spent in each planning phase.", ("phase",))
+PLANS = Counter("plans_computed_total", "Plans computed (cache misses) by strategy.", ("strategy",))
+PLAN_ENTRIES = Histogram("plan_entries", "Entries per computed plan.", buckets=SIZE_BUCKETS)
+PLAN_UNSCHEDULED = Histogram("plan_unscheduled_entries", "Topics left unscheduled per computed plan.", buckets=SIZE_BUCKETS)
+
+
+class span:
+    """Times a block into plan_phase_seconds{phase=...} (and an OpenTelemetry span when tracing is on).
+
+    A plain class rather than @contextmanager keeps each use to a few microseconds.
+    """
+
+    __slots__ = ("phase", "started", "_otel")
+
+    def __init__(self, phase: str):
+        self.phase = phase
+        self._otel = None
+
+    def __enter__(self):
+        if _tracer is not None:
+            self._otel = _tracer.start_as_current_span(f"plan.{self.phase}")
+            self._otel.__enter__()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        PHASE_SECONDS.observe(time.perf_counter() - self.started, phase=self.phase)
+        if self._otel is not None:
+            self._otel.__exit__(*exc_info)
+        return False
+
+
+def record_plan(plan: dict, strategy: str):
+    PLANS.inc(strategy=strategy)
+    entries = plan.get("entries")
+    if entries is not None:
+        PLAN_ENTRIES.observe(len(entries))
+        PLAN_UNSCHEDULED.observe(sum(1 for entry in entries if entry["unscheduled"]))
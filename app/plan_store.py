@@ -0,0 +1,124 @@
+# Persisted plans.
+# Each user's plans document keeps the last default-strategy plan together with
+# the input fingerprint and date it was built for, so an unchanged user is served
+# from MongoDB instead of being planned again. version counts regenerations, and
+# expiresAt drives a TTL index that skips documents holding a current replanning
+# state. The ETag is derived from the same fingerprint: clients revalidate with
+# If-None-Match and get a 304 before any planning runs.
+import hashlib
+import os
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from pymongo import UpdateOne
+
+# Bump when planner output changes for the same inputs, so stored plans and ETags are refreshed
+PLANNER_VERSION = 1
+PLAN_TTL_SECONDS = int(os.getenv("PLAN_STORE_TTL_SECONDS", str(2 * 24 * 60 * 60)))
+
+
+def plan_etag(fingerprint: str, today, strategy: str, variant: str = "", revision: str = "") -> str:
+    """Strong ETag for one representation (variant, e.g. format and encoding) of a plan.
+
+    revision is the plan's own "revision" for plans patched from a replanning
+    state, which can differ from the fresh plan for the same inputs.
+    """
+    payload = f"{PLANNER_VERSION}:{today.isoformat()}:{strategy}:{variant}:{fingerprint}"
+    if revision:
+        payload += f":{revision}"
+    return '"' + hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32] + '"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+def stored_plan_filter(user_obj_id: ObjectId, fingerprint: str, today, strategy: str) -> dict:
+    return {
+        "userId": user_obj_id,
+        "date": today.isoformat(),
+        "fingerprint": fingerprint,
+        "strategy": strategy,
+        "plannerVersion": PLANNER_VERSION,
+    }
+
+
+def plan_update(user_obj_id: ObjectId, fingerprint: str, plan: dict, today, strategy: str, state: dict = None):
+    """(filter, update) upserting the user's stored plan.
+
+    $set leaves other fields in place; pass state to store the replanning state
+    the plan was rendered from along with it. stateRevision records which plan
+    that was: a later plan-only write (a GET, the batch, precompute) leaves the
+    state behind, no longer current, and hands the document back to the TTL.
+    """
+    now = datetime.utcnow()
+    fields = {
+        "date": today.isoformat(),
+        "fingerprint": fingerprint,
+        "strategy": strategy,
+        "plannerVersion": PLANNER_VERSION,
+        "plan": plan,
+        "generatedAt": now,
+        "expiresAt": now + timedelta(seconds=PLAN_TTL_SECONDS),
+        "planRevision": plan.get("revision"),
+        "hasState": state is not None,
+    }
+    if state is not None:
+        fields.update(state=state, stateRevision=plan.get("revision"), stateUpdatedAt=now)
+    return {"userId": user_obj_id}, {"$set": fields, "$inc": {"version": 1}}
+
+
+# The fields stored_state reads
+STATE_PROJECTION = {"state": 1, "stateRevision": 1, "planRevision": 1}
+
+
+def stored_state(doc) -> tuple:
+    """(state, current) from a plans document.
+
+    current is False when the stored plan is no longer the one the state
+    rendered, so patching the state would move subjects the user has not touched.
+    """
+    state = (doc or {}).get("state")
+    if state is None:
+        return None, True
+    return state, doc.get("stateRevision") is not None and doc.get("stateRevision") == doc.get("planRevision")
+
+
+async def load_stored_plan_async(plans_collection, user_obj_id: ObjectId, fingerprint: str, today, strategy: str):
+    """The stored plan if it was built from exactly these inputs today, else None."""
+    doc = await plans_collection.find_one(stored_plan_filter(user_obj_id, fingerprint, today, strategy), {"plan": 1})
+    return doc["plan"] if doc else None
+
+
+async def load_todays_plans_async(plans_collection, today, strategy: str, limit: int) -> list:
+    """Up to limit stored plans built today for strategy, as {userId, fingerprint, plan} documents."""
+    query = {"date": today.isoformat(), "strategy": strategy, "plannerVersion": PLANNER_VERSION}
+    cursor = plans_collection.find(query, {"userId": 1, "fingerprint": 1, "plan": 1}).limit(limit)
+    return await cursor.to_list(length=limit)
+
+
+async def save_plan_async(plans_collection, user_obj_id: ObjectId, fingerprint: str, plan: dict, today, strategy: str, state: dict = None):
+    await plans_collection.update_one(*plan_update(user_obj_id, fingerprint, plan, today, strategy, state), upsert=True)
+
+
+def save_plans_bulk(plans_collection, results, today, strategy: str, batch_size: int = 500):
+    """Upserts (user_id, fingerprint, plan) results with unordered bulk writes. Yields results through.
+
+    Results whose plan is an {"error": ...} are not stored.
+    """
+    ops = []
+    for user_id, fingerprint, plan in results:
+        if "error" not in plan:
+            ops.append(UpdateOne(*plan_update(ObjectId(user_id), fingerprint, plan, today, strategy), upsert=True))
+        if len(ops) >= batch_size:
+            plans_collection.bulk_write(ops, ordered=False)
+            ops = []
+        yield user_id, fingerprint, plan
+    if ops:
+        plans_collection.bulk_write(ops, ordered=False)
@@ -0,0 +1,180 @@
+# Shared planning pipeline: load -> normalize -> allocate -> render.
+# Every entry point (API, streaming, batch, the legacy generate_user_plan) goes
+# through here, and allocators are looked up by name in a strategy registry.
+# Normalized inputs are cached by content hash, so running several strategies
+# over the same user pays for slot parsing and subject normalization once.
+import os
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from bson.errors import InvalidId
+
+from app.cache import LRUTTLBackend, plan_fingerprint
+from app.engine import (
+    URGENT_DAYS_LEFT,
+    CapacityCalendar,
+    allocate,
+    allocate_edf,
+    check_deadlines,
+    horizon_for,
+    normalize_subjects,
+    plan_entries,
+)
+from app.metrics import record_plan, span
+from app.repository import load_plan_inputs, load_plan_inputs_async
+from app.slots import parse_learning_slots
+
+DEFAULT_STRATEGY = "edf"
+INPUTS_CACHE_TTL_SECONDS = 24 * 60 * 60  # keys include the date, so a day is enough
+
+STRATEGIES = {}
+# Strategies slow enough that async callers build them in a worker thread
+BLOCKING_STRATEGIES = set()
+
+_inputs_cache = LRUTTLBackend(max_entries=int(os.getenv("PLAN_INPUTS_CACHE_MAX_ENTRIES", "10000")))
+
+
+class UserNotFound(ValueError):
+    pass
+
+
+class InvalidUserId(ValueError):
+    pass
+
+
+def to_object_id(user_id: str) -> ObjectId:
+    try:
+        return ObjectId(user_id)
+    except InvalidId:
+        raise InvalidUserId("Invalid userId format. Expected a valid MongoDB ObjectId.")
+
+
+def register_strategy(name: str, blocking: bool = False):
+    """Registers an allocator(calendar, subjects) -> placements under name.
+
+    blocking marks an allocator that may run long enough to stall an event loop.
+    """
+    def decorator(allocator):
+        STRATEGIES[name] = allocator
+        if blocking:
+            BLOCKING_STRATEGIES.add(name)
+        return allocator
+    return decorator
+
+
+def get_strategy(name: str):
+    try:
+        return STRATEGIES[name]
+    except KeyError:
+        raise ValueError(f"Unknown planning strategy {name!r}. Expected one of: {', '.join(STRATEGIES)}.")
+
+
+@register_strategy("greedy")
+def greedy(calendar: CapacityCalendar, subjects: list) -> list:
+    # Every topic first-fit by day, earliest exam first
+    return allocate(calendar, [], subjects)
+
+
+@register_strategy("urgent-first")
+def urgent_first(calendar: CapacityCalendar, subjects: list) -> list:
+    # Subjects with one study day left split tomorrow evenly; the rest go first-fit
+    urgent = [subject for subject in subjects if subject.days_left <= URGENT_DAYS_LEFT]
+    normal = [subject for subject in subjects if subject.days_left > URGENT_DAYS_LEFT]
+    return allocate(calendar, urgent, normal)
+
+
+register_strategy("edf")(allocate_edf)
+
+
+@register_strategy("optimal", blocking=True)
+def optimal(calendar: CapacityCalendar, subjects: list) -> list:
+    # The max-flow solver is imported on first use, keeping it out of startup
+    from app.solver import allocate_optimal
+
+    return allocate_optimal(calendar, subjects)
+
+
+class PlanInputs:
+    """Parsed slots and normalized subjects for one user and day. Shared between strategies, so read-only."""
+
+    __slots__ = ("learning_slots", "subjects", "start")
+
+    def __init__(self, learning_slots: tuple, subjects: list, start):
+        self.learning_slots = learning_slots
+        self.subjects = subjects
+        self.start = start
+
+    @property
+    def learning_times(self) -> list:
+        return [slot.time for slot in self.learning_slots]
+
+    def calendar(self) -> CapacityCalendar:
+        """A fresh dates x slots calendar from the start date until the last exam."""
+        return CapacityCalendar([slot.minutes for slot in self.learning_slots], horizon_for(self.subjects), self.start)
+
+
+def load(users_collection, subjects_collection, user_obj_id: ObjectId, today):
+    with span("fetch"):
+        inputs = load_plan_inputs(users_collection, subjects_collection, user_obj_id, today)
+    if inputs is None:
+        raise UserNotFound("User not found.")
+    return inputs
+
+
+async def load_async(users_collection, subjects_collection, user_obj_id: ObjectId, today):
+    with span("fetch"):
+        inputs = await load_plan_inputs_async(users_collection, subjects_collection, user_obj_id, today)
+    if inputs is None:
+        raise UserNotFound("User not found.")
+    return inputs
+
+
+def normalize(raw_learning_slots: list, user_subjects: list, today, fingerprint: str = None) -> PlanInputs:
+    """Parses slots and normalizes subjects, reusing the result for identical inputs on the same day."""
+    if fingerprint is None:
+        fingerprint = plan_fingerprint(raw_learning_slots, user_subjects)
+    key = f"inputs:{today.isoformat()}:{fingerprint}"
+    inputs = _inputs_cache.get(key)
+    if inputs is None:
+        urgent, normal = normalize_subjects(user_subjects, today)
+        inputs = PlanInputs(parse_learning_slots(tuple(raw_learning_slots)), urgent + normal, today + timedelta(days=1))
+        _inputs_cache.set(key, "inputs", inputs, INPUTS_CACHE_TTL_SECONDS)
+    return inputs
+
+
+def render(user_obj_id: ObjectId, inputs: PlanInputs, calendar: CapacityCalendar, placements: list, warnings: list) -> dict:
+    return {
+        "user_id": str(user_obj_id),
+        "learning_times": inputs.learning_times,
+        "start_date": calendar.start.isoformat(),
+        "entries": plan_entries(placements, calendar, inputs.learning_slots),
+        "warnings": warnings,
+    }
+
+
+def build_plan(
+    user_obj_id: ObjectId,
+    raw_learning_slots: list,
+    user_subjects: list,
+    today=None,
+    strategy: str = DEFAULT_STRATEGY,
+    fingerprint: str = None,
+):
+    """Normalizes the inputs, runs the named allocator and returns the structured plan."""
+    allocator = get_strategy(strategy)
+    if not raw_learning_slots:
+        return {"message": "No learning slots found for the user."}
+
+    if today is None:
+        today = datetime.today().date()
+
+    with span("normalize"):
+        inputs = normalize(raw_learning_slots, user_subjects, today, fingerprint)
+    with span("allocate"):
+        calendar = inputs.calendar()
+        warnings = check_deadlines(calendar, inputs.subjects)
+        placements = allocator(calendar, inputs.subjects)
+    with span("render"):
+        plan = render(user_obj_id, inputs, calendar, placements, warnings)
+    record_plan(plan, strategy)
+    return plan
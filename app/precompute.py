@@ -0,0 +1,340 @@
+# Background plan precomputation.
+# A worker tails the users and subjects change streams, waits until a user's
+# edits have gone quiet (a burst of topic edits becomes one recompute), plans
+# the user with the regular planner and upserts the result into the plans
+# collection. /generate-user-plan then finds the plan for the new inputs already
+# stored, so requests only read.
+#
+# The resume token of the newest event whose plans are all stored is
+# checkpointed in MongoDB; a restarted worker resumes after it and replays any
+# edits that were still pending.
+#
+#   python -m app.precompute
+import asyncio
+import logging
+import os
+import signal
+import time
+from collections import deque
+from datetime import datetime, timezone
+from heapq import heappop, heappush
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo.errors import OperationFailure, PyMongoError
+
+from app.cache import (
+    CHANGE_STREAM_HISTORY_LOST, MAX_RETRY_SECONDS, mongo_change_source, plan_fingerprint, user_id_for_change,
+)
+from app.db import close_async_client, get_async_db, init_async_client
+from app.metrics import CONTENT_TYPE, Counter, GaugeFunction, Histogram, render_metrics
+from app.plan_store import save_plan_async
+from app.planner import DEFAULT_STRATEGY, UserNotFound, build_plan, load_async
+
+logger = logging.getLogger(__name__)
+
+DEBOUNCE_SECONDS = float(os.getenv("PRECOMPUTE_DEBOUNCE_SECONDS", "2"))
+MAX_DELAY_SECONDS = float(os.getenv("PRECOMPUTE_MAX_DELAY_SECONDS", "30"))
+CONCURRENCY = int(os.getenv("PRECOMPUTE_CONCURRENCY", "8"))
+CHECKPOINT_SECONDS = float(os.getenv("PRECOMPUTE_CHECKPOINT_SECONDS", "5"))
+METRICS_PORT = int(os.getenv("PRECOMPUTE_METRICS_PORT", "9100"))
+STATE_COLLECTION = "precompute_state"
+
+EVENTS = Counter("precompute_events_total", "Change events read, by what was done with them.", ("outcome",))
+PRECOMPUTED = Counter("precompute_plans_total", "Users recomputed, by result.", ("result",))
+EDIT_TO_PLAN_SECONDS = Histogram(
+    "precompute_edit_to_plan_seconds", "Time from a user's first pending edit until their plan was stored.",
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0),
+)
+
+
+def affects_plan(change: dict) -> bool:
+    """False for user updates that leave dailyRoutine alone, such as a profile edit."""
+    if change.get("ns", {}).get("coll") != "users" or change.get("operationType") != "update":
+        return True
+    description = change.get("updateDescription") or {}
+    fields = list(description.get("updatedFields") or {}) + list(description.get("removedFields") or [])
+    fields += [array.get("field", "") for array in description.get("truncatedArrays") or []]
+    return any(field == "dailyRoutine" or field.startswith("dailyRoutine.") for field in fields)
+
+
+def event_time(change: dict) -> float:
+    """When the edit was committed (epoch seconds), falling back to now."""
+    wall_time = change.get("wallTime")
+    if isinstance(wall_time, datetime):
+        # pymongo decodes BSON dates as naive UTC
+        return (wall_time if wall_time.tzinfo else wall_time.replace(tzinfo=timezone.utc)).timestamp()
+    cluster_time = change.get("clusterTime")
+    return cluster_time.time if cluster_time is not None else time.time()
+
+
+class Debouncer:
+    """Pending userIds, each released once no edit has arrived for `quiet` seconds.
+
+    A user who keeps editing is still released `max_delay` seconds after their
+    first pending edit. Entries remember the sequence number and time of that
+    first edit, for checkpointing and lag.
+    """
+
+    def __init__(self, quiet: float, max_delay: float, clock=time.monotonic):
+        self.quiet = quiet
+        self.max_delay = max_delay
+        self.clock = clock
+        self._pending = {}  # user_id -> [due_at, release_by, first_seq, first_event_time]
+        self._heap = []  # (due_at, user_id); entries whose due_at moved on are skipped
+
+    def __len__(self):
+        return len(self._pending)
+
+    def add(self, user_id: str, seq: int, first_event_time: float):
+        now = self.clock()
+        entry = self._pending.get(user_id)
+        if entry is None:
+            entry = self._pending[user_id] = [0.0, now + self.max_delay, seq, first_event_time]
+        entry[0] = min(now + self.quiet, entry[1])
+        heappush(self._heap, (entry[0], user_id))
+
+    def _current(self, item) -> bool:
+        entry = self._pending.get(item[1])
+        return entry is not None and entry[0] == item[0]
+
+    def next_due(self):
+        """Seconds until the next release, or None when nothing is pending."""
+        while self._heap and not self._current(self._heap[0]):
+            heappop(self._heap)
+        return max(0.0, self._heap[0][0] - self.clock()) if self._heap else None
+
+    def pop_due(self) -> list:
+        """[(user_id, first_seq, first_event_time)] for every user whose time has come."""
+        now, due = self.clock(), []
+        while self._heap and self._heap[0][0] <= now:
+            item = heappop(self._heap)
+            if self._current(item):
+                entry = self._pending.pop(item[1])
+                due.append((item[1], entry[2], entry[3]))
+        return due
+
+    def oldest(self):
+        """(smallest first_seq, earliest first_event_time) over pending users, or None."""
+        if not self._pending:
+            return None
+        return min(entry[2] for entry in self._pending.values()), min(entry[3] for entry in self._pending.values())
+
+
+class PrecomputeWorker:
+    """Keeps stored plans in step with edits. source(resume_after) yields change events."""
+
+    def __init__(self, db, source, name: str = "plans", debouncer: Debouncer = None, concurrency: int = CONCURRENCY):
+        self.users = db["users"]
+        self.subjects = db["subjects"]
+        self.plans = db["plans"]
+        self.state = db[STATE_COLLECTION]
+        self.source = source
+        self.name = name
+        self.debouncer = debouncer if debouncer is not None else Debouncer(DEBOUNCE_SECONDS, MAX_DELAY_SECONDS)
+        self.checkpoint = None  # resume token up to which every edit's plan is stored
+        self._saved = None
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._wakeup = asyncio.Event()
+        self._seq = 0
+        self._tokens = deque()  # (seq, resume token) read since the checkpoint
+        self._in_flight = {}  # user_id -> (first_seq, first_event_time)
+        self._tasks = set()
+
+    @property
+    def pending(self) -> int:
+        """Users waiting for a recompute, queued or running."""
+        return len(self.debouncer) + len(self._in_flight)
+
+    def lag_seconds(self) -> float:
+        """Age of the oldest edit whose plan is not stored yet; 0 when caught up."""
+        times = [first_time for _, first_time in self._in_flight.values()]
+        oldest = self.debouncer.oldest()
+        if oldest is not None:
+            times.append(oldest[1])
+        return max(0.0, time.time() - min(times)) if times else 0.0
+
+    async def load_checkpoint(self):
+        doc = await self.state.find_one({"_id": self.name})
+        self.checkpoint = self._saved = doc.get("resumeToken") if doc else None
+
+    def _advance_checkpoint(self):
+        # Everything before the oldest edit still waiting for its plan is done
+        waiting = [first_seq for first_seq, _ in self._in_flight.values()]
+        oldest = self.debouncer.oldest()
+        if oldest is not None:
+            waiting.append(oldest[0])
+        done = min(waiting) - 1 if waiting else self._seq
+        while self._tokens and self._tokens[0][0] <= done:
+            self.checkpoint = self._tokens.popleft()[1]
+
+    async def save_checkpoint(self):
+        self._advance_checkpoint()
+        if self.checkpoint is not None and self.checkpoint != self._saved:
+            await self.state.update_one(
+                {"_id": self.name}, {"$set": {"resumeToken": self.checkpoint, "updatedAt": datetime.utcnow()}}, upsert=True
+            )
+            self._saved = self.checkpoint
+
+    def receive(self, change: dict):
+        self._seq += 1
+        self._tokens.append((self._seq, change["_id"]))
+        if not affects_plan(change):
+            EVENTS.inc(outcome="skipped")
+            return
+        user_id = user_id_for_change(change)
+        if user_id is None:
+            EVENTS.inc(outcome="unmapped")  # e.g. a subject deleted without a pre-image
+            return
+        EVENTS.inc(outcome="queued")
+        self.debouncer.add(user_id, self._seq, event_time(change))
+        self._wakeup.set()
+
+    async def _consume(self):
+        resume_after, delay = self.checkpoint, 0.5
+        while True:
+            try:
+                async for change in self.source(resume_after):
+                    self.receive(change)
+                    resume_after, delay = change["_id"], 0.5
+            except PyMongoError as e:
+                if isinstance(e, OperationFailure) and e.code == CHANGE_STREAM_HISTORY_LOST and resume_after is not None:
+                    # The oplog no longer reaches the token: edits in between are missed
+                    logger.error("Resume token is too old, continuing from now; run python -m app.batch to catch up")
+                    resume_after = None
+                    continue
+                logger.warning("Change stream failed, retrying in %.1fs: %s", delay, e)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, MAX_RETRY_SECONDS)
+
+    async def _dispatch(self):
+        while True:
+            self._wakeup.clear()
+            wait = self.debouncer.next_due()
+            if wait is None or wait > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            for user_id, first_seq, first_time in self.debouncer.pop_due():
+                if user_id in self._in_flight:
+                    # Never two recomputes of one user at once: the older could be stored last
+                    self.debouncer.add(user_id, first_seq, first_time)
+                    continue
+                self._in_flight[user_id] = (first_seq, first_time)
+                task = asyncio.create_task(self._recompute(user_id, first_seq, first_time))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+
+    async def _recompute(self, user_id: str, first_seq: int, first_time: float):
+        try:
+            async with self._semaphore:
+                result = await self.store_plan(user_id)
+            PRECOMPUTED.inc(result=result)
+            if result == "stored":
+                EDIT_TO_PLAN_SECONDS.observe(time.time() - first_time)
+        except PyMongoError as e:
+            # Tried again after the debounce window; the checkpoint stays before the edit
+            logger.warning("Precomputing the plan for %s failed, will retry: %s", user_id, e)
+            PRECOMPUTED.inc(result="retry")
+            self.debouncer.add(user_id, first_seq, first_time)
+            self._wakeup.set()
+        except Exception:
+            logger.exception("Precomputing the plan for %s failed", user_id)
+            PRECOMPUTED.inc(result="error")
+        finally:
+            del self._in_flight[user_id]
+
+    async def store_plan(self, user_id: str) -> str:
+        """Plans the user from their current inputs and stores it. Returns what happened."""
+        try:
+            user_obj_id = ObjectId(user_id)
+        except InvalidId:
+            return "invalid"
+        today = datetime.today().date()
+        try:
+            learning_times, subjects = await load_async(self.users, self.subjects, user_obj_id, today)
+        except UserNotFound:
+            return "missing"
+        fingerprint = plan_fingerprint(learning_times, subjects)
+        plan = build_plan(user_obj_id, learning_times, subjects, today, DEFAULT_STRATEGY, fingerprint)
+        if "entries" not in plan:
+            return "no_plan"
+        await save_plan_async(self.plans, user_obj_id, fingerprint, plan, today, DEFAULT_STRATEGY)
+        return "stored"
+
+    async def _checkpoint_periodically(self):
+        while True:
+            await asyncio.sleep(CHECKPOINT_SECONDS)
+            try:
+                await self.save_checkpoint()
+            except PyMongoError as e:
+                logger.warning("Could not save the resume token: %s", e)
+
+    async def run(self):
+        """Runs until cancelled, then saves the checkpoint. Edits still pending are replayed on restart."""
+        await self.load_checkpoint()
+        logger.info("Precompute worker %r %s", self.name, "resuming" if self.checkpoint else "starting from now")
+        loops = [
+            asyncio.create_task(self._consume()),
+            asyncio.create_task(self._dispatch()),
+            asyncio.create_task(self._checkpoint_periodically()),
+        ]
+        try:
+            await asyncio.gather(*loops)
+        finally:
+            for task in loops:
+                task.cancel()
+            try:
+                await self.save_checkpoint()
+            except PyMongoError as e:
+                logger.warning("Could not save the resume token: %s", e)
+            for task in list(self._tasks):
+                task.cancel()
+            await asyncio.gather(*loops, *self._tasks, return_exceptions=True)
+
+
+async def _metrics_handler(reader, writer):
+    try:
+        await reader.readuntil(b"\r\n\r\n")
+        body = render_metrics().encode("utf-8")
+        writer.write(
+            f"HTTP/1.1 200 OK\r\nContent-Type: {CONTENT_TYPE}\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode()
+            + body
+        )
+        await writer.drain()
+    except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    init_async_client()
+    db = get_async_db()
+    worker = PrecomputeWorker(db, mongo_change_source(db), name=os.getenv("PRECOMPUTE_WORKER_NAME", "plans"))
+    GaugeFunction("precompute_lag_seconds", "Age of the oldest edit whose plan is not stored yet.", worker.lag_seconds)
+    GaugeFunction("precompute_pending_users", "Users waiting for a recompute.", lambda: worker.pending)
+
+    server = None
+    if METRICS_PORT:
+        server = await asyncio.start_server(_metrics_handler, "0.0.0.0", METRICS_PORT)
+        logger.info("Serving metrics on :%d", METRICS_PORT)
+
+    task = asyncio.current_task()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        asyncio.get_running_loop().add_signal_handler(sig, task.cancel)
+    try:
+        await worker.run()
+    except asyncio.CancelledError:
+        logger.info("Precompute worker stopped")
+    finally:
+        if server is not None:
+            server.close()
+        close_async_client()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,172 @@
+# Admission control for the plan endpoints.
+# Token buckets per userId and per client IP cap how fast one caller can ask for
+# plans, and a concurrency gate caps how many plan requests run at once and how
+# many may queue behind them. Both reject in microseconds: 429 with Retry-After
+# for a caller over its rate, 503 when the server is saturated. When the gate is
+# full, a plan request whose user has a recent plan in the cache is answered with
+# that stale plan instead (see PlanCache.stale).
+#
+# Buckets live in process by default. Implement RateLimitBackend (e.g. with an
+# atomic Redis script) to share them across workers and instances.
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+from app.metrics import Counter
+
+ADMISSION_REJECTIONS = Counter(
+    "admission_rejections_total", "Requests turned away or degraded by admission control.", ("reason",)
+)
+
+
+class RateLimited(Exception):
+    def __init__(self, scope: str, retry_after: float):
+        super().__init__(f"Too many requests for this {scope}.")
+        self.scope = scope
+        self.retry_after = retry_after
+
+
+class Overloaded(Exception):
+    def __init__(self, retry_after: float = 1.0):
+        super().__init__("The server is busy. Try again shortly.")
+        self.retry_after = retry_after
+
+
+class RateLimitBackend:
+    """Token bucket storage. Implement it to share limits across processes."""
+
+    def take(self, key: str, rate: float, burst: float, cost: float = 1.0) -> float:
+        """Atomically takes cost tokens from key's bucket.
+
+        Returns 0 when they were taken, otherwise the seconds until enough
+        tokens will have refilled (and takes nothing).
+        """
+        raise NotImplementedError
+
+
+class InMemoryBuckets(RateLimitBackend):
+    """Per-process buckets. The least recently used are dropped past max_keys, which refills them."""
+
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # key -> (tokens, updated_at)
+        self._lock = threading.Lock()
+
+    def take(self, key: str, rate: float, burst: float, cost: float = 1.0) -> float:
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.pop(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated_at) * rate)
+            wait = 0.0
+            if tokens >= cost:
+                tokens -= cost
+            else:
+                wait = (cost - tokens) / rate
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return wait
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class TokenBucketLimiter:
+    """rate requests per second on average per key, with bursts of up to burst. rate <= 0 disables it."""
+
+    def __init__(self, scope: str, rate: float, burst: float, backend: RateLimitBackend = None):
+        self.scope = scope
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.backend = backend if backend is not None else InMemoryBuckets()
+
+    def check(self, key: str):
+        """Raises RateLimited when key is over its rate."""
+        if self.rate <= 0 or not key:
+            return
+        wait = self.backend.take(f"{self.scope}:{key}", self.rate, self.burst)
+        if wait > 0:
+            ADMISSION_REJECTIONS.inc(reason=f"{self.scope}_rate")
+            raise RateLimited(self.scope, wait)
+
+
+class ConcurrencyGate:
+    """Lets `limit` requests run at once and up to `max_waiting` wait, each for at most `timeout` seconds.
+
+    Use as `async with gate:`; entering raises Overloaded when the queue is full
+    or the wait times out. limit <= 0 disables it.
+    """
+
+    def __init__(self, limit: int, max_waiting: int, timeout: float):
+        self.limit = limit
+        self.max_waiting = max_waiting
+        self.timeout = timeout
+        self.active = 0
+        self._waiters = deque()  # futures of queued requests, oldest first
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    async def __aenter__(self):
+        if self.limit <= 0:
+            return self
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            return self
+        if len(self._waiters) >= self.max_waiting:
+            ADMISSION_REJECTIONS.inc(reason="queue_full")
+            raise Overloaded(self.timeout or 1.0)
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            # A finishing request hands its slot over by resolving the future
+            await asyncio.wait_for(waiter, self.timeout)
+        except asyncio.TimeoutError:
+            ADMISSION_REJECTIONS.inc(reason="queue_timeout")
+            raise Overloaded(self.timeout or 1.0)
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self._release()  # handed a slot just as the request went away
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+        return self
+
+    def _release(self):
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)  # the slot passes on; active stays the same
+                return
+        self.active -= 1
+
+    async def __aexit__(self, *exc_info):
+        if self.limit > 0:
+            self._release()
+        return False
+
+
+def _float_env(name: str, default: float) -> float:
+    return float(os.getenv(name, str(default)))
+
+
+# One backend for both limiters; keys are prefixed with the scope. The per-IP
+# limit is off unless configured: behind a proxy that is not trusted through
+# FORWARDED_ALLOW_IPS every client shares the proxy's address.
+rate_limit_backend = InMemoryBuckets(max_keys=int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000")))
+user_limiter = TokenBucketLimiter(
+    "user", _float_env("RATE_LIMIT_USER_PER_SECOND", 1.0), _float_env("RATE_LIMIT_USER_BURST", 10), rate_limit_backend
+)
+ip_limiter = TokenBucketLimiter(
+    "ip", _float_env("RATE_LIMIT_IP_PER_SECOND", 0.0), _float_env("RATE_LIMIT_IP_BURST", 100), rate_limit_backend
+)
+plan_gate = ConcurrencyGate(
+    int(os.getenv("PLAN_MAX_CONCURRENCY", "32")),
+    int(os.getenv("PLAN_MAX_WAITING", "128")),
+    _float_env("PLAN_QUEUE_TIMEOUT_SECONDS", 1.0),
+)
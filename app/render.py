@@ -0,0 +1,95 @@
+# Turning structured plans into responses.
+# Text lines are only built when a client asks for format=text; everything
+# else is serialized straight from the plan entries.
+import json
+from datetime import date
+
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+try:
+    import orjson
+except ImportError:  # optional, falls back to the stdlib encoder
+    orjson = None
+
+from app.slots import minutes_to_hours
+
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack")
+SSE_MEDIA_TYPE = "text/event-stream"
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+def encode_json(content) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content).encode("utf-8")
+
+
+def render_warning(warning: dict) -> str:
+    return (
+        f"Warning: {warning['subject']} needs {minutes_to_hours(warning['required_minutes'])} hrs "
+        f"(with earlier exams) before {warning['exam_date']} but only "
+        f"{minutes_to_hours(warning['available_minutes'])} hrs are available."
+    )
+
+
+def render_entry(entry: dict, start_date: date) -> str:
+    if entry["unscheduled"]:
+        return f"Could not fit topic '{entry['topic']}' from '{entry['subject']}' in available slots."
+    # Day N is the Nth calendar day from the plan's start date
+    day = (date.fromisoformat(entry["date"]) - start_date).days + 1
+    return (
+        f"Day {day}: Subject {entry['subject']} - {entry['topic']} in {entry['start']} - {entry['end']}, "
+        f"allocated {minutes_to_hours(entry['minutes'])} hrs"
+    )
+
+
+def render_text(plan: dict) -> list:
+    """The plan as the human-readable study_plan lines older clients expect."""
+    start_date = date.fromisoformat(plan["start_date"])
+    lines = [render_warning(warning) for warning in plan["warnings"]]
+    lines.extend(render_entry(entry, start_date) for entry in plan["entries"])
+    return lines
+
+
+class ORJSONResponse(JSONResponse):
+    def render(self, content) -> bytes:
+        return orjson.dumps(content)
+
+
+def msgpack_media_type(accept: str = None):
+    """The msgpack media type the Accept header asks for, or None for JSON."""
+    accept = (accept or "").lower()
+    return next((m for m in MSGPACK_MEDIA_TYPES if m in accept), None)
+
+
+def plan_response(content: dict, accept: str = None) -> Response:
+    """Serializes content as msgpack when the client asks for it, JSON otherwise."""
+    media_type = msgpack_media_type(accept)
+    if media_type is not None:
+        try:
+            import msgpack
+        except ImportError:
+            raise HTTPException(status_code=406, detail="msgpack responses are not available on this server.")
+        return Response(msgpack.packb(content, use_bin_type=True), media_type=media_type)
+    if orjson is not None:
+        return ORJSONResponse(content)
+    return JSONResponse(content)
+
+
+def ndjson_lines(blocks):
+    for block in blocks:
+        yield encode_json(block) + b"\n"
+
+
+def sse_events(blocks):
+    # Each block becomes one server-sent event named after its type
+    for block in blocks:
+        yield b"event: " + block["type"].encode("ascii") + b"\ndata: " + encode_json(block) + b"\n\n"
+
+
+def stream_response(blocks, accept: str = None) -> StreamingResponse:
+    """Streams plan blocks as SSE when the client accepts it, NDJSON otherwise."""
+    if SSE_MEDIA_TYPE in (accept or "").lower():
+        return StreamingResponse(sse_events(blocks), media_type=SSE_MEDIA_TYPE, headers={"Cache-Control": "no-cache"})
+    return StreamingResponse(ndjson_lines(blocks), media_type=NDJSON_MEDIA_TYPE)
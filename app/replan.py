@@ -0,0 +1,265 @@
+# Incremental replanning.
+# A PlanState keeps the calendar's remaining capacity and every subject's
+# placements, so an edit to one subject only frees and re-places that subject
+# (and, if it no longer fits, the later-deadline subjects it displaces).
+# roll() carries a state over to the next day for the nightly rollover.
+import hashlib
+import json
+from datetime import date, timedelta
+
+from app.engine import (
+    URGENT_DAYS_LEFT,
+    CapacityCalendar,
+    Placement,
+    Subject,
+    allocate_edf,
+    check_deadlines,
+    horizon_for,
+    normalize_subjects,
+    plan_entries,
+)
+from app.slots import parse_learning_slots
+
+
+def subject_digest(subject: Subject) -> str:
+    payload = json.dumps(
+        [subject.name, subject.days_left, subject.topic_minutes, subject.topics],
+        separators=(",", ":"),
+    )
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+class SubjectState(Subject):
+    """A subject together with its placements in the stored allocation."""
+
+    __slots__ = ("digest", "placements")
+
+    def __init__(self, subject: Subject, digest: str = None):
+        super().__init__(
+            subject.id, subject.name, subject.topics, subject.difficulty, subject.days_left, subject.topic_minutes
+        )
+        self.digest = digest if digest is not None else subject_digest(subject)
+        self.placements = []
+
+
+class PlanState:
+    def __init__(self, learning_times: list, calendar: CapacityCalendar, subjects: dict):
+        self.learning_times = learning_times
+        self.learning_slots = parse_learning_slots(tuple(learning_times))
+        self.calendar = calendar
+        self.subjects = subjects  # subject id -> SubjectState
+
+    @classmethod
+    def build(cls, learning_times: list, user_subjects: list, today: date) -> "PlanState":
+        """Full earliest-deadline-first allocation, recorded per subject."""
+        learning_slots = parse_learning_slots(tuple(learning_times))
+        urgent, normal = normalize_subjects(user_subjects, today)
+        subjects = urgent + normal
+        calendar = CapacityCalendar(
+            [slot.minutes for slot in learning_slots], horizon_for(subjects), today + timedelta(days=1)
+        )
+        records = {subject.id: SubjectState(subject) for subject in subjects}
+        for placement in allocate_edf(calendar, subjects):
+            records[placement.subject_id].placements.append(placement)
+        return cls(learning_times, calendar, records)
+
+    def matches(self, learning_times: list, today: date) -> bool:
+        """Whether this state can be patched, i.e. same day and same routine."""
+        return self.calendar.start == today + timedelta(days=1) and self.learning_times == list(learning_times)
+
+    def _free(self, record: SubjectState):
+        for placement in record.placements:
+            if placement.scheduled:
+                self.calendar.release(placement.day, placement.slot, placement.minutes)
+        record.placements = []
+
+    def _place(self, record: SubjectState, topics=None):
+        # First fit by day: each topic goes to the earliest day before the exam with room
+        minutes = record.topic_minutes
+        for topic in record.topics if topics is None else topics:
+            day = self.calendar.find_day(minutes, record.days_left)
+            slot = None if day is None else self.calendar.take(day, minutes)
+            record.placements.append(Placement(day, slot, record.name, topic, minutes, subject_id=record.id))
+
+    def _unscheduled_topics(self, record: SubjectState) -> list:
+        return [p.topic for p in record.placements if not p.scheduled]
+
+    def _drop_unscheduled(self, record: SubjectState):
+        record.placements = [p for p in record.placements if p.scheduled]
+
+    def _displace(self, short: list, touched: set):
+        # Frees every untouched subject with a later exam than the short ones,
+        # places the short subjects' missing topics, then re-places the freed
+        if not short:
+            return
+        cutoff = min(record.days_left for record in short)
+        displaced = sorted(
+            (r for r in self.subjects.values() if r.days_left > cutoff and r.id not in touched),
+            key=lambda record: record.days_left,
+        )
+        # A rolled state no longer holds the topics already studied, so only what was placed goes back
+        displaced_topics = [[placement.topic for placement in record.placements] for record in displaced]
+        for record in displaced:
+            self._free(record)
+            touched.add(record.id)
+        for record in short:
+            topics = self._unscheduled_topics(record)
+            self._drop_unscheduled(record)
+            self._place(record, topics)
+        for record, topics in zip(displaced, displaced_topics):
+            self._place(record, topics)
+
+    def roll(self, today: date) -> list:
+        """Moves a state built on an earlier day forward to today without planning it again.
+
+        Days that have begun are dropped and the topics booked on them count as
+        studied. Subjects whose exam has come are dropped too. Only subjects that
+        have just become urgent are placed again, ahead of later exams. Returns
+        the ids of the subjects placed again.
+        """
+        days = (today + timedelta(days=1) - self.calendar.start).days
+        if days <= 0:
+            return []
+        self.calendar.advance(days)
+
+        crossed = []
+        for subject_id in list(self.subjects):
+            record = self.subjects[subject_id]
+            was_urgent = record.days_left <= URGENT_DAYS_LEFT
+            record.days_left -= days
+            if record.days_left <= 0:
+                del self.subjects[subject_id]
+                continue
+            kept = []
+            for placement in record.placements:
+                if placement.scheduled:
+                    if placement.day < days:
+                        continue
+                    placement.day -= days
+                kept.append(placement)
+            record.placements = kept
+            # topics keeps every topic, so the digest still matches the subject's document
+            record.digest = subject_digest(record)
+            if not was_urgent and record.days_left <= URGENT_DAYS_LEFT:
+                crossed.append(record)
+
+        touched = set()
+        for record in crossed:
+            topics = [placement.topic for placement in record.placements]
+            self._free(record)
+            self._place(record, topics)
+            touched.add(record.id)
+        self._displace([record for record in crossed if self._unscheduled_topics(record)], touched)
+        return sorted(touched)
+
+    def update(self, user_subjects: list, today: date) -> list:
+        """Applies the current subjects to the stored allocation and returns the ids that were re-placed."""
+        urgent, normal = normalize_subjects(user_subjects, today)
+        current = {subject.id: subject for subject in urgent + normal}
+
+        touched = set()
+        for subject_id in list(self.subjects):
+            if subject_id not in current:
+                self._free(self.subjects.pop(subject_id))
+                touched.add(subject_id)
+
+        changed = []
+        for subject_id, subject in current.items():
+            digest = subject_digest(subject)
+            record = self.subjects.get(subject_id)
+            if record is not None and record.digest == digest:
+                continue
+            if record is not None:
+                self._free(record)
+            record = SubjectState(subject, digest)
+            self.subjects[subject_id] = record
+            changed.append(record)
+            touched.add(subject_id)
+
+        if not touched:
+            return []
+
+        self.calendar.extend(horizon_for(list(current.values())))
+        changed.sort(key=lambda record: record.days_left)
+        for record in changed:
+            self._place(record)
+
+        # A changed subject that no longer fits displaces subjects with later exams
+        self._displace([record for record in changed if self._unscheduled_topics(record)], touched)
+
+        # Freed capacity may now fit topics that were left out before
+        for record in sorted(self.subjects.values(), key=lambda record: record.days_left):
+            topics = self._unscheduled_topics(record)
+            if topics and record.id not in touched:
+                self._drop_unscheduled(record)
+                self._place(record, topics)
+                if len(self._unscheduled_topics(record)) < len(topics):
+                    touched.add(record.id)
+
+        return sorted(touched)
+
+    def placements(self) -> list:
+        return [placement for record in self.subjects.values() for placement in record.placements]
+
+    def to_plan(self, user_id: str) -> dict:
+        """The same shape build_plan returns, plus a revision.
+
+        A patched plan can differ from a fresh one for the same inputs, so the
+        revision (a digest of the entries) tells the two apart in ETags.
+        """
+        subjects = list(self.subjects.values())
+        fresh = CapacityCalendar(self.calendar.slot_minutes, horizon_for(subjects), self.calendar.start)
+        entries = plan_entries(self.placements(), self.calendar, self.learning_slots)
+        revision = hashlib.sha1(json.dumps(entries, separators=(",", ":")).encode("utf-8")).hexdigest()[:16]
+        return {
+            "user_id": user_id,
+            "learning_times": list(self.learning_times),
+            "start_date": self.calendar.start.isoformat(),
+            "entries": entries,
+            "warnings": check_deadlines(fresh, subjects),
+            "revision": revision,
+        }
+
+    def to_document(self) -> dict:
+        subjects = []
+        for record in self.subjects.values():
+            stored = record.to_dict()
+            stored["digest"] = record.digest
+            stored["placements"] = [[p.day, p.slot, p.topic, p.minutes] for p in record.placements]
+            subjects.append(stored)
+        return {
+            "startDate": self.calendar.start.isoformat(),
+            "learningTimes": list(self.learning_times),
+            "slotMinutes": self.calendar.slot_minutes,
+            "remaining": self.calendar.remaining.tolist(),
+            "subjects": subjects,
+        }
+
+    @classmethod
+    def from_document(cls, doc: dict) -> "PlanState":
+        calendar = CapacityCalendar.from_remaining(
+            doc["slotMinutes"], doc["remaining"], date.fromisoformat(doc["startDate"])
+        )
+        subjects = {}
+        for stored in doc["subjects"]:
+            record = SubjectState(Subject.from_dict(stored), stored["digest"])
+            record.placements = [
+                Placement(day, slot, record.name, topic, minutes, subject_id=record.id)
+                for day, slot, topic, minutes in stored["placements"]
+            ]
+            subjects[record.id] = record
+        return cls(doc["learningTimes"], calendar, subjects)
+
+
+def replan(state_doc, learning_times: list, user_subjects: list, today: date, current: bool = True):
+    """Patches a stored state when possible, otherwise rebuilds it.
+
+    Returns (state, mode, touched subject ids), mode being "incremental",
+    "full", or "rebuilt" when the state was not current (see plan_store.stored_state).
+    """
+    if state_doc and current:
+        state = PlanState.from_document(state_doc)
+        if state.matches(learning_times, today):
+            return state, "incremental", state.update(user_subjects, today)
+    state = PlanState.build(learning_times, user_subjects, today)
+    return state, "rebuilt" if state_doc and not current else "full", sorted(state.subjects)
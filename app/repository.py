@@ -0,0 +1,139 @@
+# Data access for the planners: fetches everything a plan needs in one round trip.
+from datetime import date, datetime, time
+
+from bson import ObjectId
+from pymongo import ASCENDING
+from pymongo.collection import Collection
+
+from app.plan_store import STATE_PROJECTION, stored_state
+
+# Only the fields the planners read are sent back by the server
+SUBJECT_PROJECTION = {
+    "subjectName": 1,
+    "examDate": 1,
+    "examDifficulty": 1,
+    "topics.name": 1,
+}
+
+# (keys, options) for indexes the plan queries rely on
+SUBJECT_INDEXES = [
+    ([("userId", ASCENDING), ("examDate", ASCENDING)], {"name": "userId_1_examDate_1"}),
+]
+
+PLAN_INDEXES = [
+    ([("userId", ASCENDING)], {"name": "userId_1", "unique": True}),
+    # Stored plans are removed once expiresAt has passed, unless the document
+    # also holds a replanning state, which outlives the plan it was stored with
+    ([("expiresAt", ASCENDING)], {
+        "name": "expiresAt_1", "expireAfterSeconds": 0, "partialFilterExpression": {"hasState": False},
+    }),
+]
+
+
+def plan_inputs_pipeline(user_obj_id: ObjectId, subjects_collection_name: str, today: date) -> list:
+    """Aggregation returning the user's learning times and upcoming subjects."""
+    today_start = datetime.combine(today, time.min)
+    return [
+        {"$match": {"_id": user_obj_id}},
+        {"$project": {
+            "learningTimes": {
+                "$map": {
+                    "input": {
+                        "$filter": {
+                            "input": {"$ifNull": ["$dailyRoutine", []]},
+                            "as": "routine",
+                            "cond": {"$eq": ["$$routine.action", "learning"]},
+                        }
+                    },
+                    "as": "routine",
+                    "in": "$$routine.time",
+                }
+            },
+        }},
+        {"$lookup": {
+            "from": subjects_collection_name,
+            "localField": "_id",
+            "foreignField": "userId",
+            "pipeline": [
+                {"$match": {"examDate": {"$gt": today_start}}},
+                # _id breaks ties, so the subjects (and the fingerprint) come back in one order
+                {"$sort": {"examDate": 1, "_id": 1}},
+                {"$project": SUBJECT_PROJECTION},
+            ],
+            "as": "subjects",
+        }},
+    ]
+
+
+def _unpack(doc):
+    if doc is None:
+        return None
+    learning_times = [t for t in doc.get("learningTimes") or [] if t]
+    return learning_times, doc.get("subjects") or []
+
+
+def load_plan_inputs(users_collection: Collection, subjects_collection: Collection, user_obj_id: ObjectId, today: date):
+    """Returns (learning_times, subjects) for the user, or None if the user does not exist."""
+    pipeline = plan_inputs_pipeline(user_obj_id, subjects_collection.name, today)
+    docs = list(users_collection.aggregate(pipeline))
+    return _unpack(docs[0] if docs else None)
+
+
+async def load_plan_inputs_async(users_collection, subjects_collection, user_obj_id: ObjectId, today: date):
+    pipeline = plan_inputs_pipeline(user_obj_id, subjects_collection.name, today)
+    docs = await users_collection.aggregate(pipeline).to_list(length=1)
+    return _unpack(docs[0] if docs else None)
+
+
+def _learning_times(daily_routine) -> list:
+    return [
+        routine.get("time")
+        for routine in daily_routine or []
+        if routine.get("action") == "learning" and routine.get("time")
+    ]
+
+
+def load_plan_inputs_bulk(users_collection: Collection, subjects_collection: Collection, user_obj_ids, today: date, chunk_size: int = 500):
+    """Yields (user_obj_id, (learning_times, subjects)) using two $in queries per chunk.
+
+    Users that do not exist are skipped.
+    """
+    today_start = datetime.combine(today, time.min)
+    projection = dict(SUBJECT_PROJECTION, userId=1)
+    user_obj_ids = list(user_obj_ids)
+
+    for i in range(0, len(user_obj_ids), chunk_size):
+        chunk = user_obj_ids[i:i + chunk_size]
+        users = users_collection.find({"_id": {"$in": chunk}}, {"dailyRoutine": 1})
+        learning_times = {user["_id"]: _learning_times(user.get("dailyRoutine")) for user in users}
+
+        subjects_by_user = {user_obj_id: [] for user_obj_id in learning_times}
+        subjects = subjects_collection.find(
+            {"userId": {"$in": list(learning_times)}, "examDate": {"$gt": today_start}},
+            projection,
+        ).sort([("examDate", ASCENDING), ("_id", ASCENDING)])
+        for subject in subjects:
+            subjects_by_user[subject.pop("userId")].append(subject)
+
+        for user_obj_id in chunk:
+            if user_obj_id in learning_times:
+                yield user_obj_id, (learning_times[user_obj_id], subjects_by_user[user_obj_id])
+
+
+async def load_plan_state_async(plans_collection, user_obj_id: ObjectId):
+    """(state, current) for the user; see plan_store.stored_state."""
+    return stored_state(await plans_collection.find_one({"userId": user_obj_id}, STATE_PROJECTION))
+
+
+def ensure_indexes(db):
+    for keys, options in SUBJECT_INDEXES:
+        db["subjects"].create_index(keys, **options)
+    for keys, options in PLAN_INDEXES:
+        db["plans"].create_index(keys, **options)
+
+
+async def ensure_indexes_async(db):
+    for keys, options in SUBJECT_INDEXES:
+        await db["subjects"].create_index(keys, **options)
+    for keys, options in PLAN_INDEXES:
+        await db["plans"].create_index(keys, **options)
@@ -0,0 +1,150 @@
+# Nightly rollover of stored plans.
+# Just after midnight every stored plan is a day old, so each user's first
+# request of the morning would plan them again. The rollover moves each stored
+# plan state forward by a day instead (PlanState.roll): the day that has begun is
+# dropped, the topics booked on it counting as studied, and only subjects that
+# have just become urgent, or that the user edited, are placed again. Users get
+# a random offset within the window, so the load is spread over the night
+# instead of arriving in one burst.
+#
+#   python -m app.rollover                   # from cron, shortly after midnight
+#   python -m app.rollover --window 0        # every user at once
+import argparse
+import os
+import random
+import sys
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+from pymongo import UpdateOne
+
+from app.batch import peak_memory_mb
+from app.cache import plan_fingerprint
+from app.db import close_client, get_db
+from app.plan_store import STATE_PROJECTION, plan_update, stored_state
+from app.planner import DEFAULT_STRATEGY
+from app.replan import PlanState
+from app.repository import load_plan_inputs_bulk
+
+ROLLOVER_WINDOW_SECONDS = float(os.getenv("ROLLOVER_WINDOW_SECONDS", str(4 * 60 * 60)))
+DEFAULT_CHUNK_SIZE = 200
+
+
+def stale_plans(plans_collection, today) -> list:
+    """{userId, date} of every plans document that was not built for today."""
+    return list(plans_collection.find({"date": {"$ne": today.isoformat()}}, {"userId": 1, "date": 1}))
+
+
+def spread(docs: list, window: float, rng: random.Random) -> list:
+    """(offset seconds, doc) pairs with offsets drawn uniformly over the window, earliest first."""
+    return sorted(((rng.uniform(0, window), doc) for doc in docs), key=lambda pair: pair[0])
+
+
+def roll_state(state_doc, learning_times: list, user_subjects: list, today, current: bool = True):
+    """(state, outcome): the stored state moved forward to today, or a new one.
+
+    outcome is "rolled" when the stored state could be reused and "rebuilt"
+    when there was none, it was not current (see plan_store.stored_state) or
+    the user's routine changed.
+    """
+    if state_doc and current:
+        state = PlanState.from_document(state_doc)
+        if state.learning_times == list(learning_times) and state.calendar.start <= today + timedelta(days=1):
+            state.roll(today)
+            state.update(user_subjects, today)
+            return state, "rolled"
+    return PlanState.build(learning_times, user_subjects, today), "rebuilt"
+
+
+def roll_chunk(plans_collection, users_collection, subjects_collection, docs: list, today) -> Counter:
+    """Rolls one chunk of users forward and writes their plans. Returns the outcome counts.
+
+    A user that cannot be planned is counted as failed and keeps yesterday's plan.
+    """
+    outcomes = Counter()
+    dates = {doc["userId"]: doc.get("date") for doc in docs}
+    states = {
+        doc["userId"]: stored_state(doc)
+        for doc in plans_collection.find({"userId": {"$in": list(dates)}}, dict(STATE_PROJECTION, userId=1))
+    }
+    ops = []
+    loaded = set()
+    for user_obj_id, (learning_times, subjects) in load_plan_inputs_bulk(
+        users_collection, subjects_collection, list(dates), today, len(dates)
+    ):
+        loaded.add(user_obj_id)
+        if not learning_times:
+            outcomes["no_slots"] += 1
+            continue
+        try:
+            state_doc, current = states.get(user_obj_id, (None, True))
+            state, outcome = roll_state(state_doc, learning_times, subjects, today, current)
+            # The plan carries the state's revision, so its ETag differs from a fresh plan's for the same inputs
+            _, update = plan_update(
+                user_obj_id, plan_fingerprint(learning_times, subjects), state.to_plan(str(user_obj_id)), today,
+                DEFAULT_STRATEGY, state.to_document(),
+            )
+        except Exception as e:
+            # One user's bad routine or subject must not stop the rest of the night's run
+            print(f"Could not roll userId {user_obj_id}: {e}", file=sys.stderr)
+            outcomes["failed"] += 1
+            continue
+        outcomes[outcome] += 1
+        # Matches nothing if a request stored a newer plan for the user since the chunk was listed
+        ops.append(UpdateOne({"userId": user_obj_id, "date": dates[user_obj_id]}, update))
+    outcomes["missing"] += len(dates) - len(loaded)
+    if ops:
+        result = plans_collection.bulk_write(ops, ordered=False)
+        outcomes["superseded"] += len(ops) - result.matched_count
+    return outcomes
+
+
+def run_rollover(
+    db,
+    today=None,
+    window: float = ROLLOVER_WINDOW_SECONDS,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    rng: random.Random = None,
+    sleep=time.sleep,
+    clock=time.monotonic,
+) -> Counter:
+    """Rolls every stale stored plan forward to today, spread over window seconds.
+
+    Users are taken in chunks in the order of their offsets; a chunk starts once
+    its first user's offset has passed.
+    """
+    today = today or datetime.today().date()
+    rng = rng or random.Random()
+    scheduled = spread(stale_plans(db["plans"], today), window, rng)
+    started = clock()
+    outcomes = Counter()
+    for i in range(0, len(scheduled), chunk_size):
+        chunk = scheduled[i:i + chunk_size]
+        delay = started + chunk[0][0] - clock()
+        if delay > 0:
+            sleep(delay)
+        outcomes += roll_chunk(db["plans"], db["users"], db["subjects"], [doc for _, doc in chunk], today)
+    return outcomes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Move every stored plan forward to today.")
+    parser.add_argument("--window", type=float, default=ROLLOVER_WINDOW_SECONDS, help="Seconds to spread the users over.")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Users loaded and written together.")
+    parser.add_argument("--seed", type=int, help="Seed for the offsets, for repeatable runs.")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    try:
+        outcomes = run_rollover(get_db(), window=args.window, chunk_size=args.chunk_size, rng=random.Random(args.seed))
+    finally:
+        close_client()
+
+    elapsed = time.perf_counter() - started
+    summary = ", ".join(f"{count} {outcome}" for outcome, count in sorted(outcomes.items())) or "nothing to roll"
+    print(f"Rollover: {summary} in {elapsed:.2f}s, peak memory {peak_memory_mb()} MB", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
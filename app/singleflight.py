@@ -0,0 +1,36 @@
+# Single-flight request coalescing.
+# Concurrent callers asking for the same key share one in-flight computation
+# instead of each running it. The computation runs as its own task, so a caller
+# that disconnects does not cancel it for the others.
+import asyncio
+
+from app.metrics import Counter
+
+FLIGHT_CALLS = Counter("singleflight_calls_total", "Coalesced calls by flight and role (leader ran it, coalesced waited).", ("flight", "role"))
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._calls = {}  # key -> running task
+
+    def _forget(self, key, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            task.exception()  # mark as retrieved even if every caller went away
+
+    async def do(self, key, fn):
+        """Awaits fn() once per key at a time; callers arriving meanwhile get the same result or exception."""
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+            FLIGHT_CALLS.inc(flight=self.name, role="leader")
+        else:
+            FLIGHT_CALLS.inc(flight=self.name, role="coalesced")
+        return await asyncio.shield(task)
+
+    def in_flight(self) -> int:
+        return len(self._calls)
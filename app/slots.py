@@ -0,0 +1,63 @@
+# Learning slot model shared by the planners.
+# dailyRoutine time ranges ("HH:MM - HH:MM") are parsed once into integer minutes,
+# so plan arithmetic is exact and no strptime runs while planning.
+from functools import lru_cache
+
+MINUTES_PER_DAY = 24 * 60
+
+
+class Slot:
+    """A daily learning window. Shared between cached parses, so treat it as read-only."""
+
+    __slots__ = ("time", "start", "end", "minutes")
+
+    def __init__(self, time: str, start: int, end: int):
+        self.time = time  # original "HH:MM - HH:MM" label
+        self.start = start  # minutes after midnight
+        self.end = end
+        # Ranges such as "22:00 - 01:00" wrap past midnight
+        self.minutes = (end - start) % MINUTES_PER_DAY
+
+    def __repr__(self):
+        return f"Slot({self.time!r}, minutes={self.minutes})"
+
+
+def parse_clock(value: str) -> int:
+    """Converts 'HH:MM' to minutes after midnight."""
+    value = value.strip()
+    hours, sep, minutes = value.partition(":")
+    if not sep or not hours.isdigit() or not minutes.isdigit() or len(minutes) != 2:
+        raise ValueError(f"Invalid time {value!r}. Expected HH:MM.")
+    hours, minutes = int(hours), int(minutes)
+    if hours > 23 or minutes > 59:
+        raise ValueError(f"Invalid time {value!r}. Expected HH:MM.")
+    return hours * 60 + minutes
+
+
+def format_clock(minutes: int) -> str:
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def parse_time_range(time_range: str) -> Slot:
+    start_str, sep, end_str = time_range.partition("-")
+    if not sep:
+        raise ValueError(f"Invalid learning slot {time_range!r}. Expected 'HH:MM - HH:MM'.")
+    slot = Slot(time_range, parse_clock(start_str), parse_clock(end_str))
+    if slot.minutes == 0:
+        raise ValueError(f"Invalid learning slot {time_range!r}. Start and end times are equal.")
+    return slot
+
+
+@lru_cache(maxsize=4096)
+def parse_learning_slots(time_ranges: tuple) -> tuple:
+    """Parses a user's learning time ranges; repeated routines come from the cache."""
+    return tuple(parse_time_range(time_range) for time_range in time_ranges)
+
+
+def minutes_to_hours(minutes: int) -> float:
+    return round(minutes / 60, 2)
+
+
+def time_range_to_hours(time_range: str) -> float:
+    """Converts 'HH:MM - HH:MM' to float hours"""
+    return minutes_to_hours(parse_time_range(time_range).minutes)
@@ -0,0 +1,189 @@
+# Solver-backed allocation.
+# First-fit placement gives up on a topic as soon as no single slot has room for
+# all of it, even when the days before the exam have enough time in total. Here
+# topic minutes may be split across slots, and a max-flow from exam days to
+# study days decides how much of every topic can be scheduled at all.
+import logging
+import os
+import time
+from itertools import groupby
+
+from app.engine import CapacityCalendar, Placement, Subject, allocate_edf
+
+logger = logging.getLogger(__name__)
+
+SOLVER_TIME_BUDGET_MS = int(os.getenv("PLAN_SOLVER_TIME_BUDGET_MS", "200"))
+
+
+class SolverTimeout(Exception):
+    pass
+
+
+class FlowNetwork:
+    """Directed graph with integer capacities; max_flow uses Dinic's algorithm.
+
+    Edges are [to, capacity, index of the reverse edge in graph[to]].
+    """
+
+    def __init__(self, nodes: int):
+        self.graph = [[] for _ in range(nodes)]
+
+    def add_edge(self, u: int, v: int, capacity: int):
+        """Adds u -> v and returns a handle for flow()."""
+        self.graph[u].append([v, capacity, len(self.graph[v])])
+        self.graph[v].append([u, 0, len(self.graph[u]) - 1])
+        return u, len(self.graph[u]) - 1
+
+    def flow(self, handle) -> int:
+        u, i = handle
+        v, _, rev = self.graph[u][i]
+        return self.graph[v][rev][1]
+
+    def _levels(self, source: int, sink: int) -> list:
+        level = [-1] * len(self.graph)
+        level[source] = 0
+        queue = [source]
+        for u in queue:
+            for v, capacity, _ in self.graph[u]:
+                if capacity > 0 and level[v] < 0:
+                    level[v] = level[u] + 1
+                    queue.append(v)
+        return level
+
+    def _augment(self, source: int, sink: int, level: list, next_edge: list) -> int:
+        # Iterative DFS along the level graph; returns the flow pushed along one path
+        graph = self.graph
+        path = []
+        u = source
+        while True:
+            if u == sink:
+                pushed = min(edge[1] for edge in path)
+                for edge in path:
+                    edge[1] -= pushed
+                    graph[edge[0]][edge[2]][1] += pushed
+                return pushed
+            edges = graph[u]
+            while next_edge[u] < len(edges):
+                edge = edges[next_edge[u]]
+                if edge[1] > 0 and level[edge[0]] == level[u] + 1:
+                    break
+                next_edge[u] += 1
+            else:
+                if u == source:
+                    return 0
+                # Dead end: back up and skip the edge that led here
+                edge = path.pop()
+                u = graph[edge[0]][edge[2]][0]
+                next_edge[u] += 1
+                continue
+            path.append(edge)
+            u = edge[0]
+
+    def max_flow(self, source: int, sink: int, deadline: float = None) -> int:
+        """Total flow from source to sink. Raises SolverTimeout once perf_counter() passes deadline."""
+        total = 0
+        while True:
+            if deadline is not None and time.perf_counter() > deadline:
+                raise SolverTimeout()
+            level = self._levels(source, sink)
+            if level[sink] < 0:
+                return total
+            next_edge = [0] * len(self.graph)
+            while True:
+                pushed = self._augment(source, sink, level, next_edge)
+                if not pushed:
+                    break
+                total += pushed
+                if deadline is not None and time.perf_counter() > deadline:
+                    raise SolverTimeout()
+
+
+def schedulable_minutes(calendar: CapacityCalendar, subjects: list, deadline: float = None) -> dict:
+    """Most minutes that can be studied for each exam day (days_left), as {days_left: minutes}.
+
+    Network: source -> exam day (required minutes) -> every study day before it
+    -> sink (the day's free minutes). Topics sharing an exam day are
+    interchangeable, so they are grouped into one node; paths stay three edges
+    long however far away the exams are.
+    """
+    demand = {}
+    for subject in subjects:
+        days_left = min(subject.days_left, calendar.horizon)
+        if days_left > 0:
+            demand[days_left] = demand.get(days_left, 0) + len(subject.topics) * subject.topic_minutes
+
+    source, sink = 0, 1
+    day_node = lambda day: 2 + day
+    exam_node = {days_left: 2 + calendar.horizon + i for i, days_left in enumerate(demand)}
+
+    network = FlowNetwork(2 + calendar.horizon + len(demand))
+    for day, free in enumerate(calendar.day_totals()):
+        if free > 0:
+            network.add_edge(day_node(day), sink, free)
+    handles = {}
+    for days_left, minutes in demand.items():
+        handles[days_left] = network.add_edge(source, exam_node[days_left], minutes)
+        for day in range(days_left):
+            network.add_edge(exam_node[days_left], day_node(day), minutes)
+
+    network.max_flow(source, sink, deadline)
+    return {days_left: network.flow(handle) for days_left, handle in handles.items()}
+
+
+def _lay_out(calendar: CapacityCalendar, subject: Subject, topic: str, granted: int) -> list:
+    # Whole topic in one slot when possible, otherwise split over the earliest free slots
+    minutes = subject.topic_minutes
+    partial = granted < minutes
+    day = calendar.find_day(granted, subject.days_left)
+    if day is not None:
+        slot = calendar.take(day, granted)
+        return [Placement(day, slot, subject.name, topic, granted, partial, subject.id)]
+
+    pieces = []
+    left = granted
+    while left:
+        day = calendar.find_day(1, subject.days_left)
+        if day is None:
+            break
+        for slot in range(calendar.slots):
+            free = calendar.free(day, slot)
+            if free > 0:
+                piece = min(free, left)
+                calendar.book(day, slot, piece)
+                pieces.append(Placement(day, slot, subject.name, topic, piece, partial, subject.id))
+                left -= piece
+                if not left:
+                    break
+    return pieces
+
+
+def allocate_optimal(calendar: CapacityCalendar, subjects: list, time_budget_ms: int = None) -> list:
+    """Schedules the most topic minutes the calendar allows before each exam.
+
+    A topic may be split over several slots, giving one Placement per piece.
+    Within an exam day, topics are granted their full time in order, so at most
+    one of them is cut short (partial). Falls back to allocate_edf if the
+    solver runs past its time budget.
+    """
+    if time_budget_ms is None:
+        time_budget_ms = SOLVER_TIME_BUDGET_MS
+    deadline = time.perf_counter() + time_budget_ms / 1000 if time_budget_ms > 0 else None
+    try:
+        granted = schedulable_minutes(calendar, subjects, deadline)
+    except SolverTimeout:
+        logger.warning("Allocation solver exceeded %d ms, using earliest-deadline-first", time_budget_ms)
+        return allocate_edf(calendar, subjects)
+
+    placements = []
+    ordered = sorted(subjects, key=lambda subject: subject.days_left)
+    for days_left, group in groupby(ordered, key=lambda subject: min(subject.days_left, calendar.horizon)):
+        left = granted.get(days_left, 0)
+        for subject in group:
+            for topic in subject.topics:
+                minutes = min(subject.topic_minutes, left)
+                left -= minutes
+                pieces = _lay_out(calendar, subject, topic, minutes) if minutes else []
+                if not pieces:
+                    pieces = [Placement(None, None, subject.name, topic, subject.topic_minutes, subject_id=subject.id)]
+                placements.extend(pieces)
+    return placements
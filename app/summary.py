@@ -0,0 +1,235 @@
+# LLM plan summaries, computed off the request path.
+# The plan endpoint only enqueues a job and returns a poll URL. Jobs are keyed by
+# a hash of the prompt, so identical plans share one model call and one cached
+# result. A fixed pool of workers bounds concurrent model calls, every call has
+# a timeout, and a circuit breaker stops calling a failing backend for a while.
+import asyncio
+import hashlib
+import logging
+import os
+import time
+
+from app.cache import LRUTTLBackend
+from app.metrics import Counter, Histogram
+from app.render import render_text
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_MODEL = os.getenv("PLAN_SUMMARY_MODEL", "gemini-2.0-flash")
+SUMMARY_INSTRUCTIONS = (
+    "Summarize this study plan for the student in a few sentences: what to start with, "
+    "which exams are at risk and how the workload is spread over the days."
+)
+
+SUMMARY_JOBS = Counter("plan_summary_jobs_total", "Summary jobs by outcome.", ("outcome",))
+SUMMARY_SECONDS = Histogram("plan_summary_seconds", "Model call time per summary.")
+
+
+def summary_prompt(plan: dict) -> str:
+    return SUMMARY_INSTRUCTIONS + "\n\n" + "\n".join(render_text(plan))
+
+
+def prompt_hash(model: str, prompt: str) -> str:
+    return hashlib.sha256(f"{model}\n{prompt}".encode("utf-8")).hexdigest()
+
+
+class GeminiBackend:
+    """google-genai backend. The client is created on first use and reused for every call."""
+
+    def __init__(self, api_key: str, model: str = SUMMARY_MODEL):
+        self.api_key = api_key
+        self.model = model
+        self._client = None
+
+    def client(self):
+        if self._client is None:
+            import google.genai as genai
+
+            self._client = genai.Client(api_key=self.api_key)
+        return self._client
+
+    async def summarize(self, prompt: str) -> str:
+        response = await self.client().aio.models.generate_content(model=self.model, contents=prompt)
+        return response.text
+
+
+class StubBackend:
+    """Local backend for tests and development: a canned summary, optionally after a delay."""
+
+    model = "stub"
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.calls = 0
+
+    async def summarize(self, prompt: str) -> str:
+        self.calls += 1
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        lines = prompt.splitlines()
+        sessions = sum(1 for line in lines if line.startswith("Day "))
+        unscheduled = sum(1 for line in lines if line.startswith("Could not fit"))
+        warnings = sum(1 for line in lines if line.startswith("Warning:"))
+        return f"{sessions} study sessions planned, {unscheduled} topics unscheduled, {warnings} exams at risk."
+
+
+def backend_from_env():
+    """PLAN_SUMMARY_BACKEND=gemini|stub; defaults to gemini when GEMINI_API_KEY is set."""
+    api_key = os.getenv("GEMINI_API_KEY")
+    name = os.getenv("PLAN_SUMMARY_BACKEND") or ("gemini" if api_key else "stub")
+    if name == "gemini":
+        if not api_key:
+            raise RuntimeError("GEMINI_API_KEY is not set.")
+        return GeminiBackend(api_key)
+    if name == "stub":
+        return StubBackend()
+    raise RuntimeError(f"Unknown PLAN_SUMMARY_BACKEND {name!r}.")
+
+
+class CircuitBreaker:
+    """Opens after `threshold` consecutive failures; lets one trial call through after `reset_after` seconds."""
+
+    def __init__(self, threshold: int = 5, reset_after: float = 30.0):
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.failures = 0
+        self.opened_at = None
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half-open" if time.monotonic() - self.opened_at >= self.reset_after else "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "half-open":
+            # Re-arm so only this trial call goes through until it reports back
+            self.opened_at = time.monotonic()
+        return state != "open"
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.failures >= self.threshold or self.opened_at is not None:
+            self.opened_at = time.monotonic()
+
+
+class SummaryService:
+    """Background summary jobs. Call start() inside the event loop and stop() on shutdown."""
+
+    def __init__(
+        self,
+        backend,
+        workers: int = 4,
+        timeout: float = 20.0,
+        queue_size: int = 1000,
+        ttl: float = 24 * 60 * 60,
+        failure_ttl: float = 60.0,
+        breaker: CircuitBreaker = None,
+        results: LRUTTLBackend = None,
+    ):
+        self.backend = backend
+        self.model = getattr(backend, "model", "")
+        self.workers = workers
+        self.timeout = timeout
+        self.queue_size = queue_size
+        self.ttl = ttl
+        self.failure_ttl = failure_ttl
+        self.breaker = breaker if breaker is not None else CircuitBreaker()
+        self.results = results if results is not None else LRUTTLBackend(max_entries=10000)
+        self._pending = {}  # summary id -> prompt, for queued and running jobs
+        self._queue = None
+        self._tasks = []
+
+    def start(self):
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, plan: dict) -> dict:
+        """Queues a summary for the plan unless one is cached or already queued; returns its status."""
+        prompt = summary_prompt(plan)
+        summary_id = prompt_hash(self.model, prompt)
+        status = self.status(summary_id)
+        if status is not None:
+            return status
+        if self._queue is None:
+            return {"id": summary_id, "status": "unavailable", "error": "Summaries are not running."}
+        try:
+            self._queue.put_nowait(summary_id)
+        except asyncio.QueueFull:
+            SUMMARY_JOBS.inc(outcome="rejected")
+            return {"id": summary_id, "status": "unavailable", "error": "Too many summaries queued."}
+        self._pending[summary_id] = prompt
+        return {"id": summary_id, "status": "pending"}
+
+    def status(self, summary_id: str):
+        """{"id", "status", ...} for a known job, or None."""
+        if summary_id in self._pending:
+            return {"id": summary_id, "status": "pending"}
+        result = self.results.get(f"summary:{summary_id}")
+        if result is None:
+            return None
+        return dict(result, id=summary_id)
+
+    def _finish(self, summary_id: str, result: dict, ttl: float):
+        self.results.set(f"summary:{summary_id}", "summary", result, ttl)
+        self._pending.pop(summary_id, None)
+
+    async def _work(self):
+        while True:
+            summary_id = await self._queue.get()
+            try:
+                await self._run(summary_id)
+            except Exception:
+                logger.exception("Summary job %s failed", summary_id)
+                self._finish(summary_id, {"status": "failed", "error": "Internal error."}, self.failure_ttl)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, summary_id: str):
+        prompt = self._pending.get(summary_id)
+        if prompt is None:
+            return
+        if not self.breaker.allow():
+            SUMMARY_JOBS.inc(outcome="short_circuited")
+            self._finish(summary_id, {"status": "failed", "error": "Summary backend unavailable."}, self.failure_ttl)
+            return
+
+        started = time.perf_counter()
+        try:
+            text = await asyncio.wait_for(self.backend.summarize(prompt), self.timeout)
+        except asyncio.TimeoutError:
+            self.breaker.record_failure()
+            SUMMARY_JOBS.inc(outcome="timeout")
+            self._finish(summary_id, {"status": "failed", "error": "Summary timed out."}, self.failure_ttl)
+            return
+        except Exception as e:
+            self.breaker.record_failure()
+            SUMMARY_JOBS.inc(outcome="error")
+            logger.warning("Summary backend error: %s", e)
+            self._finish(summary_id, {"status": "failed", "error": "Summary backend error."}, self.failure_ttl)
+            return
+
+        self.breaker.record_success()
+        SUMMARY_SECONDS.observe(time.perf_counter() - started)
+        SUMMARY_JOBS.inc(outcome="done")
+        self._finish(summary_id, {"status": "done", "summary": text}, self.ttl)
+
+
+def service_from_env() -> SummaryService:
+    return SummaryService(
+        backend_from_env(),
+        workers=int(os.getenv("PLAN_SUMMARY_WORKERS", "4")),
+        timeout=float(os.getenv("PLAN_SUMMARY_TIMEOUT_SECONDS", "20")),
+        queue_size=int(os.getenv("PLAN_SUMMARY_QUEUE_SIZE", "1000")),
+    )
@@ -0,0 +1,107 @@
+# Startup warmup and readiness.
+# The server accepts connections as soon as the lifespan has started, while
+# warmup runs in the background: connect to MongoDB (SRV lookup, TLS, auth),
+# run one synthetic plan through the planner and the serializer so first-use
+# imports and setup happen here, and load today's stored plans into the plan
+# cache. /ready answers 503 until that has finished, so a load balancer only
+# routes traffic to warm workers.
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+from app.cache import PlanCache
+from app.engine import check_deadlines
+from app.planner import DEFAULT_STRATEGY, get_strategy, normalize, render
+from app.plan_store import load_todays_plans_async
+from app.render import plan_response
+
+logger = logging.getLogger(__name__)
+
+WARMUP_CACHE_ENTRIES = int(os.getenv("PLAN_WARMUP_CACHE_ENTRIES", "1000"))
+MAX_RETRY_SECONDS = 30.0
+
+WARMUP_SLOTS = ["07:00 - 08:00", "18:00 - 19:30"]
+
+
+def warmup_subjects(today) -> list:
+    start = datetime.combine(today, datetime.min.time())
+    return [
+        {"_id": "warmup-1", "subjectName": "Warmup", "examDate": start + timedelta(days=2), "examDifficulty": "HARD",
+         "topics": [{"name": "A"}, {"name": "B"}]},
+        {"_id": "warmup-2", "subjectName": "Warmup", "examDate": start + timedelta(days=10), "examDifficulty": "EASY",
+         "topics": [{"name": "C"}]},
+    ]
+
+
+class Readiness:
+    """Runs the warmup steps once and records how long each took."""
+
+    def __init__(self):
+        self.ready = False
+        self.error = None
+        self.steps = {}  # step -> seconds
+
+    def status(self) -> dict:
+        status = {"status": "ready" if self.ready else "starting", "steps": self.steps}
+        if self.ready:
+            status["warmup_seconds"] = round(sum(self.steps.values()), 4)
+        elif self.error:
+            status["error"] = self.error
+        return status
+
+    async def _step(self, name: str, fn):
+        started = time.perf_counter()
+        result = await fn()
+        self.steps[name] = round(time.perf_counter() - started, 4)
+        return result
+
+    async def _connect(self, database):
+        # Retried until MongoDB answers; readiness reports the last error meanwhile
+        delay = 0.5
+        while True:
+            try:
+                await database.command("ping")
+                self.error = None
+                return
+            except Exception as e:
+                self.error = f"MongoDB unavailable: {e}"
+                logger.warning("Warmup ping failed, retrying in %.1fs: %s", delay, e)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, MAX_RETRY_SECONDS)
+
+    async def _plan(self):
+        today = datetime.today().date()
+        # The pipeline of build_plan, minus the plan metrics
+        inputs = normalize(WARMUP_SLOTS, warmup_subjects(today), today, fingerprint="warmup")
+        calendar = inputs.calendar()
+        warnings = check_deadlines(calendar, inputs.subjects)
+        placements = get_strategy(DEFAULT_STRATEGY)(calendar, inputs.subjects)
+        plan_response(render(ObjectId(), inputs, calendar, placements, warnings))
+
+    async def _fill_cache(self, plans_collection, cache: PlanCache) -> int:
+        today = datetime.today().date()
+        count = 0
+        try:
+            for doc in await load_todays_plans_async(plans_collection, today, DEFAULT_STRATEGY, WARMUP_CACHE_ENTRIES):
+                cache.store(str(doc["userId"]), today, doc["fingerprint"], doc["plan"], DEFAULT_STRATEGY)
+                count += 1
+        except Exception as e:
+            # A cold cache only costs latency, so it does not hold up readiness
+            logger.warning("Could not preload stored plans: %s", e)
+        return count
+
+    async def run(self, plans_collection, cache: PlanCache):
+        """plans_collection may be None (no MongoDB), which skips the connection and cache steps."""
+        started = time.perf_counter()
+        if plans_collection is not None:
+            await self._step("mongo", lambda: self._connect(plans_collection.database))
+        await self._step("planner", self._plan)
+        if plans_collection is not None and WARMUP_CACHE_ENTRIES > 0:
+            count = await self._step("plan_cache", lambda: self._fill_cache(plans_collection, cache))
+            logger.info("Preloaded %d stored plans into the plan cache", count)
+        self.ready = True
+        logger.info("Warmup finished in %.3fs", time.perf_counter() - started)
@@ -0,0 +1,3 @@
+# Benchmarks for the planners. Run them from the repository root, e.g.
+#
+#   python -m benchmarks.bench_planner
@@ -0,0 +1,82 @@
+# Compares the old days x slots nested scan with the indexed allocator in app.engine.
+#
+#   python -m benchmarks.bench_allocator
+import random
+import time
+
+from app.engine import CapacityCalendar, Difficulty, Subject, allocate, horizon_for
+
+
+def legacy_allocate(slot_minutes, normal):
+    # The previous normal-subject loop: every topic rescans days_left x slots,
+    # even though the inner loop never depends on the day
+    remaining = list(slot_minutes)
+    placed = 0
+    for subject in normal:
+        minutes = subject.topic_minutes
+        for _ in subject.topics:
+            scheduled = False
+            for _ in range(subject.days_left):
+                for index in range(len(remaining)):
+                    if minutes <= remaining[index]:
+                        remaining[index] -= minutes
+                        scheduled = True
+                        break
+                if scheduled:
+                    break
+            placed += scheduled
+    return placed
+
+
+def make_subjects(subject_count, topics_per_subject, horizon, rng):
+    subjects = []
+    for s in range(subject_count):
+        days_left = rng.randint(2, horizon)
+        total_minutes = rng.choice([60, 120, 180])
+        subjects.append(Subject(
+            str(s),
+            f"Subject {s}",
+            [f"Topic {s}.{t}" for t in range(topics_per_subject)],
+            Difficulty.MEDIUM,
+            days_left,
+            max(1, round(total_minutes / topics_per_subject)),
+        ))
+    subjects.sort(key=lambda subject: subject.days_left)
+    return subjects
+
+
+def indexed_allocate(slot_minutes, normal):
+    return allocate(CapacityCalendar(slot_minutes, horizon_for(normal)), [], normal)
+
+
+def timed(fn, *args, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    rng = random.Random(7)
+    slot_minutes = [120, 90, 60, 45]
+    print(f"{'subjects':>8} {'topics':>7} {'horizon':>8} {'legacy ms':>10} {'indexed ms':>11} {'speedup':>8}")
+    for subject_count, topics_per_subject, horizon in [
+        (5, 10, 30),
+        (10, 20, 60),
+        (20, 40, 120),
+        (40, 50, 240),
+        (60, 60, 365),
+    ]:
+        normal = make_subjects(subject_count, topics_per_subject, horizon, rng)
+        legacy = timed(legacy_allocate, slot_minutes, normal)
+        indexed = timed(indexed_allocate, slot_minutes, normal)
+        print(
+            f"{subject_count:>8} {subject_count * topics_per_subject:>7} {horizon:>8} "
+            f"{legacy * 1000:>10.2f} {indexed * 1000:>11.2f} {legacy / indexed:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
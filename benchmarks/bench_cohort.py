@@ -0,0 +1,86 @@
+# Times cohort scheduling with shared rooms (app.cohort) against planning every
+# student on their own, and checks that no room is ever over capacity.
+#
+#   python -m benchmarks.bench_cohort
+#   python -m benchmarks.bench_cohort --users 1000 5000 --rooms 8 --seats 40
+import argparse
+import time
+from collections import Counter
+from datetime import date
+
+from app.cohort import plan_cohort
+from app.planner import _inputs_cache, build_plan
+from app.repository import load_plan_inputs_bulk
+from app.slots import MINUTES_PER_DAY, parse_clock
+from benchmarks.cohort import make_cohort
+from benchmarks.fakes import load_cohort
+
+
+def overbooked(result: dict) -> int:
+    """(room, date, minute) points holding more students than the room has seats, by brute force."""
+    capacity = {room["name"]: room["capacity"] for room in result["rooms"]}
+    seated, occupancy = set(), Counter()
+    for user_id, plan in result["plans"].items():
+        for entry in plan.get("entries", ()):
+            seat = (user_id, entry["date"], entry["start"])
+            if entry["unscheduled"] or seat in seated:
+                continue
+            seated.add(seat)
+            day = date.fromisoformat(entry["date"]).toordinal()
+            start, end = parse_clock(entry["start"]), parse_clock(entry["end"])
+            for minute in range(start, start + (end - start) % MINUTES_PER_DAY):
+                occupancy[(entry["room"], day + minute // MINUTES_PER_DAY, minute % MINUTES_PER_DAY)] += 1
+    return sum(1 for (room, _, _), count in occupancy.items() if count > capacity[room])
+
+
+def unscheduled(plans) -> int:
+    return sum(entry["unscheduled"] for plan in plans for entry in plan.get("entries", ()))
+
+
+def rooms_full(plans) -> int:
+    """Slots students lost because every room was full."""
+    return sum(w["slots"] for plan in plans for w in plan.get("warnings", ()) if w.get("type") == "rooms_full")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark cohort scheduling with shared rooms.")
+    parser.add_argument("--users", type=int, nargs="+", default=[500, 2000, 5000])
+    parser.add_argument("--rooms", type=int, default=2, help="shared rooms")
+    parser.add_argument("--seats", type=int, default=0, help="seats per room (default: users / 400, so rooms fill up)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--check", action="store_true", help="verify room capacity minute by minute (slow)")
+    args = parser.parse_args(argv)
+
+    today = date.today()
+    print(f"{'users':>6} {'seats':>6} {'cohort s':>9} {'alone s':>8} {'unsched':>8} {'alone unsched':>14} "
+          f"{'seats booked':>13} {'slots lost':>11}")
+    for users in args.users:
+        user_docs, subject_docs = make_cohort(users, seed=args.seed, today=today)
+        database = load_cohort(user_docs, subject_docs)
+        user_ids = [doc["_id"] for doc in user_docs]
+        seats = args.seats or max(1, users // 400)
+        rooms = [{"name": f"Room {i + 1}", "capacity": seats} for i in range(args.rooms)]
+
+        _inputs_cache.clear()
+        started = time.perf_counter()
+        result = plan_cohort(database["users"], database["subjects"], user_ids, rooms, today)
+        cohort_seconds = time.perf_counter() - started
+
+        _inputs_cache.clear()
+        started = time.perf_counter()
+        alone = [
+            build_plan(user_id, learning_times, subjects, today)
+            for user_id, (learning_times, subjects) in load_plan_inputs_bulk(database["users"], database["subjects"], user_ids, today)
+        ]
+        alone_seconds = time.perf_counter() - started
+
+        booked = sum(room["seats_booked"] for room in result["rooms"])
+        print(f"{users:>6} {seats:>6} {cohort_seconds:>9.2f} {alone_seconds:>8.2f} "
+              f"{unscheduled(result['plans'].values()):>8} {unscheduled(alone):>14} {booked:>13} "
+              f"{rooms_full(result['plans'].values()):>11}")
+        if args.check:
+            print(f"       overbooked room-minutes: {overbooked(result)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+# Runs each planner entry point over a synthetic cohort held in fake collections
+# and reports per-call latency percentiles, memory allocated per call and peak RSS.
+#
+#   python -m benchmarks.bench_planner                      # print results
+#   python -m benchmarks.bench_planner --save-baseline      # record benchmarks/baseline.json
+#   python -m benchmarks.bench_planner --compare            # exit 1 on regressions
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+from datetime import date
+
+from bson import ObjectId
+
+from app import planner
+from app.batch import peak_memory_mb
+from app.gemini import generate_user_plan_with_gemini, iter_plan_blocks
+from app.generate_plan_logic import generate_user_plan
+from benchmarks.cohort import make_cohort
+from benchmarks.fakes import load_cohort
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+# Metrics compared against the baseline; higher is worse for all of them
+COMPARED = ("p50_ms", "p90_ms", "p99_ms", "alloc_kib")
+
+
+def _stream(users, subjects, user_id):
+    user_obj_id = ObjectId(user_id)
+    today = date.today()
+    raw_learning_slots, user_subjects = planner.load(users, subjects, user_obj_id, today)
+    for _ in iter_plan_blocks(user_obj_id, raw_learning_slots, user_subjects, today):
+        pass
+
+
+def _plan(strategy: str):
+    return lambda users, subjects, user_id: generate_user_plan_with_gemini(users, subjects, user_id, strategy=strategy)
+
+
+def targets() -> dict:
+    """Name -> fn(users_collection, subjects_collection, user_id) for every planner entry point."""
+    functions = {f"plan[{name}]": _plan(name) for name in planner.STRATEGIES}
+    functions["generate_user_plan"] = generate_user_plan
+    functions["stream"] = _stream
+    return functions
+
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    index = min(len(sorted_values) - 1, max(0, round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def _latencies(fn, users, subjects, user_ids: list) -> list:
+    # The normalized-inputs cache would let later passes reuse earlier work
+    planner._inputs_cache.clear()
+    gc.collect()
+    latencies = []
+    for user_id in user_ids:
+        started = time.perf_counter()
+        fn(users, subjects, user_id)
+        latencies.append((time.perf_counter() - started) * 1000)
+    latencies.sort()
+    return latencies
+
+
+def measure(fn, users, subjects, user_ids: list, alloc_sample: int, repeat: int = 3) -> dict:
+    # Each percentile is the best of several passes, which keeps machine noise out of comparisons
+    passes = [_latencies(fn, users, subjects, user_ids) for _ in range(repeat)]
+    best = lambda fraction: min(percentile(latencies, fraction) for latencies in passes)
+
+    # Allocation pass on a sample, separately, since tracing slows every call down
+    planner._inputs_cache.clear()
+    tracemalloc.start()
+    allocated = 0
+    sample = user_ids[:alloc_sample]
+    for user_id in sample:
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        fn(users, subjects, user_id)
+        _, peak = tracemalloc.get_traced_memory()
+        allocated += peak - before
+    tracemalloc.stop()
+
+    return {
+        "calls": len(user_ids),
+        "p50_ms": round(best(0.50), 3),
+        "p90_ms": round(best(0.90), 3),
+        "p99_ms": round(best(0.99), 3),
+        "max_ms": round(best(1.0), 3),
+        "alloc_kib": round(allocated / max(1, len(sample)) / 1024, 1),
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """(target, metric, old, new) for every metric that got worse by more than tolerance."""
+    regressions = []
+    for name, metrics in results.items():
+        old = baseline.get(name)
+        if old is None:
+            continue
+        for metric in COMPARED:
+            if metric in old and metrics[metric] > old[metric] * (1 + tolerance):
+                regressions.append((name, metric, old[metric], metrics[metric]))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the planners on a synthetic cohort.")
+    parser.add_argument("--users", type=int, default=500, help="synthetic users in the cohort")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=3, help="timing passes per target; the best is kept")
+    parser.add_argument("--alloc-sample", type=int, default=100, help="calls traced for allocation stats")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="baseline JSON file")
+    parser.add_argument("--save-baseline", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--compare", action="store_true", help="compare with the baseline and fail on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown before a regression, e.g. 0.25")
+    args = parser.parse_args(argv)
+
+    user_docs, subject_docs = make_cohort(args.users, seed=args.seed)
+    database = load_cohort(user_docs, subject_docs)
+    users, subjects = database["users"], database["subjects"]
+    user_ids = [str(doc["_id"]) for doc in user_docs]
+    print(f"cohort: {len(user_docs)} users, {len(subject_docs)} subjects, "
+          f"{sum(len(s['topics']) for s in subject_docs)} topics")
+
+    results = {}
+    print(f"{'target':<22} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'max ms':>8} {'alloc KiB':>10}")
+    for name, fn in targets().items():
+        metrics = measure(fn, users, subjects, user_ids, args.alloc_sample, args.repeat)
+        results[name] = metrics
+        print(f"{name:<22} {metrics['p50_ms']:>8.3f} {metrics['p90_ms']:>8.3f} {metrics['p99_ms']:>8.3f} "
+              f"{metrics['max_ms']:>8.3f} {metrics['alloc_kib']:>10.1f}")
+    print(f"peak RSS: {peak_memory_mb():.1f} MB")
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump({"users": args.users, "seed": args.seed, "results": results}, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"baseline written to {args.baseline}")
+
+    if args.compare:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if (baseline.get("users"), baseline.get("seed")) != (args.users, args.seed):
+            print("warning: baseline was recorded with a different cohort")
+        regressions = compare(results, baseline["results"], args.tolerance)
+        for name, metric, old, new in regressions:
+            print(f"REGRESSION {name} {metric}: {old} -> {new}")
+        if regressions:
+            return 1
+        print("no regressions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
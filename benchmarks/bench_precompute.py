@@ -0,0 +1,129 @@
+# Drives the change-stream precompute worker (app.precompute) with bursts of
+# edits from a fake change stream and reports how many recomputes the debounce
+# saved, how far behind the worker ran, and whether every stored plan matches
+# its user's current inputs. The second round stops the worker with edits still
+# pending and checks that a restarted worker resumes from its stored token.
+#
+#   python -m benchmarks.bench_precompute
+#   python -m benchmarks.bench_precompute --users 5000 --edited 1000 --edits 20
+import argparse
+import asyncio
+import random
+import time
+from datetime import date
+
+from app.cache import plan_fingerprint
+from app.precompute import EVENTS, PRECOMPUTED, STATE_COLLECTION, Debouncer, PrecomputeWorker
+from app.repository import load_plan_inputs
+from benchmarks.cohort import make_cohort
+from benchmarks.fakes import AsyncFakeDatabase, FakeChangeStream, load_cohort
+
+
+def stale_plans(database, user_ids, today) -> int:
+    """Edited users whose stored plan was not built from their current inputs."""
+    stale = 0
+    for user_id in user_ids:
+        learning_times, subjects = load_plan_inputs(database["users"], database["subjects"], user_id, today)
+        doc = database["plans"].find_one({"userId": user_id})
+        if doc is None or doc["fingerprint"] != plan_fingerprint(learning_times, subjects):
+            stale += 1
+    return stale
+
+
+async def emit_edits(stream, rng, subjects_by_user, users, edits: int, rate: float) -> int:
+    """Topic edits for each user, interleaved across users, plus a profile edit per user that should be ignored."""
+    events = [user_id for user_id in users for _ in range(edits)]
+    rng.shuffle(events)
+    for count, user_id in enumerate(events):
+        subject = rng.choice(subjects_by_user[user_id])
+        subject["topics"].append({"name": f"Extra {count}"})
+        await stream.emit({
+            "operationType": "update", "ns": {"coll": "subjects"},
+            "documentKey": {"_id": subject["_id"]}, "fullDocument": dict(subject),
+        })
+        if count % max(1, int(rate / 100)) == 0:
+            await asyncio.sleep(0.01)
+    for user_id in users:
+        await stream.emit({
+            "operationType": "update", "ns": {"coll": "users"}, "documentKey": {"_id": user_id},
+            "updateDescription": {"updatedFields": {"name": "renamed"}, "removedFields": []},
+        })
+    return len(events) + len(users)
+
+
+def events_read() -> float:
+    return sum(EVENTS.value(outcome=outcome) for outcome in ("queued", "skipped", "unmapped"))
+
+
+async def run(args):
+    today = date.today()
+    rng = random.Random(args.seed)
+    user_docs, subject_docs = make_cohort(args.users, seed=args.seed, today=today)
+    database = load_cohort(user_docs, subject_docs)
+    subjects_by_user = {}
+    for subject in subject_docs:
+        subjects_by_user.setdefault(subject["userId"], []).append(subject)
+    stream = FakeChangeStream()
+
+    def start_worker():
+        worker = PrecomputeWorker(
+            AsyncFakeDatabase(database), stream, debouncer=Debouncer(args.debounce, args.max_delay),
+            concurrency=args.concurrency,
+        )
+        return worker, asyncio.create_task(worker.run())
+
+    edited = rng.sample([doc["_id"] for doc in user_docs], args.edited)
+
+    # Round 1: bursts of edits while the worker keeps up
+    worker, task = start_worker()
+    await asyncio.sleep(0.05)
+    read_before, stored_before = events_read(), PRECOMPUTED.value(result="stored")
+    started = time.perf_counter()
+    emitted = await emit_edits(stream, rng, subjects_by_user, edited, args.edits, args.rate)
+    lag = 0.0
+    while events_read() - read_before < emitted or worker.pending:
+        lag = max(lag, worker.lag_seconds())
+        await asyncio.sleep(0.02)
+    elapsed = time.perf_counter() - started
+    stored = PRECOMPUTED.value(result="stored") - stored_before
+    print(f"round 1: {emitted} events for {len(edited)} users -> {stored:.0f} recomputes "
+          f"({emitted / max(1, stored):.1f} events per recompute) in {elapsed:.2f}s")
+    print(f"         max lag {lag:.2f}s, stale plans {stale_plans(database, edited, today)}")
+
+    # Round 2: stop with edits still pending, then restart from the stored resume token
+    read_before = events_read()
+    emitted = await emit_edits(stream, rng, subjects_by_user, edited, args.edits, args.rate)
+    while events_read() - read_before < emitted:
+        await asyncio.sleep(0.01)
+    pending = worker.pending
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    stale = stale_plans(database, edited, today)
+
+    token = database[STATE_COLLECTION].find_one({"_id": "plans"})["resumeToken"]
+    replay = len(stream.events) - int(token["_data"]) - 1
+    read_before = events_read()
+    worker, task = start_worker()
+    while events_read() - read_before < replay or worker.pending:
+        await asyncio.sleep(0.02)
+    print(f"round 2: stopped with {pending} users pending ({stale} stale plans); "
+          f"restart replayed {replay} events, stale plans now {stale_plans(database, edited, today)}")
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark change-stream driven plan precomputation.")
+    parser.add_argument("--users", type=int, default=2000, help="synthetic users in the cohort")
+    parser.add_argument("--edited", type=int, default=200, help="users that receive edits")
+    parser.add_argument("--edits", type=int, default=10, help="topic edits per edited user per round")
+    parser.add_argument("--rate", type=float, default=2000, help="approximate edits per second")
+    parser.add_argument("--debounce", type=float, default=0.2, help="quiet seconds before a user is recomputed")
+    parser.add_argument("--max-delay", type=float, default=2.0, help="longest a busy user waits")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=42)
+    asyncio.run(run(parser.parse_args(argv)))
+
+
+if __name__ == "__main__":
+    main()
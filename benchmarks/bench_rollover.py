@@ -0,0 +1,171 @@
+# Times the nightly rollover (app.rollover) against planning every user again,
+# both the planner work alone and the whole job over the fake store (the same
+# job over a store without states plans every user from scratch), and checks
+# the rolled plans: each is served from the store for its user's
+# current inputs, no topic lands on a day that has begun or after its exam, and
+# the stored calendars agree with the placements they hold.
+#
+#   python -m benchmarks.bench_rollover
+#   python -m benchmarks.bench_rollover --users 5000 --edited 500 --window 14400
+import argparse
+import random
+import time
+from collections import Counter
+from datetime import date, timedelta
+
+from pymongo import UpdateOne
+
+from app.cache import plan_fingerprint
+from app.plan_store import plan_update, stored_plan_filter
+from app.planner import DEFAULT_STRATEGY, _inputs_cache, build_plan
+from app.replan import PlanState
+from app.repository import load_plan_inputs_bulk
+from app.rollover import roll_state, run_rollover, spread, stale_plans
+from benchmarks.cohort import make_cohort
+from benchmarks.fakes import load_cohort
+
+
+def store_states(database, user_ids, day, with_state: bool = True) -> float:
+    """Plans (and states) for every user as of day, the way yesterday's requests left them. Returns seconds."""
+    started = time.perf_counter()
+    ops = []
+    for user_obj_id, (learning_times, subjects) in load_plan_inputs_bulk(database["users"], database["subjects"], user_ids, day):
+        if not learning_times:
+            continue
+        state = PlanState.build(learning_times, subjects, day)
+        query, update = plan_update(
+            user_obj_id, plan_fingerprint(learning_times, subjects), state.to_plan(str(user_obj_id)), day,
+            DEFAULT_STRATEGY, state.to_document() if with_state else None,
+        )
+        ops.append(UpdateOne(query, update, upsert=True))
+    database["plans"].bulk_write(ops, ordered=False)
+    return time.perf_counter() - started
+
+
+def planning_seconds(database, user_ids, today):
+    """(seconds rolling every stored state, seconds planning every user from scratch) for today."""
+    inputs = list(load_plan_inputs_bulk(database["users"], database["subjects"], user_ids, today))
+    inputs = [(user_obj_id, learning_times, subjects) for user_obj_id, (learning_times, subjects) in inputs if learning_times]
+    states = {doc["userId"]: doc["state"] for doc in database["plans"].find({}, {"userId": 1, "state": 1})}
+
+    started = time.perf_counter()
+    for user_obj_id, learning_times, subjects in inputs:
+        state, _ = roll_state(states[user_obj_id], learning_times, subjects, today)
+        state.to_plan(str(user_obj_id))
+    rolled = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for user_obj_id, learning_times, subjects in inputs:
+        build_plan(user_obj_id, learning_times, subjects, today)
+    return rolled, time.perf_counter() - started
+
+
+def check(database, user_ids, today) -> Counter:
+    problems = Counter()
+    for user_obj_id, (learning_times, subjects) in load_plan_inputs_bulk(database["users"], database["subjects"], user_ids, today):
+        if not learning_times:
+            continue
+        fingerprint = plan_fingerprint(learning_times, subjects)
+        doc = database["plans"].find_one(stored_plan_filter(user_obj_id, fingerprint, today, DEFAULT_STRATEGY))
+        if doc is None:
+            problems["not served from the store"] += 1
+            continue
+        for entry in doc["plan"]["entries"]:
+            if not entry["unscheduled"] and entry["date"] <= today.isoformat():
+                problems["entry on a day that has begun"] += 1
+        for warning in doc["plan"]["warnings"]:
+            if warning["exam_date"] <= today.isoformat():
+                problems["subject whose exam has come"] += 1
+
+        state = PlanState.from_document(doc["state"])
+        booked = [0] * len(state.calendar.remaining)
+        for record in state.subjects.values():
+            for placement in record.placements:
+                if placement.scheduled:
+                    if placement.day >= record.days_left:
+                        problems["placement after its exam"] += 1
+                    booked[placement.day * state.calendar.slots + placement.slot] += placement.minutes
+        expected = [minutes - used for minutes, used in zip(state.calendar.slot_minutes * state.calendar.horizon, booked)]
+        if expected != list(state.calendar.remaining):
+            problems["calendar out of step with placements"] += 1
+    return problems
+
+
+def edit_subjects(database, rng, user_ids, count: int):
+    for user_obj_id in rng.sample(user_ids, count):
+        subjects = list(database["subjects"].find({"userId": user_obj_id}))
+        if subjects:
+            subject = rng.choice(subjects)
+            database["subjects"].update_one(
+                {"_id": subject["_id"]}, {"$set": {"topics": subject["topics"] + [{"name": "Added overnight"}]}}
+            )
+
+
+def unscheduled(database) -> int:
+    return sum(entry["unscheduled"] for doc in database["plans"].find({}, {"plan": 1}) for entry in doc["plan"]["entries"])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the nightly plan rollover.")
+    parser.add_argument("--users", type=int, default=2000, help="synthetic users in the cohort")
+    parser.add_argument("--edited", type=int, default=200, help="users who edit a subject overnight")
+    parser.add_argument("--window", type=float, default=4 * 60 * 60, help="seconds the rollover spreads users over")
+    parser.add_argument("--chunk-size", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+
+    today = date.today()
+    yesterday = today - timedelta(days=1)
+    rng = random.Random(args.seed)
+    user_docs, subject_docs = make_cohort(args.users, seed=args.seed, today=today)
+    database = load_cohort(user_docs, subject_docs)
+    user_ids = [doc["_id"] for doc in user_docs]
+
+    store_states(database, user_ids, yesterday)
+    edit_subjects(database, rng, user_ids, args.edited)
+
+    _inputs_cache.clear()
+    roll_seconds, plan_seconds = planning_seconds(database, user_ids, today)
+
+    # The offsets the job would draw, in 10-minute buckets
+    offsets = spread(stale_plans(database["plans"], today), args.window, random.Random(args.seed))
+    buckets = Counter(int(offset // 600) for offset, _ in offsets)
+    average = len(offsets) / max(1, len(buckets))
+
+    # Sleeps advance a virtual clock, so the window costs no wall time
+    def timed_rollover(database):
+        now = [0.0]
+
+        def sleep(seconds):
+            now[0] += seconds
+
+        started = time.perf_counter()
+        outcomes = run_rollover(
+            database, today, args.window, args.chunk_size, random.Random(args.seed), sleep=sleep, clock=lambda: now[0]
+        )
+        return outcomes, time.perf_counter() - started
+
+    outcomes, rollover_seconds = timed_rollover(database)
+    problems = check(database, user_ids, today)
+    rolled_unscheduled = unscheduled(database)
+
+    # The same job over the same edits, with no stored states: every user is planned from scratch
+    fresh = load_cohort(user_docs, subject_docs)
+    store_states(fresh, user_ids, yesterday, with_state=False)
+    edit_subjects(fresh, random.Random(args.seed), user_ids, args.edited)
+    _inputs_cache.clear()
+    rebuilt_outcomes, rebuild_seconds = timed_rollover(fresh)
+
+    per_user = 1000 / args.users
+    print(f"planning: rolled {roll_seconds * per_user:.2f} ms/user, planned from scratch {plan_seconds * per_user:.2f} ms/user")
+    print(f"job:      {dict(sorted(outcomes.items()))} in {rollover_seconds:.2f}s ({rollover_seconds * per_user:.2f} ms/user), "
+          f"without states {dict(sorted(rebuilt_outcomes.items()))} in {rebuild_seconds:.2f}s "
+          f"({rebuild_seconds * per_user:.2f} ms/user)")
+    print(f"spread:   {len(offsets)} users over {args.window / 3600:.1f}h, "
+          f"busiest 10 minutes {max(buckets.values(), default=0)} users (average {average:.0f})")
+    print(f"unscheduled topics: rolled {rolled_unscheduled}, rebuilt {unscheduled(fresh)}")
+    print(f"problems: {dict(problems) or 'none'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+# Compares earliest-deadline-first placement with the max-flow allocator in app.solver
+# on synthetic cohorts: solve time and hours left unscheduled.
+#
+#   python -m benchmarks.bench_solver
+import random
+import time
+
+from app.engine import CapacityCalendar, Difficulty, Subject, allocate_edf, horizon_for
+from app.solver import allocate_optimal
+
+
+def make_user(rng):
+    # Short evening slots and a few exams close together, so topics often
+    # do not fit into a single slot
+    slot_minutes = [rng.choice([30, 45, 60, 90]) for _ in range(rng.randint(1, 3))]
+    subjects = []
+    for s in range(rng.randint(2, 8)):
+        difficulty = rng.choice(list(Difficulty))
+        topics = rng.randint(1, 6)
+        subjects.append(Subject(
+            str(s),
+            f"Subject {s}",
+            [f"Topic {s}.{t}" for t in range(topics)],
+            difficulty,
+            rng.randint(1, 21),
+            max(1, round(difficulty * 60 / topics)),
+        ))
+    subjects.sort(key=lambda subject: subject.days_left)
+    return slot_minutes, subjects
+
+
+def run(allocator, cohort):
+    unscheduled = 0
+    started = time.perf_counter()
+    for slot_minutes, subjects in cohort:
+        calendar = CapacityCalendar(slot_minutes, horizon_for(subjects))
+        placed = sum(p.minutes for p in allocator(calendar, subjects) if p.scheduled)
+        unscheduled += sum(len(s.topics) * s.topic_minutes for s in subjects) - placed
+    return time.perf_counter() - started, unscheduled / 60
+
+
+def main():
+    rng = random.Random(11)
+    print(f"{'users':>6} {'edf ms':>8} {'optimal ms':>11} {'edf unsched h':>14} {'optimal unsched h':>18}")
+    for users in [10, 100, 1000, 5000]:
+        cohort = [make_user(rng) for _ in range(users)]
+        edf_time, edf_hours = run(allocate_edf, cohort)
+        optimal_time, optimal_hours = run(allocate_optimal, cohort)
+        print(
+            f"{users:>6} {edf_time * 1000:>8.1f} {optimal_time * 1000:>11.1f} "
+            f"{edf_hours:>14.1f} {optimal_hours:>18.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+# Cold-start report: import time of the API module and time until /ready.
+#
+#   python -m benchmarks.bench_startup               # import time, median of 5 fresh interpreters
+#   python -m benchmarks.bench_startup --ready       # also start the server profile and time /ready
+#
+# Import times come from `python -X importtime`. The report lists the slowest
+# top-level imports and fails if a module that should load lazily was imported.
+import argparse
+import asyncio
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+from benchmarks.loadtest import ROOT, free_port, start_server
+
+TARGET = "app.main1"
+# Loaded on first use of their feature only
+LAZY_MODULES = ("app.solver", "app.batch", "google.genai", "msgpack", "concurrent.futures.process")
+
+
+def import_profile(module: str) -> dict:
+    """{imported module: (self us, cumulative us, depth)} for one fresh interpreter, in import-time output order."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+    profile = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        own, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        profile[name.strip()] = (int(own), int(cumulative), depth)
+    return profile
+
+
+def direct_imports(profile: dict, module: str) -> list:
+    # importtime lists a module's imports right before the module itself
+    names = list(profile)
+    children = []
+    for name in reversed(names[:names.index(module)]):
+        depth = profile[name][2]
+        if depth == 0:
+            break
+        if depth == 1:
+            children.append(name)
+    return children
+
+
+async def time_to_ready(timeout: float = 60.0) -> float:
+    port = free_port()
+    started = time.perf_counter()
+    server = start_server(1, port, users=10, seed=42, warm=True)
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}") as client:
+            while time.perf_counter() - started < timeout:
+                try:
+                    if (await client.get("/ready")).status_code == 200:
+                        return time.perf_counter() - started
+                except httpx.TransportError:
+                    pass
+                await asyncio.sleep(0.05)
+        raise RuntimeError("Server did not become ready.")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Report API import time and time to readiness.")
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters to take the median over")
+    parser.add_argument("--top", type=int, default=15, help="slowest top-level imports to list")
+    parser.add_argument("--ready", action="store_true", help="also time a gunicorn worker until /ready")
+    args = parser.parse_args(argv)
+
+    profiles = [import_profile(TARGET) for _ in range(args.runs)]
+    median = lambda name, field: statistics.median(p[name][field] for p in profiles if name in p) / 1000
+
+    print(f"import {TARGET}: {median(TARGET, 1):.1f} ms (median of {args.runs})")
+    # Direct children of the target: what its own import statements cost
+    children = direct_imports(profiles[0], TARGET)
+    children.sort(key=lambda name: median(name, 1), reverse=True)
+    print(f"{'module':<40} {'cumulative ms':>14} {'self ms':>8}")
+    for name in children[:args.top]:
+        print(f"{name:<40} {median(name, 1):>14.1f} {median(name, 0):>8.1f}")
+
+    status = 0
+    eager = [name for name in LAZY_MODULES if name in profiles[0]]
+    if eager:
+        print(f"FAIL: imported at startup but should be lazy: {', '.join(eager)}")
+        status = 1
+    else:
+        print(f"lazy modules not imported: {', '.join(LAZY_MODULES)}")
+
+    if args.ready:
+        print(f"gunicorn start to /ready (1 worker, stand-in database): {asyncio.run(time_to_ready()):.2f} s")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,61 @@
+# Synthetic cohort generator: users and subjects shaped like the MongoDB documents.
+import random
+from datetime import date, datetime, time, timedelta
+
+from bson import ObjectId
+
+DIFFICULTY_MIX = {"EASY": 0.3, "MEDIUM": 0.5, "HARD": 0.2}
+
+# Slot start times spread over a day, in minutes after midnight
+SLOT_STARTS = [6 * 60, 8 * 60, 10 * 60 + 30, 13 * 60, 15 * 60, 17 * 60 + 30, 19 * 60, 21 * 60]
+
+
+def _clock(minutes: int) -> str:
+    return f"{minutes // 60 % 24:02d}:{minutes % 60:02d}"
+
+
+def make_routine(rng: random.Random, slots: int) -> list:
+    routine = [{"action": "sleep", "time": "23:00 - 07:00"}]
+    for start in sorted(rng.sample(SLOT_STARTS, slots)):
+        length = rng.choice([30, 45, 60, 90, 120])
+        routine.append({"action": "learning", "time": f"{_clock(start)} - {_clock(start + length)}"})
+    return routine
+
+
+def make_cohort(
+    users: int,
+    seed: int = 42,
+    slots=(1, 5),
+    subjects=(1, 8),
+    topics=(1, 30),
+    horizon=(1, 365),
+    difficulty_mix: dict = None,
+    today: date = None,
+):
+    """Returns (user documents, subject documents) for a reproducible synthetic cohort.
+
+    slots, subjects, topics and horizon are inclusive (low, high) ranges: learning
+    slots per user, subjects per user, topics per subject and days until each exam.
+    """
+    rng = random.Random(seed)
+    # Ids come from their own generator: the same seed gives the same ids in every
+    # process (e.g. load-test workers) without changing the rest of the cohort
+    ids = random.Random(f"{seed}:ids")
+    mix = difficulty_mix or DIFFICULTY_MIX
+    difficulties, weights = list(mix), list(mix.values())
+    today_start = datetime.combine(today or date.today(), time.min)
+
+    user_docs, subject_docs = [], []
+    for u in range(users):
+        user_id = ObjectId(ids.randbytes(12))
+        user_docs.append({"_id": user_id, "name": f"user{u}", "dailyRoutine": make_routine(rng, rng.randint(*slots))})
+        for s in range(rng.randint(*subjects)):
+            subject_docs.append({
+                "_id": ObjectId(ids.randbytes(12)),
+                "userId": user_id,
+                "subjectName": f"Subject {s}",
+                "examDate": today_start + timedelta(days=rng.randint(*horizon)),
+                "examDifficulty": rng.choices(difficulties, weights)[0],
+                "topics": [{"name": f"Topic {s}.{t}", "notes": ""} for t in range(rng.randint(*topics))],
+            })
+    return user_docs, subject_docs
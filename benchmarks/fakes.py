@@ -0,0 +1,340 @@
+# In-memory stand-ins for the pymongo collections the planners use.
+# Only what app.repository needs is implemented: find_one, find (+ sort),
+# aggregate with $match / $project / $sort / $lookup, update_one for the plan
+# store, and single-field indexes so per-user lookups do not scan the whole
+# cohort. AsyncFakeCollection wraps one for the Motor-based request path, and
+# FakeChangeStream stands in for db.watch().
+import asyncio
+from datetime import datetime
+from types import SimpleNamespace
+
+import bson
+from bson import ObjectId
+
+from app.repository import ensure_indexes
+
+
+def _copy(value):
+    # Through BSON, as the driver does: tuples come back as lists, and the cost
+    # grows with document size the way encoding and decoding on the wire does
+    return bson.decode(bson.encode({"v": value}))["v"]
+
+
+def _get(doc, path: str):
+    for part in path.split("."):
+        if not isinstance(doc, dict):
+            return None
+        doc = doc.get(part)
+    return doc
+
+
+def _matches(doc: dict, query: dict) -> bool:
+    for field, condition in query.items():
+        value = _get(doc, field)
+        if isinstance(condition, dict) and any(key.startswith("$") for key in condition):
+            for op, operand in condition.items():
+                if op == "$in":
+                    ok = value in operand
+                elif op == "$ne":
+                    ok = value != operand
+                elif op == "$gt":
+                    ok = value is not None and value > operand
+                elif op == "$gte":
+                    ok = value is not None and value >= operand
+                elif op == "$lt":
+                    ok = value is not None and value < operand
+                else:
+                    raise NotImplementedError(f"Query operator {op} is not supported by the fake collection.")
+                if not ok:
+                    return False
+        elif value != condition:
+            return False
+    return True
+
+
+def _with_in_sets(query: dict) -> dict:
+    # $in against a set, so matching a chunk of users is not quadratic in its size
+    prepared = {}
+    for field, condition in query.items():
+        if isinstance(condition, dict) and isinstance(condition.get("$in"), (list, tuple)):
+            try:
+                condition = dict(condition, **{"$in": set(condition["$in"])})
+            except TypeError:  # unhashable values are matched against the list
+                pass
+        prepared[field] = condition
+    return prepared
+
+
+def _evaluate(expression, doc: dict, variables: dict):
+    # Enough of the aggregation expression language for plan_inputs_pipeline
+    if isinstance(expression, str) and expression.startswith("$$"):
+        name, _, path = expression[2:].partition(".")
+        value = variables[name]
+        return _get(value, path) if path else value
+    if isinstance(expression, str) and expression.startswith("$"):
+        return _get(doc, expression[1:])
+    if isinstance(expression, list):
+        return [_evaluate(item, doc, variables) for item in expression]
+    if not isinstance(expression, dict):
+        return expression
+
+    (op, args), = expression.items()
+    if op == "$ifNull":
+        value = _evaluate(args[0], doc, variables)
+        return value if value is not None else _evaluate(args[1], doc, variables)
+    if op == "$eq":
+        left, right = _evaluate(args, doc, variables)
+        return left == right
+    if op in ("$filter", "$map"):
+        items = _evaluate(args["input"], doc, variables) or []
+        name = args.get("as", "this")
+        if op == "$filter":
+            return [item for item in items if _evaluate(args["cond"], doc, dict(variables, **{name: item}))]
+        return [_evaluate(args["in"], doc, dict(variables, **{name: item})) for item in items]
+    raise NotImplementedError(f"Expression {op} is not supported by the fake collection.")
+
+
+def _project(doc: dict, projection: dict) -> dict:
+    if not projection:
+        return _copy(doc)
+    result = {"_id": doc["_id"]} if projection.get("_id", 1) and "_id" in doc else {}
+    for field, spec in projection.items():
+        if field == "_id":
+            continue
+        if spec == 1 or spec is True:
+            head, _, rest = field.partition(".")
+            if head not in doc:
+                continue
+            value = doc[head]
+            if rest and isinstance(value, list):
+                # "topics.name": keep only that field of each element
+                value = [{rest: item[rest]} for item in value if isinstance(item, dict) and rest in item]
+            result[head] = _copy(value)
+        else:
+            result[field] = _evaluate(spec, doc, {})
+    return result
+
+
+def _sorted(docs: list, keys) -> list:
+    for field, direction in reversed(list(keys)):
+        docs = sorted(docs, key=lambda doc: _get(doc, field), reverse=direction < 0)
+    return docs
+
+
+class FakeCursor:
+    def __init__(self, docs: list):
+        self._docs = docs
+
+    def sort(self, key, direction: int = 1):
+        keys = [(key, direction)] if isinstance(key, str) else key
+        self._docs = _sorted(self._docs, keys)
+        return self
+
+    def limit(self, count: int):
+        if count:
+            self._docs = self._docs[:count]
+        return self
+
+    def __iter__(self):
+        return iter(self._docs)
+
+
+class FakeCollection:
+    def __init__(self, name: str, database: "FakeDatabase"):
+        self.name = name
+        self.database = database
+        self._docs = []
+        self._indexes = {}  # field -> {value: [docs]}
+
+    def insert_many(self, docs):
+        for doc in docs:
+            self._docs.append(doc)
+            self._index(doc)
+
+    def _index(self, doc: dict):
+        for field, index in self._indexes.items():
+            index.setdefault(_get(doc, field), []).append(doc)
+
+    def _unindex(self, doc: dict):
+        for field, index in self._indexes.items():
+            index[_get(doc, field)].remove(doc)
+
+    def create_index(self, keys, **options):
+        # Compound indexes are served by their first field
+        field = keys if isinstance(keys, str) else keys[0][0]
+        if field not in self._indexes:
+            index = {}
+            for doc in self._docs:
+                index.setdefault(_get(doc, field), []).append(doc)
+            self._indexes[field] = index
+        return options.get("name", f"{field}_1")
+
+    def _candidates(self, query: dict) -> list:
+        for field, index in self._indexes.items():
+            condition = query.get(field)
+            if condition is None:
+                continue
+            if isinstance(condition, dict) and "$in" in condition:
+                return [doc for value in condition["$in"] for doc in index.get(value, ())]
+            if not isinstance(condition, dict):
+                return index.get(condition, [])
+        return self._docs
+
+    def find(self, query: dict = None, projection: dict = None) -> FakeCursor:
+        query = query or {}
+        matcher = _with_in_sets(query)
+        return FakeCursor([_project(doc, projection) for doc in self._candidates(query) if _matches(doc, matcher)])
+
+    def find_one(self, query: dict = None, projection: dict = None):
+        return next(iter(self.find(query, projection)), None)
+
+    def update_one(self, query: dict, update: dict, upsert: bool = False):
+        # $set, $setOnInsert and $inc on top-level fields, which is what the plan store writes
+        doc = next((doc for doc in self._candidates(query) if _matches(doc, query)), None)
+        matched = doc is not None
+        if doc is None:
+            if not upsert:
+                return False
+            doc = {"_id": ObjectId(), **{k: v for k, v in query.items() if not isinstance(v, dict)}}
+            doc.update(_copy(update.get("$setOnInsert", {})))
+            self._docs.append(doc)
+        else:
+            self._unindex(doc)
+        doc.update(_copy(update.get("$set", {})))
+        for field, amount in update.get("$inc", {}).items():
+            doc[field] = doc.get(field, 0) + amount
+        self._index(doc)
+        return matched
+
+    def bulk_write(self, requests, ordered: bool = True):
+        # UpdateOne requests only, which is what the plan store and rollover send
+        matched = sum(self.update_one(op._filter, op._doc, op._upsert) for op in requests)
+        return SimpleNamespace(matched_count=matched)
+
+    def aggregate(self, pipeline: list) -> FakeCursor:
+        docs = None
+        for stage in pipeline:
+            (op, spec), = stage.items()
+            if docs is None and op == "$match":
+                docs = [doc for doc in self._candidates(spec) if _matches(doc, spec)]
+                continue
+            if docs is None:
+                docs = list(self._docs)
+            if op == "$match":
+                docs = [doc for doc in docs if _matches(doc, spec)]
+            elif op == "$project":
+                docs = [_project(doc, spec) for doc in docs]
+            elif op == "$sort":
+                docs = _sorted(docs, spec.items())
+            elif op == "$lookup":
+                foreign = self.database[spec["from"]]
+                for i, doc in enumerate(docs):
+                    stages = [{"$match": {spec["foreignField"]: _get(doc, spec["localField"])}}] + spec.get("pipeline", [])
+                    docs[i] = dict(doc, **{spec["as"]: list(foreign.aggregate(stages))})
+            else:
+                raise NotImplementedError(f"Stage {op} is not supported by the fake collection.")
+        return FakeCursor(list(docs if docs is not None else self._docs))
+
+
+class AsyncFakeCursor:
+    def __init__(self, cursor: FakeCursor):
+        self._cursor = cursor
+
+    def sort(self, key, direction: int = 1):
+        self._cursor.sort(key, direction)
+        return self
+
+    def limit(self, count: int):
+        self._cursor.limit(count)
+        return self
+
+    async def to_list(self, length=None):
+        docs = list(self._cursor)
+        return docs if length is None else docs[:length]
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for doc in self._cursor:
+            yield doc
+
+
+class AsyncFakeDatabase:
+    def __init__(self, database: "FakeDatabase"):
+        self._database = database
+
+    def __getitem__(self, name: str) -> "AsyncFakeCollection":
+        return AsyncFakeCollection(self._database[name])
+
+    async def command(self, name: str):
+        return {"ok": 1.0}
+
+
+class AsyncFakeCollection:
+    """Motor-style awaitable view of a FakeCollection."""
+
+    def __init__(self, collection: FakeCollection):
+        self.collection = collection
+        self.name = collection.name
+        self.database = AsyncFakeDatabase(collection.database)
+
+    def find(self, query: dict = None, projection: dict = None) -> AsyncFakeCursor:
+        return AsyncFakeCursor(self.collection.find(query, projection))
+
+    def aggregate(self, pipeline: list) -> AsyncFakeCursor:
+        return AsyncFakeCursor(self.collection.aggregate(pipeline))
+
+    async def find_one(self, query: dict = None, projection: dict = None):
+        return self.collection.find_one(query, projection)
+
+    async def update_one(self, query: dict, update: dict, upsert: bool = False):
+        return self.collection.update_one(query, update, upsert)
+
+
+class FakeChangeStream:
+    """An append-only change log with db.watch() semantics, for app.precompute.
+
+    Calling it with a resume token replays every event after that token and then
+    waits for new ones; without a token it starts from the next event.
+    """
+
+    def __init__(self):
+        self.events = []
+        self._changed = asyncio.Condition()
+
+    async def emit(self, change: dict):
+        """Appends an event, giving it a resume token and wallTime like a server would."""
+        change = dict(change, _id={"_data": f"{len(self.events):016d}"}, wallTime=datetime.utcnow())
+        self.events.append(change)
+        async with self._changed:
+            self._changed.notify_all()
+
+    async def __call__(self, resume_after=None):
+        position = int(resume_after["_data"]) + 1 if resume_after else len(self.events)
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(lambda: position < len(self.events))
+            while position < len(self.events):
+                yield self.events[position]
+                position += 1
+
+
+class FakeDatabase:
+    def __init__(self):
+        self._collections = {}
+
+    def __getitem__(self, name: str) -> FakeCollection:
+        if name not in self._collections:
+            self._collections[name] = FakeCollection(name, self)
+        return self._collections[name]
+
+
+def load_cohort(users: list, subjects: list) -> FakeDatabase:
+    """A fake database holding the cohort, with the app's subject and plan indexes."""
+    database = FakeDatabase()
+    database["users"].create_index("_id")
+    ensure_indexes(database)
+    database["users"].insert_many(users)
+    database["subjects"].insert_many(subjects)
+    return database
@@ -0,0 +1,146 @@
+# HTTP load test of the production server profile against the in-memory stand-in
+# (benchmarks.standin_app), repeated for several worker counts to show how
+# throughput scales with processes.
+#
+#   python -m benchmarks.loadtest --workers 1 2 4 --duration 15 --concurrency 64
+#
+# By default the plan caches and the plan store are disabled in the server, so
+# every request is planned and the numbers reflect CPU-bound throughput; --warm
+# keeps them. Needs gunicorn and httpx.
+import argparse
+import asyncio
+import itertools
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+
+from benchmarks.bench_planner import percentile
+from benchmarks.cohort import make_cohort
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(workers: int, port: int, users: int, seed: int, warm: bool) -> subprocess.Popen:
+    env = dict(
+        os.environ,
+        WEB_CONCURRENCY=str(workers),
+        GUNICORN_BIND=f"127.0.0.1:{port}",
+        LOADTEST_USERS=str(users),
+        LOADTEST_SEED=str(seed),
+        PLAN_SUMMARY_BACKEND="stub",
+    )
+    if not warm:
+        env.update(PLAN_CACHE_MAX_ENTRIES="0", PLAN_INPUTS_CACHE_MAX_ENTRIES="0", LOADTEST_PLAN_STORE="0")
+    return subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "benchmarks.standin_app:app"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+
+
+async def wait_ready(base_url: str, workers: int, timeout: float = 60.0):
+    # Ready once the port answers; then give the remaining workers a moment to boot
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get("/cache-stats")).status_code == 200:
+                    await asyncio.sleep(0.5 * workers)
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"Server at {base_url} did not start within {timeout:.0f}s.")
+
+
+async def run_load(base_url: str, user_ids: list, concurrency: int, duration: float) -> dict:
+    ids = itertools.cycle(user_ids)
+    latencies, errors = [], 0
+    deadline = time.monotonic() + duration
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async def client_loop(client):
+        nonlocal errors
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            try:
+                response = await client.get("/generate-user-plan", params={"userId": next(ids)})
+                ok = response.status_code == 200
+            except httpx.HTTPError:
+                ok = False
+            if ok:
+                latencies.append((time.perf_counter() - started) * 1000)
+            else:
+                errors += 1
+
+    started = time.monotonic()
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30.0) as client:
+        await asyncio.gather(*(client_loop(client) for _ in range(concurrency)))
+    elapsed = time.monotonic() - started
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 0.50) if latencies else 0.0,
+        "p99_ms": percentile(latencies, 0.99) if latencies else 0.0,
+    }
+
+
+async def measure(workers: int, args, user_ids: list) -> dict:
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    server = start_server(workers, port, args.users, args.seed, args.warm)
+    try:
+        await wait_ready(base_url, workers)
+        if args.warmup:
+            await run_load(base_url, user_ids, args.concurrency, args.warmup)
+        return await run_load(base_url, user_ids, args.concurrency, args.duration)
+    finally:
+        # SIGTERM drains in-flight requests, the same path as a deploy
+        server.send_signal(signal.SIGTERM)
+        try:
+            server.wait(timeout=40)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the API at several gunicorn worker counts.")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="worker counts to try")
+    parser.add_argument("--users", type=int, default=1000, help="synthetic users in the stand-in database")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--concurrency", type=int, default=64, help="concurrent client connections")
+    parser.add_argument("--duration", type=float, default=15.0, help="measured seconds per worker count")
+    parser.add_argument("--warmup", type=float, default=2.0, help="unmeasured seconds before each run")
+    parser.add_argument("--warm", action="store_true", help="keep the plan caches and store enabled")
+    args = parser.parse_args(argv)
+
+    user_docs, _ = make_cohort(args.users, seed=args.seed)
+    user_ids = [str(doc["_id"]) for doc in user_docs]
+    print(f"{os.cpu_count()} CPUs, {args.users} users, {args.concurrency} connections, "
+          f"{'warm' if args.warm else 'cold'} caches")
+
+    print(f"{'workers':>7} {'req/s':>9} {'speedup':>8} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    base_rps = None
+    for workers in args.workers:
+        result = asyncio.run(measure(workers, args, user_ids))
+        base_rps = base_rps or result["rps"]
+        print(f"{workers:>7} {result['rps']:>9.1f} {result['rps'] / base_rps:>7.2f}x "
+              f"{result['p50_ms']:>8.1f} {result['p99_ms']:>8.1f} {result['errors']:>7}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,37 @@
+# The API served over an in-memory synthetic cohort instead of MongoDB, for load
+# tests: gunicorn -c gunicorn.conf.py benchmarks.standin_app:app
+#
+# LOADTEST_USERS and LOADTEST_SEED pick the cohort. Cohort ids are seeded, so
+# every worker process holds the same users. The plans collection is per worker;
+# LOADTEST_PLAN_STORE=0 leaves it out so every cache miss is planned again.
+import os
+
+# The lifespan still constructs a client; point it nowhere so a real database
+# from the environment or .env is never touched
+os.environ["MONGODB_URI"] = "mongodb://127.0.0.1:1"
+os.environ["MONGODB_CREATE_INDEXES"] = "0"
+# One load generator on one IP would trip the rate limits; set them to test admission control
+os.environ.setdefault("RATE_LIMIT_USER_PER_SECOND", "0")
+os.environ.setdefault("RATE_LIMIT_IP_PER_SECOND", "0")
+
+from app.db import (  # noqa: E402
+    get_async_plans_collection,
+    get_async_subjects_collection,
+    get_async_users_collection,
+)
+from app.main1 import app  # noqa: E402
+from benchmarks.cohort import make_cohort  # noqa: E402
+from benchmarks.fakes import AsyncFakeCollection, load_cohort  # noqa: E402
+
+USERS = int(os.getenv("LOADTEST_USERS", "1000"))
+SEED = int(os.getenv("LOADTEST_SEED", "42"))
+
+database = load_cohort(*make_cohort(USERS, seed=SEED))
+collections = {name: AsyncFakeCollection(database[name]) for name in ("users", "subjects", "plans")}
+
+app.dependency_overrides[get_async_users_collection] = lambda: collections["users"]
+app.dependency_overrides[get_async_subjects_collection] = lambda: collections["subjects"]
+if os.getenv("LOADTEST_PLAN_STORE", "1") == "1":
+    app.dependency_overrides[get_async_plans_collection] = lambda: collections["plans"]
+else:
+    app.dependency_overrides[get_async_plans_collection] = lambda: None
@@ -0,0 +1,40 @@
+# Production server profile: gunicorn managing uvicorn workers.
+#
+#   gunicorn -c gunicorn.conf.py app.main1:app
+#
+# The app is imported once in the master (preload_app) and the workers fork from
+# it, sharing the imported modules. MongoDB clients must not cross a fork, so
+# post_fork drops any the master created; each worker opens its own in the lifespan.
+# SIGTERM stops accepting connections and lets in-flight requests finish for up
+# to graceful_timeout seconds before the workers run their shutdown.
+import multiprocessing
+import os
+
+bind = os.getenv("GUNICORN_BIND") or f"0.0.0.0:{os.getenv('PORT', '10000')}"
+workers = int(os.getenv("WEB_CONCURRENCY") or multiprocessing.cpu_count())
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = os.getenv("GUNICORN_PRELOAD", "1") == "1"
+
+# Seconds an idle client connection is kept open; keep it above the load balancer's idle timeout
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "75"))
+# Pending connections queued by the kernel while every worker is busy
+backlog = int(os.getenv("GUNICORN_BACKLOG", "2048"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+# Recycle workers now and then to cap slow memory growth; 0 disables it
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "0"))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", "0"))
+
+# Worker heartbeat files on tmpfs, so a slow container disk cannot stall them
+if os.path.isdir("/dev/shm"):
+    worker_tmp_dir = "/dev/shm"
+forwarded_allow_ips = os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1")
+accesslog = os.getenv("GUNICORN_ACCESS_LOG") or None
+errorlog = "-"
+loglevel = os.getenv("GUNICORN_LOG_LEVEL", "info")
+
+
+def post_fork(server, worker):
+    from app.db import reset_clients_after_fork
+
+    reset_clients_after_fork()
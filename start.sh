@@ -1,2 +1,3 @@
 #!/bin/bash
-uvicorn app.main1:app --host 0.0.0.0 --port 10000
+# Multi-worker server; see gunicorn.conf.py (WEB_CONCURRENCY sets the worker count)
+exec gunicorn -c gunicorn.conf.py app.main1:app
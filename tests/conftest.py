@@ -0,0 +1,81 @@
+# Shared fixtures. Everything runs against the in-memory fake collections from
+# benchmarks.fakes, so no MongoDB is needed.
+import os
+
+# Set before app.main1 is imported: never reach a real database, and keep the
+# rate limits out of the way unless a test turns them on
+os.environ["MONGODB_URI"] = "mongodb://127.0.0.1:1"
+os.environ["MONGODB_CREATE_INDEXES"] = "0"
+os.environ.setdefault("RATE_LIMIT_USER_PER_SECOND", "0")
+os.environ.setdefault("RATE_LIMIT_IP_PER_SECOND", "0")
+
+from datetime import date, datetime, time, timedelta  # noqa: E402
+
+import pytest  # noqa: E402
+from bson import ObjectId  # noqa: E402
+
+from app.planner import _inputs_cache  # noqa: E402
+from benchmarks.cohort import make_cohort  # noqa: E402
+from benchmarks.fakes import load_cohort  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    from app.cache import plan_cache
+
+    _inputs_cache.clear()
+    plan_cache.clear()
+    yield
+
+
+@pytest.fixture
+def database():
+    """A fake database with a small synthetic cohort."""
+    return load_cohort(*make_cohort(20, seed=7))
+
+
+@pytest.fixture
+def add_user(database):
+    """Adds a user with the given learning slots and (name, days until exam, topic count, difficulty) subjects."""
+
+    def add(slots, subjects=(), today: date = None):
+        today_start = datetime.combine(today or date.today(), time.min)
+        user_id = ObjectId()
+        routine = [{"action": "learning", "time": slot} for slot in slots]
+        database["users"].insert_many([{"_id": user_id, "name": "test", "dailyRoutine": routine}])
+        database["subjects"].insert_many([
+            {
+                "_id": ObjectId(),
+                "userId": user_id,
+                "subjectName": name,
+                "examDate": today_start + timedelta(days=days),
+                "examDifficulty": difficulty,
+                "topics": [{"name": f"{name} {t}"} for t in range(topics)],
+            }
+            for name, days, topics, difficulty in subjects
+        ])
+        return user_id
+
+    return add
+
+
+@pytest.fixture
+def client(database, monkeypatch):
+    """A TestClient for the API with every collection dependency pointed at the fake database."""
+    from fastapi.testclient import TestClient
+
+    from app import db, main1
+    from benchmarks.fakes import AsyncFakeCollection
+
+    overrides = {
+        db.get_users_collection: lambda: database["users"],
+        db.get_subjects_collection: lambda: database["subjects"],
+        db.get_async_users_collection: lambda: AsyncFakeCollection(database["users"]),
+        db.get_async_subjects_collection: lambda: AsyncFakeCollection(database["subjects"]),
+        db.get_async_plans_collection: lambda: AsyncFakeCollection(database["plans"]),
+    }
+    for dependency, override in overrides.items():
+        monkeypatch.setitem(main1.app.dependency_overrides, dependency, override)
+    # Batches are planned inline rather than in a process pool
+    monkeypatch.setattr(main1, "get_batch_executor", lambda: None)
+    return TestClient(main1.app)
@@ -0,0 +1,122 @@
+import asyncio
+import os
+import subprocess
+import sys
+
+import pytest
+
+from app.ratelimit import ConcurrencyGate, InMemoryBuckets, Overloaded, ip_limiter, plan_gate, rate_limit_backend, user_limiter
+
+
+def batch_requests(user_id):
+    return [
+        ("/generate-user-plans", {"userIds": [str(user_id)]}),
+        ("/cohort-plans", {"userIds": [str(user_id)], "rooms": [{"name": "Room 1", "capacity": 5}]}),
+    ]
+
+
+@pytest.fixture
+def user_id(add_user):
+    return add_user(["18:00 - 19:00"], [("Math", 10, 3, "EASY")])
+
+
+def test_per_ip_limit_is_off_unless_configured():
+    env = {key: value for key, value in os.environ.items() if key != "RATE_LIMIT_IP_PER_SECOND"}
+    rate = subprocess.run(
+        [sys.executable, "-c", "from app.ratelimit import ip_limiter; print(ip_limiter.rate)"],
+        env=env, cwd=os.path.dirname(os.path.dirname(__file__)), capture_output=True, text=True, check=True,
+    ).stdout
+    assert float(rate) == 0
+
+
+def test_batch_endpoints_take_a_gate_slot_and_give_it_back(client, user_id):
+    for path, body in batch_requests(user_id):
+        response = client.post(path, json=body)
+        assert response.status_code == 200, response.text
+        assert plan_gate.active == 0 and plan_gate.waiting == 0
+
+
+def test_batch_endpoints_answer_503_when_the_gate_is_full(client, user_id, monkeypatch):
+    monkeypatch.setattr(plan_gate, "active", plan_gate.limit)
+    monkeypatch.setattr(plan_gate, "max_waiting", 0)
+    for path, body in batch_requests(user_id):
+        response = client.post(path, json=body)
+        assert response.status_code == 503
+        assert "Retry-After" in response.headers
+
+
+def test_batch_endpoints_count_against_the_ip_rate(client, user_id, monkeypatch):
+    monkeypatch.setattr(ip_limiter, "rate", 0.001)
+    monkeypatch.setattr(ip_limiter, "burst", 1.0)
+    for path, body in batch_requests(user_id):
+        monkeypatch.setattr(ip_limiter, "scope", f"ip {path}")  # a fresh bucket per endpoint
+        assert client.post(path, json=body).status_code == 200
+        assert client.post(path, json=body).status_code == 429
+
+
+def test_malformed_user_ids_are_rejected_before_they_get_a_bucket(client, monkeypatch):
+    monkeypatch.setattr(user_limiter, "rate", 1.0)
+    buckets = len(rate_limit_backend)
+    for attempt in range(3):
+        assert client.get("/generate-user-plan", params={"userId": f"not-an-id-{attempt}"}).status_code == 400
+        assert client.post("/replan", params={"userId": f"not-an-id-{attempt}"}).status_code == 400
+    assert len(rate_limit_backend) == buckets
+
+
+def test_gate_queues_up_to_its_limit_then_sheds():
+    gate = ConcurrencyGate(limit=1, max_waiting=1, timeout=1.0)
+
+    async def main():
+        await gate.__aenter__()
+        queued = asyncio.ensure_future(gate.__aenter__())
+        await asyncio.sleep(0)
+        assert gate.waiting == 1
+        with pytest.raises(Overloaded):
+            await gate.__aenter__()  # queue full
+        await gate.__aexit__(None, None, None)
+        await queued  # the slot was handed over
+        assert (gate.active, gate.waiting) == (1, 0)
+
+    asyncio.run(main())
+
+
+def test_gate_sheds_waiters_that_time_out():
+    gate = ConcurrencyGate(limit=1, max_waiting=4, timeout=0.01)
+
+    async def main():
+        await gate.__aenter__()
+        with pytest.raises(Overloaded):
+            await gate.__aenter__()
+        assert (gate.active, gate.waiting) == (1, 0)
+
+    asyncio.run(main())
+
+
+def test_token_bucket_refills_at_its_rate(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr("app.ratelimit.time.monotonic", lambda: now[0])
+    buckets = InMemoryBuckets()
+    assert [buckets.take("k", rate=2, burst=2) for _ in range(2)] == [0, 0]
+    assert buckets.take("k", rate=2, burst=2) == pytest.approx(0.5)
+    now[0] += 0.5
+    assert buckets.take("k", rate=2, burst=2) == 0
+
+
+def test_user_over_its_rate_gets_429(client, user_id, monkeypatch):
+    monkeypatch.setattr(user_limiter, "rate", 0.001)
+    monkeypatch.setattr(user_limiter, "burst", 1.0)
+    assert client.get("/generate-user-plan", params={"userId": str(user_id)}).status_code == 200
+    response = client.get("/generate-user-plan", params={"userId": str(user_id)})
+    assert response.status_code == 429 and "Retry-After" in response.headers
+
+
+def test_a_full_gate_serves_the_last_cached_plan_or_503(client, user_id, add_user, monkeypatch):
+    fresh = client.get("/generate-user-plan", params={"userId": str(user_id)}).json()
+    monkeypatch.setattr(plan_gate, "active", plan_gate.limit)
+    monkeypatch.setattr(plan_gate, "max_waiting", 0)
+
+    response = client.get("/generate-user-plan", params={"userId": str(user_id)})
+    assert response.status_code == 200 and response.headers["X-Plan-Stale"] == "1"
+    assert response.json()["stale"] and response.json()["entries"] == fresh["entries"]
+    never_planned = add_user(["18:00 - 19:00"], [("Art", 5, 2, "EASY")])
+    assert client.get("/generate-user-plan", params={"userId": str(never_planned)}).status_code == 503
@@ -0,0 +1,74 @@
+import json
+import threading
+import time
+
+from app import batch, main1
+from app.batch import generate_plans, write_plans
+
+
+def test_bad_routine_does_not_stop_the_run(database, add_user):
+    good = add_user(["18:00 - 19:00"], [("Math", 10, 3, "EASY")])
+    bad = add_user(["8am - 10am"], [("Math", 10, 3, "EASY")])
+    after = add_user(["07:00 - 08:00"], [("Art", 5, 2, "EASY")])
+
+    results = {user_id: plan for user_id, _, plan in generate_plans(
+        database["users"], database["subjects"], [good, bad, after], chunk_size=2
+    )}
+
+    assert "8am" in results[str(bad)]["error"]
+    assert results[str(good)]["entries"] and results[str(after)]["entries"]
+
+
+def test_error_results_are_not_stored(database, add_user):
+    good = add_user(["18:00 - 19:00"], [("Math", 10, 3, "EASY")])
+    bad = add_user(["25:00 - 26:00"], [("Math", 10, 3, "EASY")])
+
+    results = generate_plans(database["users"], database["subjects"], [good, bad])
+    assert len(list(write_plans(database["plans"], results))) == 2
+
+    assert database["plans"].find_one({"userId": good}) is not None
+    assert database["plans"].find_one({"userId": bad}) is None
+
+
+def test_endpoint_reports_the_bad_user_and_keeps_streaming(client, add_user):
+    good = add_user(["18:00 - 19:00"], [("Math", 10, 3, "EASY")])
+    bad = add_user(["8am - 10am"], [("Math", 10, 3, "EASY")])
+
+    response = client.post("/generate-user-plans", json={"userIds": [str(bad), str(good), "nope"]})
+
+    assert response.status_code == 200
+    lines = {line["user_id"]: line for line in map(json.loads, response.text.splitlines())}
+    assert "error" in lines[str(bad)]
+    assert lines[str(good)]["plan"]["entries"]
+    assert "error" in lines["nope"]
+
+
+def test_concurrent_first_batches_start_one_pool(monkeypatch):
+    started = []
+
+    def make_executor(workers):
+        time.sleep(0.01)  # widen the window two unguarded callers would both fall into
+        started.append(workers)
+        return object()
+
+    monkeypatch.setattr(batch, "make_executor", make_executor)
+    monkeypatch.setattr(main1, "_batch_executor", None)
+    threads = [threading.Thread(target=main1.get_batch_executor) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(started) == 1
+
+
+def test_batch_pool_splits_the_cpus_between_web_workers(monkeypatch):
+    monkeypatch.setattr(main1.os, "cpu_count", lambda: 8)
+    monkeypatch.delenv("BATCH_WORKERS", raising=False)
+    monkeypatch.setenv("WEB_CONCURRENCY", "4")
+    assert main1.batch_workers() == 2
+    monkeypatch.setenv("WEB_CONCURRENCY", "16")
+    assert main1.batch_workers() == 1
+    monkeypatch.delenv("WEB_CONCURRENCY")
+    assert main1.batch_workers() == 1
+    monkeypatch.setenv("BATCH_WORKERS", "3")
+    assert main1.batch_workers() == 3
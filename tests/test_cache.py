@@ -0,0 +1,100 @@
+import asyncio
+from datetime import date
+
+from bson import ObjectId
+from pymongo.errors import AutoReconnect, OperationFailure
+
+from app import cache as cache_module
+from app.cache import LRUTTLBackend, PlanCache, consume_changes
+
+TODAY = date(2026, 1, 5)
+
+
+def test_unchanged_inputs_are_planned_once():
+    cache, runs = PlanCache(LRUTTLBackend()), []
+    compute = lambda: runs.append(1) or {"plan": len(runs)}
+    slots, subjects = ["18:00 - 19:00"], [{"subjectName": "Math"}]
+    first = cache.get_or_compute("u", TODAY, slots, subjects, compute)
+    assert cache.get_or_compute("u", TODAY, slots, subjects, compute) is first
+    cache.get_or_compute("u", TODAY, slots, [{"subjectName": "Art"}], compute)
+    assert len(runs) == 2
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 2
+
+
+def test_expired_plans_miss_but_stay_available_as_stale():
+    cache = PlanCache(LRUTTLBackend(), ttl=0, stale_ttl=60)
+    cache.store("u", TODAY, "f", {"plan": []})
+    assert cache.lookup("u", TODAY, "f") is None
+    assert cache.stale("u") == {"plan": []}
+
+
+def test_the_least_recently_used_entry_is_evicted():
+    backend = LRUTTLBackend(max_entries=2)
+    backend.set("a", "u1", 1, 60)
+    backend.set("b", "u2", 2, 60)
+    backend.get("a")
+    backend.set("c", "u3", 3, 60)
+    assert backend.get("b") is None
+    assert backend.get("a") == 1 and backend.get("c") == 3
+
+
+def test_invalidation_drops_every_entry_of_one_user():
+    cache = PlanCache(LRUTTLBackend())
+    for strategy in ("edf", "greedy"):
+        cache.store("u", TODAY, "f", {"plan": strategy}, strategy)
+    cache.store("other", TODAY, "f", {"plan": []})
+    assert cache.invalidate_user("u") == 4  # two plans and their stale copies
+    assert cache.lookup("u", TODAY, "f") is None and cache.stale("u", "greedy") is None
+    assert cache.lookup("other", TODAY, "f") == {"plan": []}
+
+
+def user_change(user_id, token):
+    return {"_id": {"_data": token}, "ns": {"coll": "users"}, "documentKey": {"_id": user_id}}
+
+
+def cached(cache, user_id):
+    return cache.lookup(str(user_id), TODAY, "f") is not None
+
+
+def watch(cache, runs, monkeypatch):
+    """Runs consume_changes over a source that plays `runs` in turn (an exception ends a run), then stops it."""
+    calls = []
+
+    async def source(resume_after=None):
+        calls.append(resume_after)
+        if len(calls) > len(runs):
+            raise asyncio.CancelledError
+        for event in runs[len(calls) - 1]:
+            if isinstance(event, Exception):
+                raise event
+            yield event
+
+    async def no_sleep(delay):
+        pass
+
+    monkeypatch.setattr(cache_module.asyncio, "sleep", no_sleep)
+    try:
+        asyncio.run(consume_changes(None, cache, source))
+    except asyncio.CancelledError:
+        pass
+    return calls
+
+
+def test_change_stream_errors_are_retried_from_the_last_token(monkeypatch):
+    cache = PlanCache(LRUTTLBackend())
+    first, second = ObjectId(), ObjectId()
+    for user_id in (first, second):
+        cache.store(str(user_id), TODAY, "f", {"plan": []})
+    calls = watch(cache, [[user_change(first, "1"), AutoReconnect("gone")], [ValueError("bad event")], [user_change(second, "2")]], monkeypatch)
+    assert calls[:3] == [None, {"_data": "1"}, {"_data": "1"}]
+    assert not cached(cache, first) and not cached(cache, second)
+
+
+def test_a_lost_resume_token_clears_the_cache(monkeypatch):
+    cache = PlanCache(LRUTTLBackend())
+    first, other = ObjectId(), ObjectId()
+    cache.store(str(other), TODAY, "f", {"plan": []})
+    history_lost = OperationFailure("too old", code=cache_module.CHANGE_STREAM_HISTORY_LOST)
+    calls = watch(cache, [[user_change(first, "1"), history_lost], []], monkeypatch)
+    assert calls[:2] == [None, None]
+    assert not cached(cache, other)
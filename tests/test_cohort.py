@@ -0,0 +1,36 @@
+import json
+from datetime import date
+
+from app.cohort import plan_cohort
+from benchmarks.bench_cohort import overbooked, rooms_full
+
+ROOMS = [{"name": "Room 1", "capacity": 1}]
+
+
+def test_bad_student_gets_an_error_line_and_the_cohort_is_planned(client, add_user):
+    good = add_user(["18:00 - 19:00"], [("Math", 10, 3, "EASY")])
+    bad = add_user(["8am - 10am"], [("Math", 10, 3, "EASY")])
+    other = add_user(["18:00 - 19:00"], [("Art", 10, 2, "EASY")])
+
+    response = client.post("/cohort-plans", json={"userIds": [str(good), str(bad), str(other)], "rooms": ROOMS})
+
+    assert response.status_code == 200, response.text
+    *students, rooms = map(json.loads, response.text.splitlines())
+    lines = {line["user_id"]: line for line in students}
+    assert "8am" in lines[str(bad)]["error"]
+    assert lines[str(good)]["plan"]["entries"] and lines[str(other)]["plan"]["entries"]
+    assert rooms["rooms"][0]["seats_booked"] > 0
+
+
+def test_bad_rooms_still_fail_the_request(client, add_user):
+    good = add_user(["18:00 - 19:00"], [("Math", 10, 3, "EASY")])
+    response = client.post("/cohort-plans", json={"userIds": [str(good)], "rooms": [{"name": "Room 1", "capacity": 0}]})
+    assert response.status_code == 400
+
+
+def test_tight_rooms_are_never_overbooked(database):
+    user_ids = [doc["_id"] for doc in database["users"].find({}, {"_id": 1})]
+    result = plan_cohort(database["users"], database["subjects"], user_ids, [{"name": "Room 1", "capacity": 2}], date.today())
+
+    assert rooms_full(result["plans"].values()) > 0
+    assert overbooked(result) == 0
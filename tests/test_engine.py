@@ -0,0 +1,96 @@
+import random
+from datetime import date
+
+from app.engine import CapacityCalendar, Difficulty, Subject, allocate_edf
+
+
+def scan_find_day(calendar, minutes, before):
+    for day in range(min(before, calendar.horizon)):
+        offset = day * calendar.slots
+        if max(calendar.remaining[offset:offset + calendar.slots]) >= minutes:
+            return day
+    return None
+
+
+def reference_edf(slot_minutes, horizon, subjects):
+    # Day by day, every pending topic in deadline order, placed if it fits
+    remaining = [list(slot_minutes) for _ in range(horizon)]
+    pending = sorted(
+        (subject.days_left, order, t, topic, subject.topic_minutes)
+        for order, subject in enumerate(subjects)
+        for t, topic in enumerate(subject.topics)
+    )
+    placed = set()
+    for day in range(horizon):
+        for item in list(pending):
+            deadline, order, _, topic, minutes = item
+            if deadline <= day:
+                pending.remove(item)
+                continue
+            slot = next((s for s, free in enumerate(remaining[day]) if free >= minutes), None)
+            if slot is not None:
+                remaining[day][slot] -= minutes
+                placed.add((day, slot, subjects[order].id, topic))
+                pending.remove(item)
+    return placed
+
+
+def random_subjects(rng, count):
+    return [
+        Subject(
+            str(s), f"S{s}", [f"t{s}.{t}" for t in range(rng.randint(1, 12))], Difficulty.MEDIUM,
+            rng.randint(1, 20), rng.choice([10, 20, 30, 45, 60, 90]),
+        )
+        for s in range(count)
+    ]
+
+
+def test_calendar_finds_the_earliest_day_through_bookings_and_moves():
+    rng = random.Random(1)
+    for _ in range(200):
+        calendar = CapacityCalendar([rng.randint(10, 200) for _ in range(rng.randint(1, 4))], rng.randint(1, 40))
+        for _ in range(30):
+            minutes, before = rng.randint(1, 120), rng.randint(1, 60)
+            day = calendar.find_day(minutes, before)
+            assert day == scan_find_day(calendar, minutes, before)
+            if day is not None:
+                calendar.take(day, minutes)
+            if rng.random() < 0.2:
+                calendar.advance(1)
+            if rng.random() < 0.2:
+                calendar.extend(calendar.horizon + 3)
+            rem, slots = calendar.remaining, calendar.slots
+            assert calendar.day_totals() == [sum(rem[i:i + slots]) for i in range(0, len(rem), slots)]
+
+
+def test_edf_matches_a_plain_day_by_day_fill():
+    rng = random.Random(2)
+    for _ in range(100):
+        slot_minutes = [rng.randint(10, 120) for _ in range(rng.randint(1, 3))]
+        subjects = random_subjects(rng, rng.randint(1, 6))
+        horizon = max(subject.days_left for subject in subjects)
+        placements = allocate_edf(CapacityCalendar(slot_minutes, horizon, date(2030, 1, 1)), subjects)
+        placed = {(p.day, p.slot, p.subject_id, p.topic) for p in placements if p.scheduled}
+        assert placed == reference_edf(slot_minutes, horizon, subjects)
+        assert len(placements) == sum(len(subject.topics) for subject in subjects)
+
+
+class CountingCalendar(CapacityCalendar):
+    probes = 0
+
+    def largest_free(self, day):
+        CountingCalendar.probes += 1
+        return super().largest_free(day)
+
+
+def test_edf_does_not_rescan_topics_too_big_for_the_leftover():
+    # Every day has 10 minutes left after a 60-minute topic; only one 10-minute topic ever fits it
+    subjects = [
+        Subject("a", "A", [f"a{i}" for i in range(2000)], Difficulty.HARD, 2100, 60),
+        Subject("b", "B", ["b0"], Difficulty.HARD, 2200, 10),
+    ]
+    calendar = CountingCalendar([70], 2200, date(2030, 1, 1))
+    CountingCalendar.probes = 0
+    placements = allocate_edf(calendar, subjects)
+    assert sum(p.scheduled for p in placements) == 2001
+    assert CountingCalendar.probes < 4 * (2001 + 2200)
@@ -0,0 +1,159 @@
+import random
+from datetime import date, datetime, time, timedelta
+
+from app.engine import normalize_subjects
+from app.replan import PlanState, subject_digest
+
+TODAY = date(2030, 3, 4)
+SLOTS = ["18:00 - 19:00", "20:00 - 20:30"]
+
+
+def subject(name, days, topics, difficulty="MEDIUM"):
+    return {
+        "_id": name,
+        "subjectName": name,
+        "examDate": datetime.combine(TODAY + timedelta(days=days), time.min),
+        "examDifficulty": difficulty,
+        "topics": [{"name": f"{name} {t}"} for t in range(topics)],
+    }
+
+
+def scheduled(state, subject_id):
+    return sorted((p.day, p.slot, p.topic) for p in state.subjects[subject_id].placements if p.scheduled)
+
+
+def assert_consistent(state):
+    """The calendar holds exactly what the placements book, and nothing sits on or after its exam."""
+    calendar = state.calendar
+    booked = [0] * len(calendar.remaining)
+    for record in state.subjects.values():
+        assert record.days_left > 0
+        for placement in record.placements:
+            if placement.scheduled:
+                assert 0 <= placement.day < record.days_left
+                booked[placement.day * calendar.slots + placement.slot] += placement.minutes
+    expected = [minutes - used for minutes, used in zip(calendar.slot_minutes * calendar.horizon, booked)]
+    assert list(calendar.remaining) == expected
+    assert min(calendar.remaining, default=0) >= 0
+
+
+def round_trip(state):
+    return PlanState.from_document(state.to_document())
+
+
+def test_unchanged_subjects_are_left_alone():
+    subjects = [subject("Math", 5, 4), subject("Art", 12, 8)]
+    state = round_trip(PlanState.build(SLOTS, subjects, TODAY))
+    before = state.to_document()
+    assert state.update(subjects, TODAY) == []
+    assert state.to_document() == before
+
+
+def test_removed_subject_releases_its_capacity():
+    subjects = [subject("Math", 5, 4), subject("Art", 12, 8)]
+    state = PlanState.build(SLOTS, subjects, TODAY)
+    free_before = sum(state.calendar.remaining)
+    math_minutes = sum(p.minutes for p in state.subjects["Math"].placements if p.scheduled)
+
+    assert state.update(subjects[1:], TODAY) == ["Math"]
+    assert "Math" not in state.subjects
+    assert sum(state.calendar.remaining) == free_before + math_minutes
+    assert_consistent(state)
+
+
+def test_edit_that_fits_touches_only_that_subject():
+    subjects = [subject("Math", 5, 2, "EASY"), subject("Art", 12, 3, "EASY")]
+    state = PlanState.build(SLOTS, subjects, TODAY)
+    art = scheduled(state, "Art")
+
+    subjects[0]["topics"].append({"name": "Math extra"})
+    assert state.update(subjects, TODAY) == ["Math"]
+    assert scheduled(state, "Art") == art
+    assert len(scheduled(state, "Math")) == 3
+    assert_consistent(state)
+
+
+def test_new_earlier_exam_displaces_later_subjects():
+    # One 60-minute slot a day: Art fills the first three days, then an exam sooner than Art's arrives
+    slots = ["18:00 - 19:00"]
+    subjects = [subject("Art", 10, 6, "HARD")]
+    state = PlanState.build(slots, subjects, TODAY)
+    assert [day for day, _, _ in scheduled(state, "Art")] == [0, 0, 1, 1, 2, 2]
+
+    subjects.append(subject("Math", 4, 3, "HARD"))
+    assert sorted(state.update(subjects, TODAY)) == ["Art", "Math"]
+    assert [day for day, _, _ in scheduled(state, "Math")] == [0, 1, 2]
+    assert len(scheduled(state, "Art")) == 6
+    assert_consistent(state)
+
+
+def test_freed_capacity_takes_topics_left_out_before():
+    slots = ["18:00 - 19:00"]
+    subjects = [subject("Math", 4, 3, "HARD"), subject("Art", 4, 3, "HARD")]
+    state = PlanState.build(slots, subjects, TODAY)
+    assert len(scheduled(state, "Math")) + len(scheduled(state, "Art")) == 3
+
+    state.update(subjects[1:], TODAY)
+    assert len(scheduled(state, "Art")) == 3
+    assert_consistent(state)
+
+
+def test_roll_drops_the_day_that_began_and_shifts_the_rest():
+    subjects = [subject("Math", 4, 6, "HARD"), subject("Art", 12, 6)]
+    state = round_trip(PlanState.build(SLOTS, subjects, TODAY))
+    tomorrow = TODAY + timedelta(days=1)
+    before = {record.id: (record.days_left, scheduled(state, record.id)) for record in state.subjects.values()}
+
+    state.roll(tomorrow)
+    assert state.calendar.start == tomorrow + timedelta(days=1)
+    for record in state.subjects.values():
+        days_left, placements = before[record.id]
+        assert record.days_left == days_left - 1
+        assert scheduled(state, record.id) == [(day - 1, slot, topic) for day, slot, topic in placements if day > 0]
+    assert_consistent(state)
+    # The rolled digests match the subjects as normalized on the new day
+    assert state.update(subjects, tomorrow) == []
+    assert state.matches(SLOTS, tomorrow)
+
+
+def test_roll_drops_subjects_whose_exam_has_come():
+    subjects = [subject("Math", 2, 1), subject("Art", 12, 3)]
+    state = PlanState.build(SLOTS, subjects, TODAY)
+    state.roll(TODAY + timedelta(days=2))
+    assert list(state.subjects) == ["Art"]
+    assert_consistent(state)
+
+
+def test_roll_places_subjects_that_became_urgent_again():
+    subjects = [subject("Math", 3, 2, "EASY"), subject("Art", 12, 3)]
+    state = PlanState.build(SLOTS, subjects, TODAY)
+    assert state.roll(TODAY + timedelta(days=1)) == ["Math"]
+    assert state.subjects["Math"].days_left == 1
+    assert_consistent(state)
+
+
+def test_random_edits_and_rolls_keep_the_state_consistent():
+    rng = random.Random(11)
+    for _ in range(40):
+        today = TODAY
+        subjects = [subject(f"S{i}", rng.randint(2, 25), rng.randint(1, 10), rng.choice(["EASY", "MEDIUM", "HARD"]))
+                    for i in range(rng.randint(1, 5))]
+        state = PlanState.build(SLOTS, subjects, today)
+        for step in range(12):
+            action = rng.random()
+            if action < 0.3:
+                rng.choice(subjects)["topics"].append({"name": f"extra {step}"})
+            elif action < 0.4 and len(subjects) > 1:
+                subjects.remove(rng.choice(subjects))
+            elif action < 0.6:
+                subjects.append(subject(f"N{step}", rng.randint(2, 25), rng.randint(1, 6)))
+            else:
+                today += timedelta(days=1)
+                state = round_trip(state)
+                state.roll(today)
+            state.update(subjects, today)
+            assert_consistent(state)
+            current = {s.id: s for group in normalize_subjects(subjects, today) for s in group}
+            assert set(state.subjects) == set(current)
+            for subject_id, record in state.subjects.items():
+                assert record.digest == subject_digest(current[subject_id])
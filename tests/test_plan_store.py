@@ -0,0 +1,50 @@
+from datetime import date, datetime, time, timedelta
+
+from bson import ObjectId
+
+from app.cache import plan_fingerprint
+from app.plan_store import plan_update, stored_state
+from app.repository import PLAN_INDEXES, load_plan_inputs, load_plan_inputs_bulk
+from benchmarks.fakes import _matches
+
+
+def test_subjects_on_the_same_exam_date_come_back_in_one_order(database, add_user):
+    today = date.today()
+    user_id = add_user(["18:00 - 19:00"])
+    exam = datetime.combine(today + timedelta(days=5), time.min)
+    first, second = ObjectId(), ObjectId()
+    # Inserted newest first, so insertion order and _id order disagree
+    database["subjects"].insert_many([
+        {"_id": _id, "userId": user_id, "subjectName": name, "examDate": exam, "topics": [{"name": name}]}
+        for _id, name in [(second, "Art"), (first, "Math")]
+    ])
+
+    learning_times, subjects = load_plan_inputs(database["users"], database["subjects"], user_id, today)
+    assert [subject["_id"] for subject in subjects] == [first, second]
+    (_, bulk), = load_plan_inputs_bulk(database["users"], database["subjects"], [user_id], today)
+    assert plan_fingerprint(*bulk) == plan_fingerprint(learning_times, subjects)
+
+
+def expires(doc) -> bool:
+    """Whether the TTL index would remove doc once its expiresAt has passed."""
+    (_, options), = [(keys, options) for keys, options in PLAN_INDEXES if "expireAfterSeconds" in options]
+    return "expiresAt" in doc and _matches(doc, options.get("partialFilterExpression", {}))
+
+
+def test_ttl_keeps_documents_holding_a_current_replanning_state(database):
+    plans = database["plans"]
+    today = date.today()
+    plain, with_state = ObjectId(), ObjectId()
+    plans.update_one(*plan_update(plain, "f", {"entries": []}, today, "edf"), upsert=True)
+    plans.update_one(*plan_update(
+        with_state, "f", {"entries": [], "revision": "r1"}, today, "edf", state={"subjects": []}
+    ), upsert=True)
+    assert expires(plans.find_one({"userId": plain}))
+    assert not expires(plans.find_one({"userId": with_state}))
+    assert stored_state(plans.find_one({"userId": with_state})) == ({"subjects": []}, True)
+
+    # A later plan-only write, such as the nightly batch, leaves the state behind no longer current
+    plans.update_one(*plan_update(with_state, "g", {"entries": []}, today, "edf"), upsert=True)
+    doc = plans.find_one({"userId": with_state})
+    assert stored_state(doc) == ({"subjects": []}, False)
+    assert expires(doc)
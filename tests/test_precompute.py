@@ -0,0 +1,83 @@
+import asyncio
+from datetime import date
+
+from app.cache import plan_fingerprint
+from app.planner import load_plan_inputs
+from app.precompute import STATE_COLLECTION, Debouncer, PrecomputeWorker
+from benchmarks.fakes import AsyncFakeDatabase, FakeChangeStream
+
+
+async def until(condition, timeout: float = 5.0):
+    async def poll():
+        while not condition():
+            await asyncio.sleep(0.005)
+    await asyncio.wait_for(poll(), timeout)
+
+
+def test_restart_resumes_after_the_last_stored_plan(database, add_user):
+    user_id = add_user(["18:00 - 19:00"], [("Math", 10, 3, "EASY")])
+    subject = database["subjects"].find_one({"userId": user_id})
+    stream = FakeChangeStream()
+
+    def plan_is_current():
+        doc = database["plans"].find_one({"userId": user_id})
+        inputs = load_plan_inputs(database["users"], database["subjects"], user_id, date.today())
+        return doc is not None and doc["fingerprint"] == plan_fingerprint(*inputs)
+
+    def resume_token():
+        doc = database[STATE_COLLECTION].find_one({"_id": "plans"})
+        return doc and doc["resumeToken"]["_data"]
+
+    async def edit(topics: int):
+        topics = [{"name": f"Math {t}"} for t in range(topics)]
+        database["subjects"].update_one({"_id": subject["_id"]}, {"$set": {"topics": topics}})
+        await stream.emit({
+            "operationType": "update", "ns": {"coll": "subjects"}, "documentKey": {"_id": subject["_id"]},
+            "fullDocument": dict(subject, topics=topics),
+        })
+
+    async def worker_run(quiet: float, until_done):
+        worker = PrecomputeWorker(AsyncFakeDatabase(database), stream, debouncer=Debouncer(quiet, quiet))
+        task = asyncio.create_task(worker.run())
+        await until_done(worker)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    async def main():
+        # A worker that plans the edit checkpoints its token on shutdown
+        async def planned(worker):
+            await asyncio.sleep(0.01)  # let the worker open the stream
+            await edit(4)
+            await until(plan_is_current)
+        await worker_run(0.0, planned)
+        assert resume_token() == "0" * 16
+
+        # Stopped while an edit is still debouncing: the token stays before it
+        async def received(worker):
+            await edit(5)
+            await until(lambda: worker.pending == 1)
+        await worker_run(60.0, received)
+        assert resume_token() == "0" * 16 and not plan_is_current()
+
+        # The next worker replays the pending edit from the stored token
+        async def replayed(worker):
+            await until(plan_is_current)
+        await worker_run(0.0, replayed)
+        assert resume_token() == "0" * 15 + "1"
+
+    asyncio.run(main())
+
+
+def test_a_burst_of_edits_is_released_once_it_goes_quiet():
+    now = [0.0]
+    debouncer = Debouncer(quiet=2, max_delay=5, clock=lambda: now[0])
+    for seq in range(1, 4):
+        debouncer.add("u", seq, 100.0 + seq)
+        now[0] += 1
+    assert debouncer.pop_due() == [] and debouncer.next_due() == 1
+    now[0] += 1
+    assert debouncer.pop_due() == [("u", 1, 101.0)]  # keeps the first edit's seq for the checkpoint
+    for _ in range(6):
+        debouncer.add("v", 9, 0.0)
+        now[0] += 1
+    assert [user_id for user_id, _, _ in debouncer.pop_due()] == ["v"]  # max_delay caps a busy editor
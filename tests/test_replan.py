@@ -0,0 +1,67 @@
+from app.cache import plan_cache
+from app.metrics import PLANS
+
+
+def plan_entries(response):
+    assert response.status_code == 200, response.text
+    return response.json()["entries"]
+
+
+def add_topic(database, user_id, subject_name):
+    subject = database["subjects"].find_one({"userId": user_id, "subjectName": subject_name})
+    database["subjects"].update_one(
+        {"_id": subject["_id"]}, {"$set": {"topics": subject["topics"] + [{"name": "Added"}]}}
+    )
+
+
+def test_get_serves_the_patched_plan(client, database, add_user):
+    user_id = add_user(["18:00 - 19:00", "20:00 - 20:45"], [
+        ("Math", 3, 4, "HARD"), ("Art", 9, 6, "MEDIUM"), ("History", 20, 5, "EASY"),
+    ])
+    params = {"userId": str(user_id)}
+    assert client.post("/replan", params=params).json()["replan"]["mode"] == "full"
+
+    add_topic(database, user_id, "Math")
+    computed = PLANS.value(strategy="edf")
+    replanned = client.post("/replan", params=params).json()
+    assert replanned["replan"]["mode"] == "incremental"
+
+    served = client.get("/generate-user-plan", params=params)
+    assert plan_entries(served) == replanned["entries"]
+    assert PLANS.value(strategy="edf") == computed
+
+    # Another worker, or this one after a restart, finds the same plan in the store
+    plan_cache.clear()
+    again = client.get("/generate-user-plan", params=params)
+    assert plan_entries(again) == replanned["entries"]
+    assert again.headers["ETag"] == served.headers["ETag"]
+    assert PLANS.value(strategy="edf") == computed
+
+
+def test_patched_and_fresh_plans_have_different_etags(client, database, add_user):
+    user_id = add_user(["18:00 - 19:00"], [("Math", 3, 2, "EASY"), ("Art", 9, 6, "MEDIUM")])
+    params = {"userId": str(user_id)}
+    fresh = client.get("/generate-user-plan", params=params)
+
+    client.post("/replan", params=params)
+    patched = client.get("/generate-user-plan", params=params)
+    assert patched.headers["ETag"] != fresh.headers["ETag"]
+
+    revalidated = client.get("/generate-user-plan", params=params, headers={"If-None-Match": patched.headers["ETag"]})
+    assert revalidated.status_code == 304
+    stale = client.get("/generate-user-plan", params=params, headers={"If-None-Match": fresh.headers["ETag"]})
+    assert stale.status_code == 200
+
+
+def test_replan_after_a_plan_only_write_rebuilds_instead_of_patching(client, database, add_user):
+    user_id = add_user(["18:00 - 19:00", "20:00 - 20:45"], [("Math", 3, 4, "HARD"), ("Art", 9, 6, "MEDIUM")])
+    params = {"userId": str(user_id)}
+    client.post("/replan", params=params)
+
+    # The edit is seen by a GET first, which stores a fresh plan without a state
+    add_topic(database, user_id, "Art")
+    served = plan_entries(client.get("/generate-user-plan", params=params))
+
+    replanned = client.post("/replan", params=params).json()
+    assert replanned["replan"]["mode"] == "rebuilt"
+    assert replanned["entries"] == served
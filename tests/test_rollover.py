@@ -0,0 +1,79 @@
+import random
+from datetime import date, timedelta
+
+from bson import ObjectId
+
+from app.cache import plan_fingerprint
+from app.plan_store import plan_etag, plan_update
+from app.planner import DEFAULT_STRATEGY, build_plan, load
+from app.replan import PlanState
+from app.rollover import run_rollover
+
+TODAY = date.today()
+YESTERDAY = TODAY - timedelta(days=1)
+
+
+def store_state(database, user_id):
+    """Stores the plan and state a request made yesterday would have left."""
+    learning_times, subjects = load(database["users"], database["subjects"], user_id, YESTERDAY)
+    state = PlanState.build(learning_times, subjects, YESTERDAY)
+    database["plans"].update_one(*plan_update(
+        user_id, plan_fingerprint(learning_times, subjects), state.to_plan(str(user_id)), YESTERDAY,
+        DEFAULT_STRATEGY, state.to_document(),
+    ), upsert=True)
+
+
+def rollover(database):
+    return run_rollover(database, TODAY, window=0, rng=random.Random(1), sleep=lambda seconds: None)
+
+
+def test_a_user_that_cannot_be_planned_does_not_stop_the_run(database, add_user):
+    subjects = [("Math", 6, 4, "MEDIUM"), ("Art", 12, 5, "EASY")]
+    users = [add_user(["18:00 - 19:00"], subjects) for _ in range(3)]
+    for user_id in users:
+        store_state(database, user_id)
+    bad = users[1]
+    database["users"].update_one({"_id": bad}, {"$set": {"dailyRoutine": [{"action": "learning", "time": "8am - 10am"}]}})
+
+    outcomes = rollover(database)
+
+    assert outcomes["failed"] == 1 and outcomes["rebuilt"] + outcomes["rolled"] == 2
+    assert database["plans"].find_one({"userId": bad})["date"] == YESTERDAY.isoformat()
+    for user_id in (users[0], users[2]):
+        assert database["plans"].find_one({"userId": user_id})["date"] == TODAY.isoformat()
+
+
+def test_rolled_plan_has_its_own_etag(client, database, add_user):
+    user_id = add_user(["18:00 - 19:00", "20:00 - 20:30"], [("Math", 3, 4, "HARD"), ("Art", 12, 6, "MEDIUM")])
+    store_state(database, user_id)
+    assert rollover(database)["rolled"] == 1
+
+    response = client.get("/generate-user-plan", params={"userId": str(user_id)})
+    assert response.status_code == 200, response.text
+    stored = database["plans"].find_one({"userId": user_id})["plan"]
+    assert response.json()["entries"] == stored["entries"]
+    revision = stored["revision"]
+    fingerprint = plan_fingerprint(*load(database["users"], database["subjects"], user_id, TODAY))
+    fresh = plan_etag(fingerprint, TODAY, DEFAULT_STRATEGY, "json:json")
+    assert response.headers["ETag"] == plan_etag(fingerprint, TODAY, DEFAULT_STRATEGY, "json:json", revision)
+    assert response.headers["ETag"] != fresh
+
+
+def test_a_plan_stored_without_its_state_is_rebuilt_not_rolled(database, add_user):
+    user_id = add_user(["18:00 - 19:00"], [("Art", 12, 4, "MEDIUM")])
+    store_state(database, user_id)
+    # The user adds a subject and a request stores a fresh plan, which has no state
+    database["subjects"].insert_many([{
+        "_id": ObjectId(), "userId": user_id, "subjectName": "Math", "examDate": database["subjects"].find_one({"userId": user_id})["examDate"],
+        "examDifficulty": "MEDIUM", "topics": [{"name": f"Math {t}"} for t in range(4)],
+    }])
+    learning_times, subjects = load(database["users"], database["subjects"], user_id, YESTERDAY)
+    plan = build_plan(user_id, learning_times, subjects, YESTERDAY)
+    database["plans"].update_one(*plan_update(
+        user_id, plan_fingerprint(learning_times, subjects), plan, YESTERDAY, DEFAULT_STRATEGY
+    ), upsert=True)
+
+    assert rollover(database)["rebuilt"] == 1
+    rolled = database["plans"].find_one({"userId": user_id})["plan"]
+    topics = {entry["topic"] for entry in rolled["entries"]}
+    assert topics == {f"{name} {t}" for name in ("Art", "Math") for t in range(4)}
@@ -0,0 +1,68 @@
+import asyncio
+
+import pytest
+
+from app.singleflight import SingleFlight
+
+
+def counted(calls, result=None, error=None):
+    async def fn():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        if error is not None:
+            raise error
+        return result
+    return fn
+
+
+def test_concurrent_callers_share_one_run():
+    flight, calls = SingleFlight("test"), []
+
+    async def main():
+        results = await asyncio.gather(*(flight.do("k", counted(calls, {"plan": 1})) for _ in range(5)))
+        assert flight.in_flight() == 0
+        await flight.do("k", counted(calls))
+        return results
+
+    results = asyncio.run(main())
+    assert len(calls) == 2  # the later call ran again instead of reusing a finished result
+    assert all(result is results[0] for result in results)
+
+
+def test_different_keys_run_separately():
+    flight, calls = SingleFlight("test"), []
+
+    async def main():
+        await asyncio.gather(flight.do("a", counted(calls)), flight.do("b", counted(calls)))
+
+    asyncio.run(main())
+    assert len(calls) == 2
+
+
+def test_every_waiter_gets_the_exception():
+    flight, calls = SingleFlight("test"), []
+
+    async def main():
+        return await asyncio.gather(
+            *(flight.do("k", counted(calls, error=ValueError("bad input"))) for _ in range(3)), return_exceptions=True
+        )
+
+    results = asyncio.run(main())
+    assert len(calls) == 1
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+def test_a_caller_going_away_does_not_cancel_the_others():
+    flight, calls = SingleFlight("test"), []
+
+    async def main():
+        leader = asyncio.ensure_future(flight.do("k", counted(calls, "plan")))
+        follower = asyncio.ensure_future(flight.do("k", counted(calls)))
+        await asyncio.sleep(0)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower
+
+    assert asyncio.run(main()) == "plan"
+    assert len(calls) == 1
@@ -0,0 +1,48 @@
+import asyncio
+import threading
+from datetime import date
+
+from app import planner
+from app.cache import plan_fingerprint
+from app.gemini import plan_from_store_async
+from app.generate_plan_logic import generate_user_plan
+from app.planner import load
+from app.render import render_text
+
+
+def plan_thread(monkeypatch, database, user_id, strategy):
+    """The thread the strategy's allocator ran on when planned through plan_from_store_async."""
+    threads = []
+    allocator = planner.STRATEGIES[strategy]
+
+    def recording(calendar, subjects):
+        threads.append(threading.current_thread())
+        return allocator(calendar, subjects)
+
+    monkeypatch.setitem(planner.STRATEGIES, strategy, recording)
+    today = date.today()
+    inputs = load(database["users"], database["subjects"], user_id, today)
+    plan = asyncio.run(plan_from_store_async(None, user_id, inputs, today, plan_fingerprint(*inputs), strategy=strategy))
+    assert plan["entries"]
+    return threads[0]
+
+
+def test_optimal_is_solved_off_the_event_loop(monkeypatch, database, add_user):
+    user_id = add_user(["18:00 - 19:00"], [("Math", 4, 3, "MEDIUM")])
+    assert "optimal" in planner.BLOCKING_STRATEGIES
+    assert plan_thread(monkeypatch, database, user_id, "optimal") is not threading.current_thread()
+
+
+def test_edf_is_planned_inline(monkeypatch, database, add_user):
+    user_id = add_user(["18:00 - 19:00"], [("Math", 4, 3, "MEDIUM")])
+    assert plan_thread(monkeypatch, database, user_id, "edf") is threading.current_thread()
+
+
+def test_legacy_entry_point_keeps_the_urgent_even_split(database, add_user):
+    # Both exams are the day after tomorrow and only one fits in tomorrow's slot
+    user_id = add_user(["18:00 - 19:00"], [("Math", 2, 1, "EASY"), ("Art", 2, 1, "EASY")])
+    today = date.today()
+    inputs = load(database["users"], database["subjects"], user_id, today)
+    legacy = generate_user_plan(database["users"], database["subjects"], str(user_id))
+    assert legacy["study_plan"] == render_text(planner.build_plan(user_id, *inputs, today, "urgent-first"))
+    assert legacy["study_plan"] != render_text(planner.build_plan(user_id, *inputs, today, "greedy"))
@@ -0,0 +1,23 @@
+import json
+
+
+def test_malformed_slot_is_a_400_before_streaming(client, add_user):
+    user_id = add_user(["8am - 10am"], [("Math", 10, 3, "EASY")])
+
+    assert client.get("/generate-user-plan", params={"userId": str(user_id)}).status_code == 400
+    response = client.get("/generate-user-plan/stream", params={"userId": str(user_id)})
+    assert response.status_code == 400
+    assert "8am" in response.json()["detail"]
+
+
+def test_stream_matches_the_plan(client, add_user):
+    user_id = add_user(["18:00 - 19:00"], [("Math", 10, 3, "EASY"), ("Art", 4, 2, "MEDIUM")])
+
+    response = client.get("/generate-user-plan/stream", params={"userId": str(user_id)})
+    assert response.status_code == 200
+    blocks = [json.loads(line) for line in response.text.splitlines()]
+    assert blocks[0]["type"] == "header"
+    streamed = [entry for block in blocks[1:] for entry in block["entries"]]
+
+    plan = client.get("/generate-user-plan", params={"userId": str(user_id)}).json()
+    assert sorted(map(json.dumps, streamed)) == sorted(map(json.dumps, plan["entries"]))
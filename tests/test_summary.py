@@ -0,0 +1,88 @@
+import asyncio
+
+import pytest
+
+from app.gemini import generate_user_plan_with_gemini
+from app.summary import CircuitBreaker, StubBackend, SummaryService
+
+
+class FailingBackend:
+    model = "failing"
+
+    def __init__(self):
+        self.calls = 0
+
+    async def summarize(self, prompt: str) -> str:
+        self.calls += 1
+        raise RuntimeError("model unavailable")
+
+
+@pytest.fixture
+def plans(database, add_user):
+    """Three plans with different prompts."""
+    user_ids = [
+        add_user(["18:00 - 19:00"], [("Math", 10, 3, "EASY")]),
+        add_user(["07:00 - 08:00"], [("Art", 5, 2, "EASY")]),
+        add_user(["20:00 - 21:00"], [("Physics", 3, 4, "HARD")]),
+    ]
+    return [generate_user_plan_with_gemini(database["users"], database["subjects"], str(user_id)) for user_id in user_ids]
+
+
+def run(service, plans):
+    """Submits the plans, waits for every job and returns the submit and final statuses."""
+    async def main():
+        service.start()
+        submitted = [service.submit(plan) for plan in plans]
+        await service._queue.join()
+        await service.stop()
+        return submitted, [service.status(status["id"]) for status in submitted]
+
+    return asyncio.run(main())
+
+
+def test_identical_plans_share_one_model_call(plans):
+    backend = StubBackend()
+    submitted, final = run(SummaryService(backend, workers=2), [plans[0], plans[0], plans[1]])
+    assert submitted[0] == submitted[1] == {"id": submitted[0]["id"], "status": "pending"}
+    assert backend.calls == 2
+    assert all(status["status"] == "done" and status["summary"] for status in final)
+
+
+def test_slow_calls_time_out(plans):
+    _, final = run(SummaryService(StubBackend(delay=1.0), timeout=0.01), plans[:1])
+    assert final == [{"id": final[0]["id"], "status": "failed", "error": "Summary timed out."}]
+
+
+def test_full_queue_turns_summaries_away(plans):
+    service = SummaryService(StubBackend(), workers=0, queue_size=1)
+
+    async def main():
+        service.start()
+        return [service.submit(plan)["status"] for plan in plans[:2]]
+
+    assert asyncio.run(main()) == ["pending", "unavailable"]
+
+
+def test_open_breaker_stops_calling_the_backend(plans):
+    backend = FailingBackend()
+    service = SummaryService(backend, workers=1, breaker=CircuitBreaker(threshold=2, reset_after=60))
+    _, final = run(service, plans)
+    assert backend.calls == 2
+    assert [status["error"] for status in final] == ["Summary backend error."] * 2 + ["Summary backend unavailable."]
+
+
+def test_breaker_lets_one_trial_call_through_after_its_pause(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr("app.summary.time.monotonic", lambda: now[0])
+    breaker = CircuitBreaker(threshold=1, reset_after=30)
+    breaker.record_failure()
+    assert not breaker.allow()
+    now[0] += 30
+    assert breaker.allow() and not breaker.allow()  # one trial, then open until it reports
+    breaker.record_failure()
+    now[0] += 29
+    assert breaker.state == "open"
+    now[0] += 1
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.allow()